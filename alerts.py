@@ -0,0 +1,290 @@
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# 가격 알림 엔진
+# 사용자 알림(종목이 가격을 위/아래로 돌파, 30일 예측 변동률이 음수로 전환)을 (종류, 종목, 기준가) 순으로
+# 정렬한 배열에 저장하고 (종류, 종목)별 시작 위치(ptr)를 함께 둡니다.
+# 가격이 갱신되면 종목마다 직전 가격과 새 가격 사이의 기준가 구간을 searchsorted 두 번으로 찾아
+# 그 구간의 알림만 발생시키므로, 알림 수와 무관하게 바뀐 종목 수만큼만 계산합니다 (사용자 반복문 없음).
+# 발생한 알림은 한 번만 울리고(비활성화), 로컬 큐 파일(JSON lines)에 추가합니다.
+
+ALERT_KINDS = ('above', 'below', 'forecast_negative')  # 상향 돌파, 하향 돌파, 예측 하락 전환
+ALERT_LABELS = {'above': '상향 돌파', 'below': '하향 돌파', 'forecast_negative': '예측 하락 전환'}
+ALERTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.alerts')
+COMPACT_RATIO = 0.5  # 비활성 알림이 절반을 넘으면 배열에서 제거
+
+_ARRAYS = ('alert_id', 'user', 'ticker', 'kind', 'threshold', 'active')
+
+
+def new_alert_book():
+    """빈 알림 장부"""
+    return {
+        'users': [],
+        'user_index': {},
+        'tickers': [],
+        'ticker_index': {},
+        'next_id': 0,
+        'evaluated_key': None,  # 마지막으로 평가한 스냅샷 키 (같은 스냅샷을 두 번 평가하지 않음)
+        'alert_id': np.zeros(0, dtype=np.int64),
+        'user': np.zeros(0, dtype=np.int64),
+        'ticker': np.zeros(0, dtype=np.int64),
+        'kind': np.zeros(0, dtype=np.int64),
+        'threshold': np.zeros(0, dtype=np.float64),  # 원화 기준가 (예측 하락 전환은 0)
+        'active': np.zeros(0, dtype=bool),
+        'ptr': np.zeros((len(ALERT_KINDS), 1), dtype=np.int64),
+        # 종목별 직전 평가 상태 (처음 보는 종목은 NaN - 다음 갱신부터 비교)
+        'last_price': np.zeros(0, dtype=np.float64),
+        'last_change': np.zeros(0, dtype=np.float64),
+    }
+
+
+def _index_of(book, names, kind):
+    """사용자/종목 이름을 정수 위치로 변환 (처음 보는 이름은 장부에 추가)"""
+    index, items = book[f'{kind}_index'], book[f'{kind}s']
+    codes, uniques = pd.factorize(pd.Series(names, dtype=object).astype(str))
+    for name in uniques:
+        if name not in index:
+            index[name] = len(items)
+            items.append(name)
+    return np.array([index[name] for name in uniques], dtype=np.int64)[codes]
+
+
+def _reindex(book):
+    """알림을 (종류, 종목, 기준가) 순으로 정렬하고 (종류, 종목)별 시작 위치 갱신"""
+    order = np.lexsort((book['threshold'], book['ticker'], book['kind']))
+    for key in _ARRAYS:
+        book[key] = book[key][order]
+    n_tickers = len(book['tickers'])
+    segment = book['kind'] * n_tickers + book['ticker']
+    bounds = np.searchsorted(segment, np.arange(len(ALERT_KINDS) * n_tickers + 1))
+    # ptr[k, t]:ptr[k, t + 1]이 (종류 k, 종목 t) 구간
+    book['ptr'] = bounds[np.arange(len(ALERT_KINDS))[:, None] * n_tickers + np.arange(n_tickers + 1)]
+
+
+def add_alerts(book, users, tickers, kinds, thresholds=None):
+    """알림 일괄 등록 (kinds: ALERT_KINDS 이름, thresholds: 원화 기준가 - 예측 하락 전환은 무시)
+
+    반환값: 새 알림 번호 배열
+    """
+    kinds = np.array([ALERT_KINDS.index(k) for k in np.atleast_1d(kinds)], dtype=np.int64)
+    user_pos = _index_of(book, np.atleast_1d(users), 'user')
+    ticker_pos = _index_of(book, np.atleast_1d(tickers), 'ticker')
+    n = len(ticker_pos)
+    kinds = np.broadcast_to(kinds, (n,))
+    if thresholds is None:
+        thresholds = np.zeros(n)
+    thresholds = np.broadcast_to(np.asarray(thresholds, dtype=np.float64), (n,))
+    thresholds = np.where(kinds == ALERT_KINDS.index('forecast_negative'), 0.0, thresholds)
+    if np.isnan(thresholds).any():
+        raise ValueError("가격 알림에는 기준가가 필요합니다")
+
+    added = len(book['tickers']) - len(book['last_price'])
+    book['last_price'] = np.concatenate([book['last_price'], np.full(added, np.nan)])
+    book['last_change'] = np.concatenate([book['last_change'], np.full(added, np.nan)])
+
+    ids = book['next_id'] + np.arange(n)
+    book['next_id'] += n
+    new = {'alert_id': ids, 'user': user_pos, 'ticker': ticker_pos, 'kind': kinds,
+           'threshold': thresholds, 'active': np.ones(n, dtype=bool)}
+    for key in _ARRAYS:
+        book[key] = np.concatenate([book[key], new[key]])
+    _reindex(book)
+    return ids
+
+
+def cancel_alerts(book, alert_ids):
+    """알림 취소 (비활성화)"""
+    book['active'] &= ~np.isin(book['alert_id'], alert_ids)
+    _compact(book)
+
+
+def _compact(book):
+    """비활성 알림이 많아지면 배열에서 제거"""
+    if len(book['active']) > 0 and (~book['active']).mean() > COMPACT_RATIO:
+        keep = book['active']
+        for key in _ARRAYS:
+            book[key] = book[key][keep]
+        _reindex(book)
+
+
+def _segment_rows(starts, stops):
+    """여러 [start, stop) 구간의 행 위치를 하나의 배열로"""
+    lengths = np.maximum(stops - starts, 0)
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return np.arange(lengths.sum()) + offsets
+
+
+def _segment_searchsorted(values, starts, stops, targets, right):
+    """정렬된 구간 [starts, stops)마다 targets의 삽입 위치를 동시에 이분 탐색
+
+    right가 True인 구간은 searchsorted(side='right'), 아니면 side='left'와 같은 위치
+    """
+    lo, hi = starts.copy(), stops.copy()
+    last = max(len(values) - 1, 0)
+    while True:
+        searching = lo < hi
+        if not searching.any():
+            return lo
+        mid = (lo + hi) // 2
+        value = values[np.minimum(mid, last)] if len(values) > 0 else np.zeros(len(mid))
+        go_right = searching & np.where(right, value <= targets, value < targets)
+        lo = np.where(go_right, mid + 1, lo)
+        hi = np.where(searching & ~go_right, mid, hi)
+
+
+def evaluate_alerts(book, tickers, prices, change_pct=None):
+    """가격 갱신 시 모든 알림 평가 (가격/예측이 바뀐 종목의 기준가 구간만 조회)
+
+    tickers/prices/change_pct: 갱신된 종목의 티커, 원화 가격, 30일 예측 변동률(%)
+    - 상향 돌파: 직전 가격 < 기준가 ≤ 새 가격
+    - 하향 돌파: 새 가격 ≤ 기준가 < 직전 가격
+    - 예측 하락 전환: 직전 예측 ≥ 0 이고 새 예측 < 0
+    반환값 (dict): 발생한 알림의 alert_id, user, ticker, kind, threshold, price 배열
+    """
+    known = np.array([book['ticker_index'].get(str(t), -1) for t in tickers], dtype=np.int64)
+    prices = np.asarray(prices, dtype=np.float64)
+    in_book = known >= 0
+    positions = known[in_book]
+    new_price = np.full(len(book['tickers']), np.nan)
+    new_price[positions] = prices[in_book]
+    new_change = np.full(len(book['tickers']), np.nan)
+    if change_pct is not None:
+        new_change[positions] = np.asarray(change_pct, dtype=np.float64)[in_book]
+
+    last_price, last_change = book['last_price'], book['last_change']
+    ptr, threshold = book['ptr'], book['threshold']
+    rows = []
+
+    # 가격 돌파: 가격이 움직인 종목의 (종류, 종목) 구간에서 [직전, 새 가격] 기준가 범위를 이분 탐색
+    moved = np.flatnonzero(np.isfinite(last_price) & np.isfinite(new_price) & (new_price != last_price))
+    if len(moved) > 0:
+        previous, current = last_price[moved], new_price[moved]
+        rising = current > previous
+        kind = np.where(rising, ALERT_KINDS.index('above'), ALERT_KINDS.index('below'))
+        starts, stops = ptr[kind, moved], ptr[kind, moved + 1]
+        low, high = np.minimum(previous, current), np.maximum(previous, current)
+        # 상향: 직전 < 기준가 ≤ 새 가격 (오른쪽 경계 포함), 하향: 새 가격 ≤ 기준가 < 직전 (왼쪽 경계 포함)
+        lo = _segment_searchsorted(threshold, starts, stops, low, right=rising)
+        hi = _segment_searchsorted(threshold, starts, stops, high, right=rising)
+        rows.append(_segment_rows(lo, hi))
+
+    # 예측 하락 전환: 전환된 종목의 구간 전체
+    flipped = np.flatnonzero((last_change >= 0) & (new_change < 0))
+    if len(flipped) > 0:
+        kind = ALERT_KINDS.index('forecast_negative')
+        rows.append(_segment_rows(ptr[kind, flipped], ptr[kind, flipped + 1]))
+
+    fired = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+    fired = fired[book['active'][fired]]
+
+    result = {
+        'alert_id': book['alert_id'][fired],
+        'user': book['user'][fired],
+        'ticker': book['ticker'][fired],
+        'kind': book['kind'][fired],
+        'threshold': book['threshold'][fired],
+        'price': new_price[book['ticker'][fired]],
+    }
+
+    # 상태 갱신 (값이 없는 종목은 직전 값 유지), 발생한 알림은 비활성화
+    book['last_price'] = np.where(np.isfinite(new_price), new_price, last_price)
+    book['last_change'] = np.where(np.isfinite(new_change), new_change, last_change)
+    book['active'][fired] = False
+    _compact(book)
+    return result
+
+
+def fired_records(book, fired, timestamp=None):
+    """발생한 알림을 JSON으로 저장할 수 있는 dict 목록으로 변환"""
+    timestamp = (timestamp or datetime.now()).isoformat(timespec='seconds')
+    users = np.asarray(book['users'], dtype=object)
+    tickers = np.asarray(book['tickers'], dtype=object)
+    return [
+        {
+            'alert_id': int(alert_id),
+            'user': users[user],
+            'ticker': tickers[ticker],
+            'kind': ALERT_KINDS[kind],
+            'threshold': float(threshold),
+            'price': float(price),
+            'time': timestamp,
+        }
+        for alert_id, user, ticker, kind, threshold, price in zip(
+            fired['alert_id'], fired['user'], fired['ticker'], fired['kind'], fired['threshold'], fired['price'])
+    ]
+
+
+def emit_alerts(records, root=ALERTS_DIR):
+    """발생한 알림을 로컬 큐 파일(fired.jsonl)에 추가"""
+    if not records:
+        return
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, 'fired.jsonl'), 'a', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def read_fired_alerts(user=None, root=ALERTS_DIR, limit=50):
+    """큐 파일에서 최근 발생 알림 읽기 (user가 주어지면 해당 사용자만)"""
+    path = os.path.join(root, 'fired.jsonl')
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if user is not None:
+        records = [r for r in records if r['user'] == str(user)]
+    return records[-limit:][::-1]
+
+
+def user_alerts(book, user):
+    """한 사용자의 활성 알림 표"""
+    u = book['user_index'].get(str(user))
+    rows = np.flatnonzero(book['active'] & (book['user'] == u)) if u is not None else np.zeros(0, dtype=np.int64)
+    return pd.DataFrame({
+        '알림번호': book['alert_id'][rows],
+        '티커': np.asarray(book['tickers'], dtype=object)[book['ticker'][rows]],
+        '조건': [ALERT_LABELS[ALERT_KINDS[k]] for k in book['kind'][rows]],
+        '기준가': book['threshold'][rows],
+    }).sort_values('알림번호').reset_index(drop=True)
+
+
+def _paths(root):
+    return os.path.join(root, 'alerts.npz'), os.path.join(root, 'alerts.json')
+
+
+def save_alert_book(book, root=ALERTS_DIR):
+    """알림 장부를 디스크에 저장 (임시 파일에 쓴 뒤 교체)"""
+    os.makedirs(root, exist_ok=True)
+    arrays_path, meta_path = _paths(root)
+    tmp_arrays = f"{arrays_path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_arrays, **{key: book[key] for key in _ARRAYS + ('last_price', 'last_change')})
+    os.replace(tmp_arrays, arrays_path)
+
+    tmp_meta = f"{meta_path}.{os.getpid()}.tmp"
+    with open(tmp_meta, 'w', encoding='utf-8') as f:
+        json.dump({'users': book['users'], 'tickers': book['tickers'], 'next_id': book['next_id'],
+                   'evaluated_key': book['evaluated_key']}, f, ensure_ascii=False)
+    os.replace(tmp_meta, meta_path)
+
+
+def load_alert_book(root=ALERTS_DIR):
+    """저장된 알림 장부 읽기 (없으면 빈 장부)"""
+    arrays_path, meta_path = _paths(root)
+    if not (os.path.exists(arrays_path) and os.path.exists(meta_path)):
+        return new_alert_book()
+    with open(meta_path, encoding='utf-8') as f:
+        meta = json.load(f)
+    book = new_alert_book()
+    book['users'], book['tickers'], book['next_id'] = meta['users'], meta['tickers'], meta['next_id']
+    book['evaluated_key'] = meta.get('evaluated_key')
+    book['user_index'] = {user: i for i, user in enumerate(meta['users'])}
+    book['ticker_index'] = {ticker: i for i, ticker in enumerate(meta['tickers'])}
+    with np.load(arrays_path) as arrays:
+        for key in arrays.files:
+            book[key] = arrays[key]
+    _reindex(book)
+    return book
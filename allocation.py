@@ -0,0 +1,174 @@
+import numpy as np
+
+# 정수 주식 수 배분 엔진
+# 후보 종목 배열(가격, 점수, 분산 그룹, 국가)을 받아 예산 안에서 점수 가중 배분을 최대화하는
+# 정수 주식 수를 계산합니다. 1) 다양성 보너스로 종목 선정 → 2) 목표 비중대로 내림 배분
+# → 3) 남은 예산을 한 주씩 가장 부족한 종목에 채우는 greedy 보정 순서로 동작합니다.
+# allocate_portfolio_batch는 같은 과정을 여러 프로필(예산)에 대해 행 단위로 동시에 계산합니다.
+
+
+def _label_codes(labels, shape):
+    """라벨 배열을 정수 코드로 변환하고 (프로필, 후보) 모양으로 확장 (이미 정수면 그대로 사용)"""
+    labels = np.asarray(labels)
+    if labels.dtype.kind not in 'iu':
+        labels = np.unique(labels.ravel(), return_inverse=True)[1].reshape(labels.shape)
+    return np.broadcast_to(labels, shape)
+
+
+def _first_occurrence_batch(codes, valid):
+    """행(프로필)마다 각 라벨이 유효 후보 중 처음 등장하는 위치면 True"""
+    n = codes.shape[1]
+    earlier = np.tri(n, n, -1, dtype=bool)  # earlier[k, j]: j < k
+    same = (codes[:, :, None] == codes[:, None, :]) & valid[:, None, :] & earlier
+    return valid & ~same.any(axis=2)
+
+
+def allocate_portfolio_batch(prices, scores, budgets, groups, countries, revenue_scores=None, valid=None,
+                             target_stocks=10, max_stocks=12, max_weight=0.2,
+                             group_bonus=0.8, country_bonus=0.5, weight_fn=None, max_revenue=None):
+    """여러 프로필(예산)의 정수 주식 수 배분을 한 번에 계산 (allocate_portfolio의 벡터화 버전)
+
+    prices/scores/groups/countries/revenue_scores: (프로필, 후보) 또는 모든 프로필 공통 (후보,) 배열.
+        각 행은 프로필별 점수 순으로 정렬된 후보 종목
+    budgets: 프로필별 투자 금액 (프로필,)
+    valid: 행마다 실제 후보인 위치 (후보 수가 프로필마다 다를 때 뒤쪽을 False로 채움)
+    weight_fn: (프로필 번호, 선정된 후보 위치 배열)을 받아 목표 비중을 돌려주는 함수
+    max_revenue: 프로필별 수익성 점수 최댓값 - 후보가 상위 일부만 주어질 때 전체 후보 기준으로 비중을 맞추기 위해 사용
+        (없으면 valid 후보 중 최댓값)
+
+    반환값 (dict): 선택 종목마다 (프로필, max_stocks) 배열 - positions(후보 위치, 미선택은 -1),
+    shares, amounts, diversity_bonus, final_score와 프로필별 leftover
+    """
+    budgets = np.atleast_1d(np.asarray(budgets, dtype=np.float64))
+    n_profiles = len(budgets)
+    n_candidates = np.shape(prices)[-1]
+    shape = (n_profiles, n_candidates)
+    prices = np.broadcast_to(np.asarray(prices, dtype=np.float64), shape)
+    scores = np.broadcast_to(np.asarray(scores, dtype=np.float64), shape)
+    group_codes = _label_codes(groups, shape)
+    country_codes = _label_codes(countries, shape)
+    if revenue_scores is None:
+        revenue = np.zeros(shape)
+    else:
+        revenue = np.broadcast_to(np.clip(np.asarray(revenue_scores, dtype=np.float64), 0, None), shape)
+    valid = np.ones(shape, dtype=bool) if valid is None else np.broadcast_to(np.asarray(valid, dtype=bool), shape)
+
+    # 종목당 최대 투자 금액 (종목 수가 적어도 예산을 다 쓸 수 있도록 1/max_stocks 이상)
+    cap = budgets * max(max_weight, 1.0 / max_stocks)
+
+    # 1. 후보 풀: 상한 안에서 1주 이상 살 수 있는 종목을 점수 순으로 target_stocks * 2개
+    pool_size = target_stocks * 2
+    affordable = valid & (prices > 0) & (prices <= cap[:, None]) & (budgets[:, None] > 0)
+    rank = np.cumsum(affordable, axis=1)
+    rows, cols = np.nonzero(affordable & (rank <= pool_size))
+    pool = np.full((n_profiles, pool_size), -1, dtype=np.int64)
+    pool[rows, rank[rows, cols] - 1] = cols
+    in_pool = pool >= 0
+    pool_safe = np.where(in_pool, pool, 0)
+
+    def take(values, index):
+        return np.take_along_axis(values, index, axis=1)
+
+    # 다양성 보너스: 풀 안에서 그룹/국가가 처음 등장하는 종목에 가산
+    bonus = (group_bonus * _first_occurrence_batch(take(group_codes, pool_safe), in_pool)
+             + country_bonus * _first_occurrence_batch(take(country_codes, pool_safe), in_pool))
+    final_score = np.where(in_pool, take(scores, pool_safe) + bonus, -np.inf)
+    order = np.argsort(-final_score, axis=1, kind='stable')[:, :max_stocks]
+    picked = take(in_pool, order)
+    picks = np.where(picked, take(pool, order), -1)
+    picks_safe = np.where(picked, picks, 0)
+    bonus, final_score = take(bonus, order), take(final_score, order)
+    price = np.where(picked, take(prices, picks_safe), np.inf)
+
+    # 2. 목표 비중: 균등 60% + 수익성 점수 비례 40% (또는 weight_fn), 종목당 상한 적용 후 내림
+    if weight_fn is not None:
+        weight = np.zeros(picks.shape)
+        for p in np.flatnonzero(picked.any(axis=1)):
+            weight[p, picked[p]] = np.clip(np.asarray(weight_fn(p, picks[p, picked[p]]), dtype=np.float64), 0, None)
+    else:
+        if max_revenue is None:
+            max_revenue = np.where(valid, revenue, 0.0).max(axis=1, keepdims=True)
+        else:
+            max_revenue = np.clip(np.asarray(max_revenue, dtype=np.float64), 0, None).reshape(-1, 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = np.where(max_revenue > 0, take(revenue, picks_safe) / max_revenue, 0.0)
+        weight = 0.6 + 0.4 * ratio
+    weight = np.where(picked, weight, 0.0)
+    no_weight = weight.sum(axis=1) <= 0
+    weight[no_weight] = picked[no_weight].astype(np.float64)
+    weight_sum = np.maximum(weight.sum(axis=1, keepdims=True), 1e-300)
+
+    target = np.minimum(budgets[:, None] * weight / weight_sum, cap[:, None])
+    shares = np.floor(target / price).astype(np.int64)
+    max_shares = np.where(picked, np.floor(cap[:, None] / price), 0).astype(np.int64)
+    amounts = shares * np.where(picked, price, 0.0)
+    leftover = np.where(picked.any(axis=1), budgets - amounts.sum(axis=1), np.maximum(budgets, 0))
+
+    # 3. 보정: 남은 예산으로 목표 대비 가장 부족한 종목을 한 주씩 추가 매수 (모든 프로필 동시 진행)
+    active = np.flatnonzero(picked.any(axis=1))
+    while len(active) > 0:
+        eligible = (price[active] <= leftover[active, None]) & (shares[active] < max_shares[active]) & (weight[active] > 0)
+        has_eligible = eligible.any(axis=1)
+        active, eligible = active[has_eligible], eligible[has_eligible]
+        if len(active) == 0:
+            break
+        priority = np.where(eligible, weight[active] / (amounts[active] + price[active]), -np.inf)
+        i = priority.argmax(axis=1)
+        shares[active, i] += 1
+        amounts[active, i] += price[active, i]
+        leftover[active] -= price[active, i]
+
+    bought = shares > 0
+    return {
+        'positions': np.where(bought, picks, -1),
+        'shares': np.where(bought, shares, 0),
+        'amounts': np.where(bought, amounts, 0.0),
+        'diversity_bonus': np.where(bought, bonus, 0.0),
+        'final_score': np.where(bought, final_score, np.nan),
+        'leftover': leftover,
+    }
+
+
+def allocate_portfolio(prices, scores, budget, groups, countries, revenue_scores=None,
+                       target_stocks=10, max_stocks=12, max_weight=0.2,
+                       group_bonus=0.8, country_bonus=0.5, weight_fn=None, max_revenue=None):
+    """점수 가중 정수 주식 수 배분
+
+    prices/scores/groups/countries: 점수 순으로 정렬된 후보 종목 배열
+    groups: 분산 그룹 라벨 (수익률 상관 군집 또는 섹터) - 그룹별 첫 종목에 group_bonus 가산
+    revenue_scores: 수익성 점수 (높을수록 더 많은 금액 배분)
+    max_weight: 종목당 최대 투자 비중 (예산 대비)
+    weight_fn: 선정된 종목 위치 배열을 받아 목표 비중을 돌려주는 함수 (예: 공분산 기반 최적화).
+        없으면 균등 60% + 수익성 점수 비례 40%
+    max_revenue: 수익성 점수 비례 비중의 기준 최댓값 (없으면 후보 중 최댓값)
+
+    반환값 (dict): positions(선택 종목의 입력 위치), shares, amounts,
+    diversity_bonus, final_score, leftover(미투자 금액)
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    if len(prices) == 0 or budget <= 0:
+        return {
+            'positions': np.array([], dtype=np.int64),
+            'shares': np.array([], dtype=np.int64),
+            'amounts': np.array([], dtype=np.float64),
+            'diversity_bonus': np.array([], dtype=np.float64),
+            'final_score': np.array([], dtype=np.float64),
+            'leftover': float(max(budget, 0)),
+        }
+
+    batch = allocate_portfolio_batch(
+        prices, scores, [budget], groups, countries, revenue_scores,
+        target_stocks=target_stocks, max_stocks=max_stocks, max_weight=max_weight,
+        group_bonus=group_bonus, country_bonus=country_bonus,
+        weight_fn=None if weight_fn is None else (lambda p, picks: weight_fn(picks)),
+        max_revenue=None if max_revenue is None else [max_revenue]
+    )
+    bought = batch['positions'][0] >= 0
+    return {
+        'positions': batch['positions'][0][bought],
+        'shares': batch['shares'][0][bought],
+        'amounts': batch['amounts'][0][bought],
+        'diversity_bonus': batch['diversity_bonus'][0][bought],
+        'final_score': batch['final_score'][0][bought],
+        'leftover': float(batch['leftover'][0]),
+    }
@@ -0,0 +1,461 @@
+import asyncio
+import concurrent.futures
+import json
+import queue
+import random
+import re
+import threading
+from contextlib import closing
+
+from openai import AsyncOpenAI, APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+
+from analysis_cache import CACHE_PATH, request_key, open_cache, lookup, store
+
+# 종목 분석 (OpenAI) 비동기 계층 (Streamlit 비의존)
+# 백그라운드 스레드 하나에서 이벤트 루프를 계속 돌리고, API 키별 AsyncOpenAI 클라이언트 하나를 재사용합니다
+# (연결 풀/TLS 세션 재사용). 추천 종목 전체의 분석을 동시에 보내되 세마포어로 동시 요청 수를 제한하고,
+# 속도 제한(429)/일시 오류는 Retry-After 또는 지수 백오프 + 지터로 다시 시도합니다.
+# 결과는 끝나는 순서대로 호출한 쪽(Streamlit 스크립트 스레드)에 돌려주므로 화면을 바로 채울 수 있습니다.
+# 같은 요청(프롬프트/모델/파라미터)의 성공한 분석은 analysis_cache 디스크 캐시에서 API 호출 없이 바로 돌려줍니다.
+# 종목 하나의 상세 분석은 스트리밍으로 받아, 도착한 텍스트를 그때그때 '추천 이유'/'주의해야 할 점'으로 나눠 돌려줍니다.
+# 묶음 모드(batched=True)는 여러 종목을 JSON 스키마 응답 요청 하나로 보내 공통 지시문을 한 번만 내고,
+# 응답을 티커별로 검증해 빠지거나 형식이 틀린 종목만 종목별 요청으로 다시 보냅니다.
+# 묶음 응답은 종목별 요청 키가 아니라 batch_key(묶음 지시문 + 종목 지표의 해시)로 캐시에 저장합니다.
+# 같은 지표의 분석이면 두 출처를 서로 대신 쓰도록 조회는 (종목별 키, 묶음 키) 순으로 찾고,
+# 묶음 키로 찾은 결과에는 batched=True를 붙여 어느 요청에서 만든 분석인지 표시합니다.
+
+MODEL = "gpt-4o-mini"  # 비용 효율적인 모델 사용
+MAX_TOKENS = 1000
+TEMPERATURE = 0.7
+MAX_CONCURRENCY = 5  # 동시에 보내는 분석 요청 수
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5  # 초 (시도마다 두 배, 최대 BACKOFF_MAX)
+BACKOFF_MAX = 8.0
+REQUEST_TIMEOUT = 60.0
+BATCH_SIZE = 10  # 묶음 요청 하나에 넣는 종목 수 (출력 MAX_TOKENS × 종목 수가 모델 출력 한도 16K 안)
+
+SYSTEM_PROMPT = "당신은 전문 증권 애널리스트입니다. 주식 투자 분석을 객관적이고 전문적으로 제공합니다."
+RETRYABLE_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+_lock = threading.Lock()
+_loop = None
+_clients = {}
+
+
+def stock_profile(row):
+    """추천 종목 표의 한 행 → 분석 프롬프트 입력"""
+    return {
+        'company_name': row['회사명'],
+        'ticker': row['티커'],
+        'country': row['국가'],
+        'sector': row['섹터'],
+        'per': row['PER'],
+        'dividend_rate': row['배당률(%)'],
+        'growth_rate': row['성장률(%)'],
+        'volatility': row['변동성'],
+        'news_sentiment': row['뉴스감성(1~5)'],
+    }
+
+
+def _profile_text(stock):
+    """프롬프트에 넣는 종목 지표 블록"""
+    return f"""회사명: {stock['company_name']}
+티커: {stock['ticker']}
+국가: {stock['country']}
+섹터: {stock['sector']}
+PER: {stock['per']}
+배당률: {stock['dividend_rate']}%
+성장률: {stock['growth_rate']}%
+변동성: {stock['volatility']}
+뉴스감성 점수: {stock['news_sentiment']}/5"""
+
+
+def analysis_prompt(stock):
+    """종목 하나의 분석 요청 프롬프트"""
+    return f"""
+다음 주식에 대한 투자 분석을 한국어로 작성해주세요:
+
+{_profile_text(stock)}
+
+다음 형식으로 답변해주세요:
+
+1. 추천 이유 (2-3문단):
+   - 이 종목을 추천하는 주요 이유를 설명해주세요.
+   - 재무 지표, 성장성, 시장 지위 등을 종합적으로 고려하여 작성해주세요.
+
+2. 주의해야 할 점 (2-3문단):
+   - 투자 시 주의해야 할 리스크 요인을 설명해주세요.
+   - 시장 환경, 경쟁 상황, 재무 리스크 등을 포함해주세요.
+
+답변은 한국어로 작성하고, 객관적이고 전문적인 톤으로 작성해주세요.
+"""
+
+
+def analysis_request(stock):
+    """종목 하나의 chat completion 요청 파라미터 (캐시 키의 입력)"""
+    return {
+        "model": MODEL,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": analysis_prompt(stock)}
+        ],
+        "max_tokens": MAX_TOKENS,
+        "temperature": TEMPERATURE,
+    }
+
+
+def batch_prompt(stocks):
+    """여러 종목의 분석을 한 번에 요청하는 프롬프트 (공통 지시는 한 번, 종목은 지표 블록만)"""
+    profiles = '\n\n'.join(f"[{i}]\n{_profile_text(stock)}" for i, stock in enumerate(stocks, start=1))
+    return f"""
+다음 {len(stocks)}개 주식 각각에 대한 투자 분석을 한국어로 작성해주세요.
+
+종목마다 다음 두 항목을 작성해주세요:
+- recommendation_reason (2-3문단): 이 종목을 추천하는 주요 이유. 재무 지표, 성장성, 시장 지위 등을 종합적으로 고려하여 작성해주세요.
+- caution_points (2-3문단): 투자 시 주의해야 할 리스크 요인. 시장 환경, 경쟁 상황, 재무 리스크 등을 포함해주세요.
+
+응답은 티커를 키로 하는 JSON 객체로 작성하고 모든 종목을 빠짐없이 포함해주세요.
+답변은 한국어로 작성하고, 객관적이고 전문적인 톤으로 작성해주세요.
+
+{profiles}
+"""
+
+
+def batch_request(stocks):
+    """묶음 분석 요청 파라미터 - 응답은 {티커: {recommendation_reason, caution_points}} 형식의 엄격한 JSON 스키마"""
+    entry = {
+        "type": "object",
+        "properties": {"recommendation_reason": {"type": "string"}, "caution_points": {"type": "string"}},
+        "required": ["recommendation_reason", "caution_points"],
+        "additionalProperties": False,
+    }
+    tickers = [str(stock['ticker']) for stock in stocks]
+    return {
+        "model": MODEL,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": batch_prompt(stocks)}
+        ],
+        "max_tokens": MAX_TOKENS * len(stocks),
+        "temperature": TEMPERATURE,
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "stock_analyses",
+                "strict": True,
+                "schema": {"type": "object", "properties": {ticker: entry for ticker in tickers},
+                           "required": tickers, "additionalProperties": False},
+            },
+        },
+    }
+
+
+def batch_key(stock):
+    """묶음 응답에서 나온 종목 하나의 캐시 키 (출처, 모델, 묶음 지시문 틀, 종목 지표, 파라미터의 해시)
+
+    묶음 요청 하나의 해시는 여러 종목이 공유하고 함께 묶인 종목에 따라 달라지므로, 종목별로 다시 찾을 수 있는
+    파생 키를 씁니다. 종목별 요청의 키(request_key(analysis_request(stock)))와는 겹치지 않습니다.
+    """
+    return request_key({
+        "source": "batch",
+        "model": MODEL,
+        "system": SYSTEM_PROMPT,
+        "instructions": batch_prompt([]),
+        "profile": _profile_text(stock),
+        "max_tokens": MAX_TOKENS,
+        "temperature": TEMPERATURE,
+    })
+
+
+def _cached_result(cached, keys):
+    """lookup 결과에서 (종목별 키, 묶음 키) 중 적중한 결과 (묶음 키면 batched=True), 없으면 None"""
+    key, batch = keys
+    if key in cached:
+        return dict(cached[key], articles=[], batched=False)
+    if batch in cached:
+        return dict(cached[batch], articles=[], batched=True)
+    return None
+
+
+def parse_batch(content, tickers):
+    """묶음 응답 → {티커: (추천 이유, 주의해야 할 점)} - JSON이 아니거나 두 항목이 빈 문자열이 아닌 종목은 제외"""
+    try:
+        data = json.loads(content or '')
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    parsed = {}
+    for ticker in tickers:
+        entry = data.get(ticker)
+        if not isinstance(entry, dict):
+            continue
+        reason, caution = entry.get('recommendation_reason'), entry.get('caution_points')
+        if isinstance(reason, str) and isinstance(caution, str) and reason.strip() and caution.strip():
+            parsed[ticker] = (reason.strip(), caution.strip())
+    return parsed
+
+
+# 섹션 제목 줄: "1. 추천 이유 (2-3문단):", "**주의해야 할 점**", "### ⚠️ 리스크 요인" 등 번호/마크다운/이모지와
+# 표현이 달라도 인식하고, 같은 줄에 본문이 이어지면 ("주의할 점: ...") 본문으로 남깁니다.
+# 이름 뒤에 괄호/콜론/강조 기호/줄 끝이 와야 제목으로 보므로 "리스크 요인으로는 ..." 같은 본문 줄은 제목이 아닙니다.
+# 목록 기호(-, *, •)로 시작하는 줄("- 리스크: 낮음")은 섹션 안의 항목이므로 제목이 아닙니다.
+_BULLET = re.compile(r'^\s*[-*•]\s')
+_MARKERS = r'[^\w\n]*(?:\d+\s*[.)]\s*)?[^\w\n]*'
+_REASON_NAMES = r'추천\s*(?:이유|근거|사유)|투자\s*포인트'
+_CAUTION_NAMES = r'주의\s*(?:해야\s*할|할)?\s*(?:점|사항)|유의\s*(?:해야\s*할|할)?\s*(?:점|사항)|(?:투자\s*)?(?:리스크|위험)(?:\s*요인)?'
+_HEADING = re.compile(
+    rf'^{_MARKERS}(?:(?P<reason>{_REASON_NAMES})|(?P<caution>{_CAUTION_NAMES}))(?=\s*(?:\(|[:：*_]|$))'
+    r'\s*(?:\([^)\n]*\)?)?\s*[*_]*\s*[:：]?\s*[*_]*\s*(?P<body>.*)$'
+)
+_HEADING_WORDS = ('추천이유', '추천근거', '추천사유', '투자포인트', '주의해야할점', '주의할점', '주의사항', '주의점',
+                  '유의사항', '유의할점', '리스크요인', '위험요인', '투자리스크요인', '투자위험요인')
+HEADING_MAX_CHARS = 40  # 이보다 긴 미완성 줄은 제목이 아니라고 보고 바로 표시
+
+
+def _maybe_heading(line):
+    """스트리밍 중 마지막 미완성 줄이 아직 섹션 제목이 될 수 있는지 (번호/기호나 제목 단어의 앞부분만 왔거나, 본문 없는 제목)"""
+    if len(line) > HEADING_MAX_CHARS or _BULLET.match(line):
+        return False
+    match = _HEADING.match(line)
+    if match:
+        return not match.group('body').strip()
+    core = re.sub(r'\s', '', re.sub(r'^[^\w\n]*\d*\s*[.)]?[^\w\n]*', '', line))
+    return any(word.startswith(core) for word in _HEADING_WORDS)
+
+
+def split_sections(text, partial=False):
+    """분석 응답 → (추천 이유, 주의해야 할 점)
+
+    제목 줄을 기준으로 나누며 첫 제목 앞의 글은 추천 이유로 봅니다. 목록 항목 줄은 제목으로 보지 않고,
+    주의해야 할 점 제목이 나온 뒤에는 추천 이유로 되돌아가지 않습니다.
+    partial=True는 스트리밍 중인 응답: 제목으로 이어질 수 있는 마지막 미완성 줄은 다음 조각까지 보류하고,
+    주의해야 할 점이 아직 없으면 빈 문자열을 돌려줍니다 (화면이 깜빡이거나 제목이 본문에 섞이지 않도록).
+    """
+    lines = text.split('\n')
+    if partial and _maybe_heading(lines[-1]):
+        lines = lines[:-1]
+    sections = {'reason': [], 'caution': []}
+    current = 'reason'
+    for line in lines:
+        match = None if _BULLET.match(line) else _HEADING.match(line)
+        if match and (match.group('caution') or current == 'reason'):
+            current = 'caution' if match.group('caution') else 'reason'
+            line = match.group('body')
+            if not line.strip():
+                continue
+        sections[current].append(line)
+    recommendation_reason = '\n'.join(sections['reason']).strip()
+    caution_points = '\n'.join(sections['caution']).strip()
+    if not caution_points and not partial:
+        caution_points = "분석 정보를 확인할 수 없습니다."
+    return recommendation_reason, caution_points
+
+
+def error_result(message, caution="분석 정보를 확인할 수 없습니다."):
+    """분석을 만들지 못했을 때의 결과 (available=False)"""
+    return {"recommendation_reason": message, "caution_points": caution, "articles": [],
+            "available": False, "tokens": 0, "cached": False}
+
+
+def _event_loop():
+    """분석 요청을 처리하는 백그라운드 이벤트 루프 (프로세스당 하나, 세션/재실행 간 공유)"""
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='openai-analysis', daemon=True).start()
+        return _loop
+
+
+def _client(api_key):
+    """API 키별 AsyncOpenAI 클라이언트 (연결 풀 재사용, 재시도는 이 모듈에서 직접 처리)"""
+    with _lock:
+        if api_key not in _clients:
+            _clients[api_key] = AsyncOpenAI(api_key=api_key, max_retries=0, timeout=REQUEST_TIMEOUT)
+        return _clients[api_key]
+
+
+def _retry_delay(error, attempt):
+    """다음 시도까지 기다릴 시간 - 서버가 Retry-After를 주면 따르고, 아니면 지수 백오프 상한 안에서 무작위 (full jitter)"""
+    response = getattr(error, 'response', None)
+    retry_after = response.headers.get('retry-after') if response is not None else None
+    try:
+        return min(float(retry_after), BACKOFF_MAX) + random.uniform(0, BACKOFF_BASE)
+    except (TypeError, ValueError):
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+async def _complete(client, semaphore, **request):
+    """chat completion 한 번 (동시 요청 수 제한 + 재시도, 대기 중에는 세마포어를 놓아 다른 요청이 진행)"""
+    for attempt in range(MAX_RETRIES + 1):
+        async with semaphore:
+            try:
+                return await client.chat.completions.create(**request)
+            except RETRYABLE_ERRORS as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                delay = _retry_delay(e, attempt)
+        await asyncio.sleep(delay)
+
+
+async def _analyze(client, semaphore, request):
+    """종목 하나의 분석 (오류는 결과 dict로 돌려줌)"""
+    try:
+        response = await _complete(client, semaphore, **request)
+        recommendation_reason, caution_points = split_sections(response.choices[0].message.content)
+        return {
+            "recommendation_reason": recommendation_reason,
+            "caution_points": caution_points,
+            "articles": [],  # 기사는 별도 함수로 처리
+            "available": True,
+            "tokens": response.usage.total_tokens if response.usage else 0,
+            "cached": False,
+        }
+    except Exception as e:
+        return error_result(f"분석 생성 중 오류가 발생했습니다: {str(e)}")
+
+
+async def _analyze_batch(client, semaphore, stocks):
+    """묶음 요청 하나 → {stocks 위치: 결과 dict} (검증을 통과한 종목만, 요청 실패면 빈 dict)
+
+    사용 토큰은 검증을 통과한 종목 수로 나눠 각 결과의 tokens에 배분합니다.
+    """
+    tickers = [str(stock['ticker']) for stock in stocks]
+    try:
+        response = await _complete(client, semaphore, **batch_request(stocks))
+    except Exception:
+        return {}
+    parsed = parse_batch(response.choices[0].message.content, tickers)
+    share = round((response.usage.total_tokens if response.usage else 0) / max(len(parsed), 1))
+    return {
+        i: {"recommendation_reason": parsed[ticker][0], "caution_points": parsed[ticker][1], "articles": [],
+            "available": True, "tokens": share, "cached": False, "batched": True}
+        for i, ticker in enumerate(tickers) if ticker in parsed
+    }
+
+
+async def _stream(client, request, chunks):
+    """스트리밍 요청 - 도착한 텍스트 조각을 chunks 큐에 넣고 사용 토큰 수를 반환 (끝나면 None을 넣음)
+
+    재시도는 응답이 시작되기 전(요청 단계)의 일시 오류에만 적용됩니다.
+    """
+    try:
+        stream = await _complete(client, asyncio.Semaphore(1), **request, stream=True,
+                                 stream_options={"include_usage": True})
+        tokens = 0
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                chunks.put(chunk.choices[0].delta.content)
+            if chunk.usage:
+                tokens = chunk.usage.total_tokens
+        return tokens
+    finally:
+        chunks.put(None)
+
+
+async def _semaphore(n):
+    return asyncio.Semaphore(n)
+
+
+def analyze_stocks(api_key, stocks, max_concurrency=MAX_CONCURRENCY, snapshot_key=None, cache_path=CACHE_PATH,
+                   batched=False):
+    """여러 종목의 분석을 동시에 요청하고 끝나는 순서대로 (stocks 위치, 결과) 생성
+
+    stocks: stock_profile 형식 dict 목록, snapshot_key: 현재 데이터 스냅샷 (캐시 만료 기준).
+    결과 dict: recommendation_reason, caution_points, articles, available(실제 분석 여부),
+    tokens(사용 토큰 수 - 캐시 적중이면 처음 만들 때 쓴 토큰 수), cached(캐시 적중 여부),
+    batched(묶음 응답에서 나온 결과만 True).
+    캐시에 있는 종목을 먼저 돌려주고, 나머지의 전체 시간은 가장 느린 요청 (+ 동시 수 제한) 수준입니다.
+    batched=True이면 나머지를 BATCH_SIZE개씩 묶어 요청하고, 묶음 응답에서 빠진 종목만 종목별로 다시 요청합니다.
+    묶음 결과는 batch_key로 저장하며, 캐시 조회는 방식과 관계없이 종목별 결과를 먼저, 없으면 묶음 결과를 씁니다.
+    """
+    requests = [analysis_request(stock) for stock in stocks]
+    keys = [(request_key(request), batch_key(stock)) for request, stock in zip(requests, stocks)]
+    with closing(open_cache(cache_path)) as cache:
+        cached = lookup(cache, keys, snapshot_key)
+        misses = []
+        for i, key in enumerate(keys):
+            result = _cached_result(cached, key)
+            if result is None:
+                misses.append(i)
+            else:
+                yield i, result
+        if not misses:
+            return
+
+        loop = _event_loop()
+        client = _client(api_key)
+        semaphore = asyncio.run_coroutine_threadsafe(_semaphore(max_concurrency), loop).result()
+        if batched:
+            batches = [misses[k:k + BATCH_SIZE] for k in range(0, len(misses), BATCH_SIZE)]
+            futures = {
+                asyncio.run_coroutine_threadsafe(_analyze_batch(client, semaphore, [stocks[i] for i in batch]), loop): batch
+                for batch in batches
+            }
+            done = set()
+            for future in concurrent.futures.as_completed(futures):
+                batch = futures[future]
+                for j, result in future.result().items():
+                    store(cache, keys[batch[j]][1], result, snapshot_key)
+                    done.add(batch[j])
+                    yield batch[j], result
+            misses = [i for i in misses if i not in done]
+
+        futures = {asyncio.run_coroutine_threadsafe(_analyze(client, semaphore, requests[i]), loop): i for i in misses}
+        for future in concurrent.futures.as_completed(futures):
+            i, result = futures[future], future.result()
+            if result['available']:
+                store(cache, keys[i][0], result, snapshot_key)
+            yield i, result
+
+
+def analyze_stock(api_key, stock, snapshot_key=None):
+    """종목 하나의 분석 (공유 클라이언트와 디스크 캐시 사용)"""
+    return next(analyze_stocks(api_key, [stock], snapshot_key=snapshot_key))[1]
+
+
+def stream_analysis(api_key, stock, snapshot_key=None, cache_path=CACHE_PATH):
+    """종목 하나의 분석을 스트리밍으로 받아 도착할 때마다 결과 dict를 생성 (마지막 dict가 최종 결과)
+
+    중간 결과는 지금까지 받은 텍스트를 split_sections(partial=True)로 나눈 recommendation_reason,
+    caution_points와 streaming=True만 담고, 최종 결과는 analyze_stocks와 같은 형식에 streaming=False입니다.
+    캐시에 있으면 (종목별 결과 우선, 없으면 묶음 결과) 최종 결과 하나만 바로 생성하고, 성공한 분석은 캐시에 저장합니다.
+    """
+    request = analysis_request(stock)
+    keys = (request_key(request), batch_key(stock))
+    with closing(open_cache(cache_path)) as cache:
+        cached = _cached_result(lookup(cache, [keys], snapshot_key), keys)
+        if cached is not None:
+            yield dict(cached, streaming=False)
+            return
+
+        chunks = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(_stream(_client(api_key), request, chunks), _event_loop())
+        try:
+            text = ''
+            for chunk in iter(chunks.get, None):
+                text += chunk
+                recommendation_reason, caution_points = split_sections(text, partial=True)
+                yield {"recommendation_reason": recommendation_reason, "caution_points": caution_points,
+                       "streaming": True}
+            tokens = future.result()
+        except Exception as e:
+            yield dict(error_result(f"분석 생성 중 오류가 발생했습니다: {str(e)}"), streaming=False)
+            return
+        finally:
+            # 화면이 중간에 다시 실행되어 소비가 멈추면 남은 응답은 받지 않음
+            future.cancel()
+
+        recommendation_reason, caution_points = split_sections(text)
+        result = {
+            "recommendation_reason": recommendation_reason,
+            "caution_points": caution_points,
+            "articles": [],
+            "available": True,
+            "tokens": tokens,
+            "cached": False,
+            "streaming": False,
+        }
+        store(cache, keys[0], result, snapshot_key)
+        yield result
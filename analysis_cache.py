@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+# 종목 분석 응답의 디스크 캐시 (Streamlit 비의존)
+# 키는 요청 내용(모델, 시스템/사용자 프롬프트, max_tokens, temperature)의 해시이므로 PER·배당률·성장률 등
+# 입력이 같은 종목은 세션/재실행/워커가 달라도 같은 분석을 다시 쓰고, 입력이 바뀌면 자연히 새 키가 됩니다.
+# 여러 요청이 같은 내용을 대신할 수 있으면 lookup에 대체 키 튜플을 넘겨 (예: 종목별 요청 키, 묶음 응답 키) 앞 키부터 찾습니다.
+# SQLite 파일 하나(WAL 모드)에 저장하므로 같은 서버의 여러 프로세스가 동시에 읽고 쓸 수 있습니다.
+# - 만료: 분석을 만든 데이터 스냅샷 안에서는 계속 유효하고, 스냅샷이 바뀐 뒤에는 만든 지 ANALYSIS_TTL이 지나면 만료
+# - 크기 제한: 전체 크기가 MAX_BYTES를 넘으면 가장 오래 쓰지 않은 항목부터 삭제 (LRU)
+# - 통계: 적중/실패 횟수와 적중으로 아낀 토큰 수를 함께 누적 (모든 세션 합계)
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.analysis_cache')
+CACHE_PATH = os.path.join(CACHE_DIR, 'analyses.sqlite3')
+ANALYSIS_TTL = 24 * 3600  # 초 (다른 스냅샷에서 재사용할 수 있는 기간)
+MAX_BYTES = 16 * 2 ** 20  # 저장할 분석 본문의 최대 합계 크기
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    key TEXT PRIMARY KEY,
+    snapshot_key TEXT,
+    payload TEXT NOT NULL,
+    tokens INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS analyses_last_used ON analyses (last_used);
+CREATE TABLE IF NOT EXISTS stats (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def request_key(request):
+    """chat completion 요청 dict → 캐시 키 (키 순서를 고정한 JSON의 sha256)"""
+    canonical = json.dumps(request, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def open_cache(path=CACHE_PATH):
+    """캐시 DB 연결 (없으면 생성) - 호출한 스레드에서만 사용하고 닫을 것"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _count(conn, **counters):
+    conn.executemany(
+        "INSERT INTO stats (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+        [(name, int(value)) for name, value in counters.items() if value]
+    )
+
+
+def lookup(conn, keys, snapshot_key=None, ttl=ANALYSIS_TTL):
+    """여러 항목을 한 번에 조회 → {적중한 키: 분석 결과 dict (cached=True)}
+
+    keys의 각 항목은 캐시 키 하나 또는 대체 키 튜플이며, 튜플은 앞 키부터 찾아 처음 있는 키 하나만 돌려줍니다.
+    같은 스냅샷에서 만든 항목이거나 만든 지 ttl초 이내인 항목만 돌려주며, 적중한 항목의 사용 시각과
+    적중/실패/아낀 토큰 통계(항목 단위)를 같은 트랜잭션에서 갱신합니다.
+    """
+    items = list(dict.fromkeys((key,) if isinstance(key, str) else tuple(key) for key in keys))
+    candidates = list(dict.fromkeys(key for item in items for key in item))
+    if not candidates:
+        return {}
+    now = time.time()
+    with conn:
+        rows = conn.execute(
+            f"SELECT key, payload, tokens FROM analyses WHERE key IN ({','.join('?' * len(candidates))}) "
+            "AND (snapshot_key = ? OR created_at >= ?)",
+            [*candidates, snapshot_key, now - ttl]
+        ).fetchall()
+        available = {key: (payload, tokens) for key, payload, tokens in rows}
+        found = {}
+        for item in items:
+            key = next((key for key in item if key in available), None)
+            if key is not None:
+                payload, tokens = available[key]
+                found[key] = dict(json.loads(payload), tokens=tokens, available=True, cached=True)
+        conn.executemany("UPDATE analyses SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+        _count(conn, hits=len(found), misses=len(items) - len(found),
+               tokens_saved=sum(result['tokens'] for result in found.values()))
+    return found
+
+
+def store(conn, key, result, snapshot_key=None, ttl=ANALYSIS_TTL, max_bytes=MAX_BYTES):
+    """성공한 분석 결과 저장 후 만료 항목 정리와 LRU 크기 제한 적용"""
+    payload = json.dumps({'recommendation_reason': result['recommendation_reason'],
+                          'caution_points': result['caution_points']}, ensure_ascii=False)
+    now = time.time()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO analyses (key, snapshot_key, payload, tokens, size, created_at, last_used) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, snapshot_key, payload, int(result.get('tokens', 0)), len(payload.encode('utf-8')), now, now)
+        )
+        # 어떤 스냅샷에서도 다시 쓸 수 없는 항목 (현재 스냅샷이 아니고 TTL이 지남)
+        conn.execute("DELETE FROM analyses WHERE created_at < ? AND snapshot_key IS NOT ?", (now - ttl, snapshot_key))
+        # 최근 사용 순 누적 크기가 상한을 넘는 항목 (가장 오래 쓰지 않은 쪽부터)
+        conn.execute(
+            "DELETE FROM analyses WHERE key IN (SELECT key FROM (SELECT key, SUM(size) OVER "
+            "(ORDER BY last_used DESC, key ROWS UNBOUNDED PRECEDING) AS total FROM analyses) WHERE total > ?)",
+            (max_bytes,)
+        )
+
+
+def cache_stats(path=CACHE_PATH):
+    """누적 캐시 통계 (dict): hits, misses, hit_rate, tokens_saved, entries, bytes - 캐시가 없으면 모두 0"""
+    stats = {'hits': 0, 'misses': 0, 'tokens_saved': 0, 'entries': 0, 'bytes': 0}
+    if os.path.exists(path):
+        with closing(open_cache(path)) as conn:
+            stats.update(conn.execute("SELECT name, value FROM stats").fetchall())
+            stats['entries'], stats['bytes'] = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM analyses").fetchone()
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+    return stats
@@ -4,16 +4,30 @@ import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import numpy as np
-import yfinance as yf
 from datetime import datetime, timedelta
+from functools import partial, wraps
 import os
-import requests
-from openai import OpenAI
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.preprocessing import StandardScaler
+import threading
+import time
+from feature_store import open_feature_store, feature_series
+from risk_model import covariance_subset, portfolio_volatility
+from rebalance import plan_rebalance, target_weight_vector
+from simulation import simulate_plan, DEFAULT_DEPOSIT_RATE, LONG_RUN_RETURN
+from screener import build_screen_index, screen
+from similarity import nearest_stocks
+from downsample import lttb_indices, compact_values, compact_dates, sparkline_lists
+from alerts import load_alert_book, save_alert_book, add_alerts, evaluate_alerts, fired_records, emit_alerts, read_fired_alerts, user_alerts, ALERT_LABELS
+from analysis import stock_profile, analyze_stocks, stream_analysis, error_result
+from analysis_cache import cache_stats
+from report import build_report, export_report, report_bytes
+from ledger import load_ledger, save_ledger, record_trades, mark_increment, price_bars, user_positions, user_summary
+from market_data import fetch_exchange_rate, fetch_fx_series, fetch_stock_price, load_universe, fetch_stock_history, fetch_price_panel
+from engine import build_snapshot, score_weights, composite_scores, split_balance, build_candidates, select_diversified_portfolio, efficient_frontier
 import warnings
 warnings.filterwarnings('ignore')
 
+run_started = time.perf_counter()
+
 # 페이지 설정
 st.set_page_config(
     page_title="주린이 전용 포트폴리오 추천 대시보드",
@@ -25,318 +39,129 @@ st.set_page_config(
 @st.cache_data(ttl=3600)  # 1시간마다 갱신
 def get_exchange_rate():
     """USD/KRW 환율을 가져오는 함수"""
-    try:
-        # USD/KRW 환율 가져오기
-        krw_ticker = yf.Ticker("KRW=X")
-        krw_data = krw_ticker.history(period="1d")
-        if len(krw_data) > 0:
-            exchange_rate = krw_data['Close'].iloc[-1]
-            return exchange_rate
-        else:
-            # 기본값 (약 1,300원)
-            return 1300.0
-    except:
-        # 에러 발생 시 기본값 반환
-        return 1300.0
+    return fetch_exchange_rate()
+
+# 환율 시계열 (USD/KRW) - 보유 종목 손익 평가용
+@st.cache_data(ttl=300)
+def get_fx_series(period="3mo"):
+    """USD/KRW 환율 일별 종가 시계열"""
+    return fetch_fx_series(period)
 
 # 실제 주가 가져오기 (yfinance 사용)
 @st.cache_data(ttl=300)  # 5분마다 갱신
 def get_real_stock_price(ticker, country):
     """실제 주가를 가져오는 함수 - yfinance 사용"""
-    try:
-        if country == '미국':
-            # 미국 주식은 yfinance 사용
-            stock = yf.Ticker(ticker)
-            hist = stock.history(period="1d")
-            if len(hist) > 0:
-                price_usd = hist['Close'].iloc[-1]
-                # USD를 원화로 환산
-                exchange_rate = get_exchange_rate()
-                price_krw = price_usd * exchange_rate
-                return price_krw
-            else:
-                return None
-        else:
-            # 한국 주식은 yfinance 사용 (.KS 추가)
-            try:
-                korean_ticker = f"{ticker}.KS"
-                stock = yf.Ticker(korean_ticker)
-                hist = stock.history(period="1d")
-                if len(hist) > 0:
-                    price_krw = hist['Close'].iloc[-1]
-                    return price_krw
-            except:
-                pass
-            
-            # .KS가 안 되면 티커만으로 시도
-            try:
-                stock = yf.Ticker(ticker)
-                hist = stock.history(period="1d")
-                if len(hist) > 0:
-                    price_krw = hist['Close'].iloc[-1]
-                    return price_krw
-            except:
-                pass
-            
-            return None
-    except Exception as e:
-        return None
+    return fetch_stock_price(ticker, country, get_exchange_rate())
 
 # 주식 데이터프레임 생성 (S&P 500 + KOSPI 200 주요 종목)
 @st.cache_data(ttl=300)  # 5분마다 갱신
 def get_stock_data():
     """주식 데이터를 반환하는 함수 - S&P 500과 KOSPI 200의 주요 종목 포함"""
-    
-    # S&P 500 주요 종목 (섹터별로 리스트 구성)
-    sp500_sectors = [
-        # Technology (20개)
-        (['AAPL', 'MSFT', 'GOOGL', 'GOOG', 'META', 'NVDA', 'AVGO', 'ORCL', 'CRM', 'ADBE', 'INTC', 'AMD', 'QCOM', 'TXN', 'AMAT', 'LRCX', 'KLAC', 'MU', 'NXPI', 'MRVL'],
-         ['애플', '마이크로소프트', '구글A', '구글C', '메타', '엔비디아', '브로드컴', '오라클', '세일즈포스', '어도비', '인텔', 'AMD', '퀄컴', '텍사스인스트루먼트', '어플라이드머티리얼즈', '라믹리서치', 'KLA', '마이크론', 'NXP', '마벨'],
-         '기술'),
-        # Healthcare (20개)
-        (['UNH', 'JNJ', 'LLY', 'ABBV', 'TMO', 'ABT', 'DHR', 'BMY', 'AMGN', 'GILD', 'REGN', 'VRTX', 'BIIB', 'CI', 'HUM', 'CVS', 'ELV', 'ISRG', 'SYK', 'BSX'],
-         ['유나이티드헬스', '존슨앤존슨', '엘리릴리', '애브비', '써모피셔', '애보트', '다나허', '브리스톨마이어스', '앰젠', '길리어드', '리제너론', '버텍스', '바이오젠', '시그나', '휴마나', 'CVS헬스', '엘리베이트', '인튜이티브서지컬', '스트라이커', '보스턴사이언티픽'],
-         '헬스케어'),
-        # Financials (20개)
-        (['JPM', 'BAC', 'WFC', 'GS', 'MS', 'C', 'BLK', 'SCHW', 'AXP', 'COF', 'USB', 'PNC', 'TFC', 'BK', 'STT', 'MTB', 'CFG', 'FITB', 'HBAN', 'ZION'],
-         ['JP모건', '뱅크오브아메리카', '웰스파고', '골드만삭스', '모건스탠리', '시티그룹', '블랙록', '찰스슈왑', '아메리칸익스프레스', '캐피탈원', 'US뱅크', 'PNC', '트루이스트', '뱅크오브뉴욕', '스테이트스트리트', 'M&T뱅크', '시티즌스', '피프스써드', '헌팅턴', 'Zions'],
-         '금융'),
-        # Consumer Discretionary (20개)
-        (['AMZN', 'TSLA', 'HD', 'MCD', 'NKE', 'SBUX', 'LOW', 'TJX', 'BKNG', 'GM', 'F', 'NCLH', 'CCL', 'RCL', 'MAR', 'HLT', 'ABNB', 'EXPE', 'TRIP', 'TCOM'],
-         ['아마존', '테슬라', '홈디포', '맥도날드', '나이키', '스타벅스', '로우스', 'TJX', '부킹홀딩스', '제너럴모터스', '포드', '노르웨이크루즈', '카니발', '로열캐리비안', '메리어트', '힐튼', '에어비앤비', '익스피디아', '트립어드바이저', '트립닷컴'],
-         '소비재'),
-        # Consumer Staples (20개)
-        (['WMT', 'PG', 'KO', 'PEP', 'COST', 'TGT', 'CL', 'KMB', 'CHD', 'GIS', 'CPB', 'SJM', 'HRL', 'CAG', 'K', 'MDLZ', 'HSY', 'TAP', 'BF.B', 'STZ'],
-         ['월마트', '프로cter앤갬블', '코카콜라', '펩시코', '코스트코', '타겟', '콜게이트', '킴벌리클라크', '처치앤드와이트', '제너럴밀스', '캠벨수프', 'JM스마커', '호멜', '코너그라', '켈로그', '몬델레즈', '허쉬', '몰슨쿠어스', '브라운포먼', '컨스텔레이션'],
-         '필수소비재'),
-        # Energy (20개)
-        (['XOM', 'CVX', 'SLB', 'EOG', 'COP', 'MPC', 'PSX', 'VLO', 'HES', 'FANG', 'OVV', 'CTRA', 'MRO', 'DVN', 'APA', 'HAL', 'BKR', 'FTI', 'NOV', 'WMB'],
-         ['엑슨모빌', '셰브론', '슐럼버거', 'EOG리소스', '코노코필립스', '마라톤피트롤리움', '필립스66', '발레로', '헤스', '다이아몬드백', '오비비', '코트라', '마라톤오일', '데본에너지', '아파치', '할리버튼', '베이커휴즈', '테크니팁', '내셔널오일웰', '윌리엄스'],
-         '에너지'),
-        # Industrials (20개)
-        (['BA', 'CAT', 'GE', 'HON', 'RTX', 'LMT', 'NOC', 'GD', 'TDG', 'TDY', 'PH', 'EMR', 'ETN', 'IR', 'DOV', 'FTV', 'AME', 'ZBH', 'ITW', 'CMI'],
-         ['보잉', '캐터필러', '제너럴일렉트릭', '하니웰', 'RTX', '록히드마틴', '노스롭그루먼', '제너럴다이내믹스', '트랜스디지털', '텔레다인', '파커핸니핀', '이머슨', '이튼', '잉거솔랜드', '도버', '포트리브', '아메텍', '지머바이오메트', '일리노이툴웍스', '커민스'],
-         '산업재'),
-        # Communication Services (20개)
-        (['VZ', 'T', 'CMCSA', 'DIS', 'NFLX', 'PARA', 'WBD', 'FOX', 'FOXA', 'LBRDK', 'LBRDA', 'LSXMK', 'LSXMA', 'LSXMB', 'CHTR', 'EA', 'TTWO', 'ATVI', 'ROKU', 'SPOT'],
-         ['버라이즌', 'AT&T', '컴캐스트', '월트디즈니', '넷플릭스', '파라마운트', '워너브라더스', '폭스', '폭스A', '리버티브로드캐스트', '리버티브로드캐스트A', '리버티미디어', '리버티미디어A', '리버티미디어B', '차터', '일렉트로닉아츠', '테이크투', '액티비전블리자드', '로쿠', '스포티파이'],
-         '통신서비스'),
-        # Materials (20개)
-        (['LIN', 'APD', 'ECL', 'SHW', 'DD', 'DOW', 'FCX', 'NEM', 'VALE', 'RIO', 'BHP', 'SCCO', 'TECK', 'NTR', 'MOS', 'CF', 'FMC', 'NUE', 'STLD', 'X'],
-         ['린데', '에어프로덕츠', '이클립', '셰윈윌리엄스', '듀퐁', '다우', '프리포트맥모란', '뉴몬트', '밸리', '리오틴토', 'BHP', '서던코퍼', '테크리소스', '뉴트리엔', '모자이크', 'CF인더스트리즈', 'FMC', '누코르', '스틸다이나믹스', 'US스틸'],
-         '소재'),
-        # Real Estate (20개)
-        (['AMT', 'PLD', 'EQIX', 'PSA', 'WELL', 'SPG', 'O', 'DLR', 'VICI', 'EXPI', 'CBRE', 'JLL', 'CWK', 'FR', 'AVB', 'EQR', 'UDR', 'MAA', 'CPT', 'ESS'],
-         ['아메리칸타워', '프롤로지스', '이퀴닉스', '퍼블릭스토리지', '웰토워', '사이먼프롭퍼티', '리얼티인컴', '디지털리얼티', '비치', 'eXp리얼티', 'CBRE', '존스랭라살', '캠프웨이드', '퍼스트인더스트리얼', '에이발론베이컨', '에퀴티레지던셜', 'UDR', '미드아메리카아파트', '캠던프롭퍼티', '에식스프롭퍼티'],
-         '부동산'),
-        # Utilities (20개)
-        (['NEE', 'DUK', 'SO', 'D', 'AEP', 'SRE', 'EXC', 'XEL', 'WEC', 'ES', 'ED', 'ETR', 'PEG', 'FE', 'AEE', 'LNT', 'CNP', 'ATO', 'CMS', 'NI'],
-         ['넥스트에라에너지', '듀크에너지', '서던컴퍼니', '도미니언에너지', '아메리칸일렉트릭파워', 'Sempra', '엑셀론', '엑셀에너지', '위스콘신에너지', '에버소스', '컨솔리데이티드에디슨', '엔터지', '퍼블릭서비스엔터프라이즈', '퍼스트에너지', '아메리칸일렉트릭', '알리안트에너지', '센터포인트에너지', '아토스에너지', 'CMS에너지', '니소스'],
-         '유틸리티'),
-    ]
-    
-    # KOSPI 200 주요 종목
-    kospi_sectors = [
-        (['005930', '000660', '035420', '051910', '006400', '028260', '005380', '035720', '207940', '036570', '000270', '105560', '066570', '003550', '032830', '034730', '012330', '017670', '096770', '018260'],
-         ['삼성전자', 'SK하이닉스', 'NAVER', 'LG화학', '삼성SDI', '삼성물산', '현대차', '카카오', '삼성바이오로직스', '엔씨소프트', '기아', 'KB금융', 'LG전자', 'LG', '삼성생명', 'SK', '현대모비스', 'SK텔레콤', 'SK이노베이션', '삼성에스디에스'],
-         ['반도체', '반도체', '인터넷', '화학', '배터리', '유통', '자동차', '인터넷', '바이오', '게임', '자동차', '금융', '전자', '전자', '금융', '에너지', '자동차부품', '통신', '에너지', 'IT서비스']),
-        (['005490', '009540', '006360', '003670', '015760', '000810', '010130', '011200', '023530', '024110', '028300', '029780', '030200', '032640', '033780', '035250', '035900', '036460', '037270', '042660'],
-         ['POSCO홀딩스', '한국전력', 'GS건설', '포스코퓨처엠', '한국전력기술', '삼성화재', '고려아연', 'HMM', '롯데케미칼', '기업은행', 'HLB', '알테오젠', 'KT', 'LG유플러스', 'KT&G', '강원랜드', 'JYP엔터테인먼트', '한국가스공사', 'YG플러스', '한국전자금융'],
-         ['철강', '전력', '건설', '화학', '전력', '보험', '비철금속', '운송', '화학', '금융', '바이오', '바이오', '통신', '통신', '담배', '레저', '엔터테인먼트', '가스', '엔터테인먼트', 'IT서비스']),
-    ]
-    
-    # 데이터 병합을 위한 리스트 생성
-    all_tickers = []
-    all_names = []
-    all_countries = []
-    all_sectors = []
-    
-    # S&P 500 데이터 추가
-    for tickers, names, sector in sp500_sectors:
-        all_tickers.extend(tickers)
-        all_names.extend(names)
-        all_countries.extend(['미국'] * len(tickers))
-        all_sectors.extend([sector] * len(tickers))
-    
-    # KOSPI 데이터 추가
-    for tickers, names, sectors in kospi_sectors:
-        all_tickers.extend(tickers)
-        all_names.extend(names)
-        all_countries.extend(['한국'] * len(tickers))
-        all_sectors.extend(sectors)
-    
-    # 기본 데이터프레임 생성
-    data = {
-        '티커': all_tickers,
-        '회사명': all_names,
-        '국가': all_countries,
-        '섹터': all_sectors,
-    }
-    
-    # 랜덤 데이터 생성 (실제로는 API에서 가져와야 함)
-    np.random.seed(42)  # 재현성을 위한 시드 설정
-    n_stocks = len(all_tickers)
-    
-    data['최근수익률(%)'] = np.random.uniform(-5, 15, n_stocks).round(1)
-    data['변동성'] = np.random.choice(['낮음', '중간', '높음', '매우높음'], n_stocks, p=[0.3, 0.4, 0.25, 0.05])
-    data['뉴스감성(1~5)'] = np.random.uniform(2, 5, n_stocks).round(1)
-    data['PER'] = np.random.uniform(8, 60, n_stocks).round(1)
-    data['배당률(%)'] = np.random.uniform(0, 4, n_stocks).round(2)
-    data['시가총액규모'] = np.random.choice(['대형', '중형', '소형'], n_stocks, p=[0.6, 0.3, 0.1])
-    data['유동성'] = np.random.choice(['매우높음', '높음', '중간', '낮음'], n_stocks, p=[0.3, 0.4, 0.25, 0.05])
-    data['성장률(%)'] = np.random.uniform(0, 30, n_stocks).round(1)
-    data['RSI'] = np.random.uniform(30, 75, n_stocks).round(0).astype(int)
-    
-    df = pd.DataFrame(data)
-    
-    # 실제 주가 가져오기 (yfinance 사용)
-    prices = []
-    exchange_rate = get_exchange_rate()
-    
-    # 한국 주식과 미국 주식을 분리하여 처리
-    korean_stocks = df[df['국가'] == '한국'].copy()
-    us_stocks = df[df['국가'] == '미국'].copy()
-    
-    # 한국 주식 처리 (yfinance 사용)
-    if len(korean_stocks) > 0:
-        for idx, row in korean_stocks.iterrows():
-            try:
-                # yfinance로 한국 주식 가져오기
-                korean_ticker = f"{row['티커']}.KS"
-                stock = yf.Ticker(korean_ticker)
-                hist = stock.history(period="1d")
-                if len(hist) > 0:
-                    price_krw = hist['Close'].iloc[-1]
-                    prices.append((idx, float(price_krw)))
-                    continue
-            except:
-                pass
-            
-            # yfinance 실패 시 기본값 사용
-            sector_price_ranges = {
-                '반도체': (50000, 200000), '인터넷': (100000, 300000), '화학': (200000, 600000),
-                '배터리': (400000, 800000), '유통': (50000, 200000), '자동차': (50000, 300000),
-                '바이오': (300000, 1000000), '게임': (200000, 500000), '금융': (30000, 100000),
-                '전자': (50000, 150000), '에너지': (20000, 80000), '통신': (30000, 60000),
-                'IT서비스': (50000, 200000), '철강': (200000, 500000), '전력': (10000, 30000),
-                '건설': (30000, 100000), '보험': (20000, 80000), '비철금속': (30000, 100000),
-                '운송': (20000, 80000), '담배': (50000, 150000), '레저': (30000, 100000),
-                '엔터테인먼트': (50000, 200000), '가스': (20000, 60000),
-            }
-            price_range = sector_price_ranges.get(row['섹터'], (50000, 200000))
-            estimated_price = np.random.uniform(price_range[0], price_range[1])
-            prices.append((idx, estimated_price))
-    
-    # 미국 주식 처리 (yfinance 사용)
-    for idx, row in us_stocks.iterrows():
-        real_price = get_real_stock_price(row['티커'], row['국가'])
-        if real_price is not None:
-            prices.append((idx, real_price))
-        else:
-            # 가져오기 실패 시 섹터별 평균 주가 추정
-            if row['국가'] == '한국':
-                # 한국 주식: 섹터별 평균 주가 범위 (원화)
-                sector_price_ranges = {
-                    '반도체': (50000, 200000),
-                    '인터넷': (100000, 300000),
-                    '화학': (200000, 600000),
-                    '배터리': (400000, 800000),
-                    '유통': (50000, 200000),
-                    '자동차': (50000, 300000),
-                    '바이오': (300000, 1000000),
-                    '게임': (200000, 500000),
-                    '금융': (30000, 100000),
-                    '전자': (50000, 150000),
-                    '에너지': (20000, 80000),
-                    '통신': (30000, 60000),
-                    'IT서비스': (50000, 200000),
-                    '철강': (200000, 500000),
-                    '전력': (10000, 30000),
-                    '건설': (30000, 100000),
-                    '보험': (20000, 80000),
-                    '비철금속': (30000, 100000),
-                    '운송': (20000, 80000),
-                    '담배': (50000, 150000),
-                    '레저': (30000, 100000),
-                    '엔터테인먼트': (50000, 200000),
-                    '가스': (20000, 60000),
-                }
-                price_range = sector_price_ranges.get(row['섹터'], (50000, 200000))
-                estimated_price = np.random.uniform(price_range[0], price_range[1])
-                prices.append((idx, estimated_price))
-            else:
-                # 미국 주식: 섹터별 평균 주가 범위 (USD -> 원화 환산)
-                sector_price_ranges_usd = {
-                    '기술': (100, 500),
-                    '헬스케어': (50, 400),
-                    '금융': (30, 200),
-                    '소비재': (50, 300),
-                    '필수소비재': (30, 200),
-                    '에너지': (20, 150),
-                    '산업재': (50, 300),
-                    '통신서비스': (20, 100),
-                    '소재': (30, 200),
-                    '부동산': (50, 300),
-                    '유틸리티': (30, 150),
-                }
-                price_range_usd = sector_price_ranges_usd.get(row['섹터'], (50, 200))
-                estimated_price_usd = np.random.uniform(price_range_usd[0], price_range_usd[1])
-                prices.append((idx, estimated_price_usd * exchange_rate))
-    
-    # 가격을 인덱스 순서대로 정렬하여 할당
-    prices_dict = {idx: price for idx, price in prices}
-    df['현재가'] = [prices_dict.get(idx, 100000) for idx in df.index]
-    
-    return df
+    return load_universe(get_exchange_rate(), price_fetcher=get_real_stock_price)
 
 # 주가 데이터 가져오기 (과거 데이터) - yfinance 사용
 @st.cache_data(ttl=300)
 def get_stock_history(ticker, country, period="3mo"):
     """주가 과거 데이터를 가져오는 함수 - yfinance 사용"""
-    try:
-        if country == '미국':
-            # 미국 주식은 yfinance 사용
-            stock = yf.Ticker(ticker)
-            if period == "3mo":
-                hist = stock.history(period="3mo")
-            elif period == "6mo":
-                hist = stock.history(period="6mo")
-            else:
-                hist = stock.history(period="1y")
-            if len(hist) > 0:
-                return hist
-        else:
-            # 한국 주식은 yfinance 사용 (.KS 추가)
-            try:
-                stock = yf.Ticker(f"{ticker}.KS")
-                if period == "3mo":
-                    hist = stock.history(period="3mo")
-                elif period == "6mo":
-                    hist = stock.history(period="6mo")
-                else:
-                    hist = stock.history(period="1y")
-                if len(hist) > 0:
-                    return hist
-            except:
-                pass
-            
-            # .KS가 안 되면 티커만으로 시도
-            try:
-                stock = yf.Ticker(ticker)
-                if period == "3mo":
-                    hist = stock.history(period="3mo")
-                elif period == "6mo":
-                    hist = stock.history(period="6mo")
-                else:
-                    hist = stock.history(period="1y")
-                if len(hist) > 0:
-                    return hist
-            except:
-                pass
-        
-        return None
-    except:
-        return None
+    return fetch_stock_history(ticker, country, period)
+
+# 여러 종목의 가격 패널 가져오기 - yfinance 일괄 다운로드
+@st.cache_data(ttl=300)
+def get_price_panel(tickers, countries, period="3mo"):
+    """여러 종목의 종가를 (날짜 × 티커) 패널로 한 번에 가져오는 함수"""
+    return fetch_price_panel(tickers, countries, period)
+
+# 추천 스냅샷 (요소 점수 행렬 + 앙상블 예측 + 위험 모델) - 배치 추천 엔진과 같은 계산
+@st.cache_data(ttl=300)
+def get_snapshot(df_stocks, price_panel):
+    """종목 데이터와 가격 패널로 모든 투자성향이 공유하는 스냅샷 계산"""
+    return build_snapshot(df_stocks, price_panel)
+
+# 추천 포트폴리오 (후보 선정 + 분산 선택) - 순위에 영향을 주는 입력만 키로 사용
+@st.cache_data(ttl=300)
+def get_recommendation(snapshot_key, risk_tolerance, investment_amount, method, _snapshot):
+    """투자성향/투자 금액/구성 방식별 추천 종목 표 (최종점수 순)"""
+    df_candidates = build_candidates(_snapshot, risk_tolerance, investment_amount)
+
+    # 최종 추천 포트폴리오 생성 (15~20개 종목 추천)
+    df_recommended = select_diversified_portfolio(
+        df_candidates, target_stocks=10, investment_amount=investment_amount,
+        method=method, risk_model=_snapshot['risk_model'], risk_tolerance=risk_tolerance,
+        similarity=_snapshot['similarity']
+    )
+
+    # 최종점수 순으로 정렬
+    if len(df_recommended) > 0:
+        df_recommended = df_recommended.sort_values('최종점수', ascending=False).reset_index(drop=True)
+        df_recommended['총점'] = df_recommended['최종점수']  # 표시용
+    return df_recommended
+
+# 투자성향 0~100 전체의 효율적 투자선 (잔액/구성 방식별로 한 번 계산)
+@st.cache_data(ttl=300)
+def get_efficient_frontier(snapshot_key, balance, method, _snapshot):
+    """스냅샷 키별 효율적 투자선 표 (스냅샷은 키로 식별하므로 해시하지 않음)"""
+    return efficient_frontier(_snapshot, balance, method=method)
+
+# 적립식 투자 시뮬레이션 (시나리오 × 월 × 종목 텐서로 한 번에 계산)
+@st.cache_data(ttl=300)
+def get_dca_simulation(snapshot_key, tickers, amounts, savings_amount, years, annual_rate, _price_panel):
+    """추천 포트폴리오를 매달 매수했을 때의 자산 분포 (가격 패널은 스냅샷 키로 식별)"""
+    return simulate_plan(_price_panel, list(tickers), list(amounts), savings_amount, years=years, annual_rate=annual_rate)
+
+# 종목별 3개월 추세선 (가격 패널에서 전체 종목을 한 번에, 스냅샷 종목 순서)
+@st.cache_data(ttl=300)
+def get_sparklines(snapshot_key, _price_panel, _tickers):
+    """스냅샷 키별 추세선 점 목록 (가격 패널은 스냅샷 키로 식별)"""
+    return sparkline_lists(_price_panel, _tickers)
+
+# 전체 종목 표 (숫자 열은 숫자 그대로 두고 표시 형식은 column_config로 지정)
+# 읽기 전용으로만 쓰므로 cache_resource로 복사 없이 재사용 (종목 수가 많아도 재실행마다 표를 다시 만들지 않음)
+@st.cache_resource(ttl=300, max_entries=32, show_spinner=False)
+def get_universe_table(snapshot_key, risk_tolerance, investment_amount, _snapshot, _price_panel):
+    """투자성향/투자 금액별 전체 종목 표 (종합점수, 매수가능주수, 3개월 추이 포함)"""
+    df = _snapshot['stocks'][UNIVERSE_COLUMNS[:-2]].copy()
+    df['종합점수'] = composite_scores(_snapshot, risk_tolerance)
+    df['매수가능주수'] = (investment_amount / df['현재가']).astype(int)
+    df['3개월 추이'] = get_sparklines(snapshot_key, _price_panel, _snapshot['tickers'])
+    return df
+
+# 조건식 검색 인덱스 (종합점수/매수가능주수가 투자성향과 금액에 따라 달라지므로 함께 키로 사용)
+@st.cache_data(ttl=300)
+def get_screen_index(snapshot_key, risk_tolerance, investment_amount, _df):
+    """전체 종목 표의 검색 인덱스 (숫자 열 정렬 순서 + 문자열 열 값별 위치)"""
+    return build_screen_index(_df)
+
+@st.cache_resource
+def get_ledger():
+    """보유 종목 장부 (세션 간 공유, 변경 시 디스크에 저장)"""
+    return load_ledger()
+
+@st.cache_resource
+def get_alert_book():
+    """가격 알림 장부 (세션 간 공유, 변경 시 디스크에 저장)"""
+    return load_alert_book()
+
+# 공유 장부의 잠금 - 세션마다 다른 스레드에서 실행되므로 장부를 바꾸거나 읽는 동안 잡아
+# 배열(pos_*, ticker_ptr 등)이 어긋난 중간 상태를 보거나 같은 스냅샷을 두 번 평가하지 않도록 함
+@st.cache_resource
+def get_ledger_lock():
+    return threading.Lock()
+
+@st.cache_resource
+def get_alert_lock():
+    return threading.Lock()
+
+# 종목 차트 figure 캐시 - (티커, 구간 길이, 마지막 봉, 예측 버전)이 같으면 다시 만들지 않음
+# st.plotly_chart는 dict를 받으면 Figure로 다시 검증하므로 Figure 객체를 그대로 보관 (읽기 전용으로 사용)
+@st.cache_resource(ttl=3600, max_entries=256, show_spinner=False)
+def get_stock_chart(ticker, company_name, country, window, last_bar, forecast_version,
+                    _hist_data, _future_dates, _predictions, _ma20):
+    return create_stock_chart(ticker, company_name, country, _hist_data, _future_dates, _predictions, ma20=_ma20)
+
+@st.cache_resource
+def load_feature_store(feature_key, _price_panel):
+    """스냅샷 키의 피처 저장소 열기 (세션 간 같은 메모리 맵 공유, 정리된 파일은 가격 패널로 다시 생성)"""
+    return open_feature_store(feature_key, price_panel=_price_panel)
 
 # 머신러닝 기반 주가 예측 함수
 def predict_stock_price(hist_data, days_ahead=30):
@@ -411,19 +236,16 @@ def predict_stock_price(hist_data, days_ahead=30):
     except Exception as e:
         return None, None
 
-# RSI 계산 함수
-def calculate_rsi(prices, period=14):
-    """RSI (Relative Strength Index) 계산"""
-    delta = prices.diff()
-    gain = (delta.where(delta > 0, 0)).rolling(window=period).mean()
-    loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
-    rs = gain / loss
-    rsi = 100 - (100 / (1 + rs))
-    return rsi
-
 # 주가 그래프 생성 함수
-def create_stock_chart(ticker, company_name, country, hist_data, future_dates=None, predictions=None):
-    """주가 변동 그래프와 예측 그래프 생성"""
+CHART_POINTS = 700  # 차트 폭(픽셀) 기준 최대 점 수 - 더 많으면 LTTB로 다운샘플링
+WEBGL_POINTS = 500  # 이보다 긴 구간(1년 이상)은 WebGL(Scattergl)로 그림
+
+def create_stock_chart(ticker, company_name, country, hist_data, future_dates=None, predictions=None, ma20=None,
+                       max_points=CHART_POINTS):
+    """주가 변동 그래프와 예측 그래프 생성 (ma20: 피처 저장소의 20일 이동평균, 없으면 직접 계산)
+
+    구간이 max_points보다 길면 LTTB로 점을 줄이고, 값은 float32(또는 반올림), 날짜는 'YYYY-MM-DD'로 보냅니다.
+    """
     fig = make_subplots(
         rows=2, cols=1,
         shared_xaxes=True,
@@ -437,11 +259,24 @@ def create_stock_chart(ticker, company_name, country, hist_data, future_dates=No
         hist_df = hist_data.reset_index()
         hist_df['Date'] = pd.to_datetime(hist_df['Date'])
         
+        # 이동평균선
+        if ma20 is not None:
+            hist_dates = pd.DatetimeIndex(hist_df['Date']).tz_localize(None).normalize()
+            hist_df['MA20'] = ma20.reindex(hist_dates).values
+        else:
+            hist_df['MA20'] = hist_df['Close'].rolling(window=20).mean()
+        
+        # 차트 폭보다 긴 구간은 주가 모양을 유지하는 점만 남김 (거래량은 따로 골라 급증 구간 유지)
+        bars = np.arange(len(hist_df))
+        price_df = hist_df.iloc[lttb_indices(bars, hist_df['Close'], max_points)]
+        volume_df = hist_df.iloc[lttb_indices(bars, hist_df['Volume'], max_points)]
+        scatter = go.Scattergl if len(hist_df) > WEBGL_POINTS else go.Scatter
+        
         # 주가 라인
         fig.add_trace(
-            go.Scatter(
-                x=hist_df['Date'],
-                y=hist_df['Close'],
+            scatter(
+                x=compact_dates(price_df['Date']),
+                y=compact_values(price_df['Close']),
                 mode='lines',
                 name='실제 주가',
                 line=dict(color='#3498db', width=2)
@@ -449,12 +284,10 @@ def create_stock_chart(ticker, company_name, country, hist_data, future_dates=No
             row=1, col=1
         )
         
-        # 이동평균선
-        hist_df['MA20'] = hist_df['Close'].rolling(window=20).mean()
         fig.add_trace(
-            go.Scatter(
-                x=hist_df['Date'],
-                y=hist_df['MA20'],
+            scatter(
+                x=compact_dates(price_df['Date']),
+                y=compact_values(price_df['MA20']),
                 mode='lines',
                 name='20일 이동평균',
                 line=dict(color='#e74c3c', width=1, dash='dash')
@@ -464,10 +297,11 @@ def create_stock_chart(ticker, company_name, country, hist_data, future_dates=No
         
         # 예측 데이터
         if future_dates is not None and predictions is not None:
+            predictions = np.asarray(predictions, dtype=np.float64)
             fig.add_trace(
                 go.Scatter(
-                    x=future_dates,
-                    y=predictions,
+                    x=compact_dates(future_dates),
+                    y=compact_values(predictions),
                     mode='lines',
                     name='ML 예측 주가',
                     line=dict(color='#2ecc71', width=2, dash='dot')
@@ -478,8 +312,8 @@ def create_stock_chart(ticker, company_name, country, hist_data, future_dates=No
             # 예측 구간 표시
             fig.add_trace(
                 go.Scatter(
-                    x=list(future_dates) + list(future_dates[::-1]),
-                    y=list(predictions * 1.05) + list(predictions * 0.95)[::-1],
+                    x=np.concatenate([compact_dates(future_dates), compact_dates(future_dates[::-1])]),
+                    y=compact_values(np.concatenate([predictions * 1.05, (predictions * 0.95)[::-1]])),
                     fill='toself',
                     fillcolor='rgba(46, 204, 113, 0.2)',
                     line=dict(color='rgba(255,255,255,0)'),
@@ -492,8 +326,8 @@ def create_stock_chart(ticker, company_name, country, hist_data, future_dates=No
         # 거래량
         fig.add_trace(
             go.Bar(
-                x=hist_df['Date'],
-                y=hist_df['Volume'],
+                x=compact_dates(volume_df['Date']),
+                y=compact_values(volume_df['Volume'], decimals=0),
                 name='거래량',
                 marker_color='#95a5a6'
             ),
@@ -513,89 +347,109 @@ def create_stock_chart(ticker, company_name, country, hist_data, future_dates=No
     
     return fig
 
-# OpenAI를 활용한 종목 분석 함수
-def get_stock_analysis(company_name, ticker, country, sector, per, dividend_rate, growth_rate, volatility, news_sentiment):
-    """OpenAI를 사용하여 종목 분석 생성"""
-    try:
-        # OpenAI API 키 확인 (세션 상태 우선)
-        api_key = st.session_state.get('openai_api_key', '')
-        
-        if not api_key:
-            # 환경변수 확인
-            api_key = os.getenv("OPENAI_API_KEY", "")
-        
-        if not api_key:
-            # Streamlit secrets에서도 확인
-            try:
-                api_key = st.secrets.get("OPENAI_API_KEY", "")
-            except:
-                pass
-        
-        if not api_key:
-            return {
-                "recommendation_reason": "OpenAI API 키가 설정되지 않았습니다. 환경변수 OPENAI_API_KEY를 설정해주세요.",
-                "caution_points": "API 키 설정이 필요합니다.",
-                "articles": []
-            }
-        
-        client = OpenAI(api_key=api_key)
-        
-        # 프롬프트 생성
-        prompt = f"""
-다음 주식에 대한 투자 분석을 한국어로 작성해주세요:
-
-회사명: {company_name}
-티커: {ticker}
-국가: {country}
-섹터: {sector}
-PER: {per}
-배당률: {dividend_rate}%
-성장률: {growth_rate}%
-변동성: {volatility}
-뉴스감성 점수: {news_sentiment}/5
-
-다음 형식으로 답변해주세요:
-
-1. 추천 이유 (2-3문단):
-   - 이 종목을 추천하는 주요 이유를 설명해주세요.
-   - 재무 지표, 성장성, 시장 지위 등을 종합적으로 고려하여 작성해주세요.
-
-2. 주의해야 할 점 (2-3문단):
-   - 투자 시 주의해야 할 리스크 요인을 설명해주세요.
-   - 시장 환경, 경쟁 상황, 재무 리스크 등을 포함해주세요.
-
-답변은 한국어로 작성하고, 객관적이고 전문적인 톤으로 작성해주세요.
-"""
-        
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",  # 비용 효율적인 모델 사용
-            messages=[
-                {"role": "system", "content": "당신은 전문 증권 애널리스트입니다. 주식 투자 분석을 객관적이고 전문적으로 제공합니다."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=1000,
-            temperature=0.7
+# 효율적 투자선 그래프 생성 함수
+def create_frontier_chart(frontier, current_risk):
+    """투자성향별 예상 변동성-수익률 그래프 (마우스를 올리면 해당 포트폴리오 구성 표시)"""
+    hover = frontier['구성'].str.replace(', ', '<br>', regex=False)
+    fig = go.Figure()
+    fig.add_trace(
+        go.Scatter(
+            x=frontier['예상변동성(%)'],
+            y=frontier['예상수익률(%)'],
+            mode='lines+markers',
+            name='투자성향별 포트폴리오',
+            line=dict(color='#bdc3c7', width=1),
+            marker=dict(
+                size=8,
+                color=frontier['투자성향'],
+                colorscale='RdYlGn_r',
+                cmin=0, cmax=100,
+                colorbar=dict(title='투자성향')
+            ),
+            customdata=np.stack([frontier['투자성향'], frontier['투자된금액'], frontier['종목수'], hover], axis=-1),
+            hovertemplate=(
+                '<b>투자성향 %{customdata[0]}</b><br>'
+                '예상 변동성: %{x:.2f}% | 예상 수익률: %{y:+.2f}%<br>'
+                '투자 금액: %{customdata[1]:,.0f}원 (%{customdata[2]}종목)<br>'
+                '%{customdata[3]}<extra></extra>'
+            )
         )
-        
-        analysis_text = response.choices[0].message.content
-        
-        # 추천 이유와 주의사항 분리
-        parts = analysis_text.split("2. 주의해야 할 점")
-        recommendation_reason = parts[0].replace("1. 추천 이유", "").strip() if len(parts) > 0 else analysis_text
-        caution_points = parts[1].strip() if len(parts) > 1 else "분석 정보를 확인할 수 없습니다."
-        
-        return {
-            "recommendation_reason": recommendation_reason,
-            "caution_points": caution_points,
-            "articles": []  # 기사는 별도 함수로 처리
-        }
-        
-    except Exception as e:
-        return {
-            "recommendation_reason": f"분석 생성 중 오류가 발생했습니다: {str(e)}",
-            "caution_points": "분석 정보를 확인할 수 없습니다.",
-            "articles": []
-        }
+    )
+    current = frontier[frontier['투자성향'] == current_risk]
+    if len(current) > 0:
+        fig.add_trace(
+            go.Scatter(
+                x=current['예상변동성(%)'],
+                y=current['예상수익률(%)'],
+                mode='markers',
+                name='현재 투자성향',
+                marker=dict(symbol='star', size=18, color='#2c3e50'),
+                hoverinfo='skip'
+            )
+        )
+    fig.update_layout(
+        title='투자성향별 효율적 투자선 (30일 예상 수익률 vs 1개월 예상 변동성)',
+        xaxis_title='예상 변동성 (%)',
+        yaxis_title='예상 수익률 (%)',
+        height=500,
+        hovermode='closest'
+    )
+    return fig
+
+# 적립식 투자 시뮬레이션 팬 차트
+def create_dca_fan_chart(result):
+    """월별 총자산의 백분위 구간(5~95%, 25~75%)과 중앙값, 누적 납입액 그래프"""
+    percentiles = result['percentiles']
+    months = np.arange(1, len(result['contributed']) + 1)
+    years = months / 12
+    fig = go.Figure()
+    for low, high, color, name in [(5, 95, 'rgba(52, 152, 219, 0.15)', '5~95% 구간'),
+                                   (25, 75, 'rgba(52, 152, 219, 0.35)', '25~75% 구간')]:
+        fig.add_trace(go.Scatter(x=years, y=percentiles[high], mode='lines', line=dict(width=0),
+                                 showlegend=False, hoverinfo='skip'))
+        fig.add_trace(go.Scatter(x=years, y=percentiles[low], mode='lines', line=dict(width=0),
+                                 fill='tonexty', fillcolor=color, name=name, hoverinfo='skip'))
+    fig.add_trace(go.Scatter(
+        x=years, y=percentiles[50], mode='lines', name='중앙값',
+        line=dict(color='#2980b9', width=3),
+        customdata=np.stack([months, percentiles[5], percentiles[95]], axis=-1),
+        hovertemplate='<b>%{customdata[0]}개월</b><br>중앙값: %{y:,.0f}원<br>'
+                      '5~95%: %{customdata[1]:,.0f} ~ %{customdata[2]:,.0f}원<extra></extra>'
+    ))
+    fig.add_trace(go.Scatter(
+        x=years, y=result['contributed'], mode='lines', name='누적 납입액',
+        line=dict(color='#7f8c8d', width=2, dash='dash'),
+        hovertemplate='누적 납입액: %{y:,.0f}원<extra></extra>'
+    ))
+    fig.update_layout(
+        title='적립식 투자 시뮬레이션 (예적금 + 추천 포트폴리오 총자산)',
+        xaxis_title='기간 (년)',
+        yaxis_title='총자산 (원)',
+        height=500,
+        hovermode='x unified'
+    )
+    return fig
+
+# OpenAI API 키 (세션 상태 → 환경변수 → Streamlit secrets 순)
+def get_openai_api_key():
+    api_key = st.session_state.get('openai_api_key', '') or os.getenv("OPENAI_API_KEY", "")
+    if not api_key:
+        try:
+            api_key = st.secrets.get("OPENAI_API_KEY", "")
+        except:
+            pass
+    return api_key
+
+# OpenAI를 활용한 종목 분석 함수 (프롬프트/요청은 analysis 모듈 - 공유 클라이언트로 연결 재사용, 같은 요청은 디스크 캐시)
+def stream_stock_analysis(stock, snapshot_key=None):
+    """OpenAI 종목 분석을 스트리밍으로 생성 - 도착할 때마다 중간 결과, 마지막에 최종 결과 dict
+    (available: 실제 분석이 생성되었는지 여부, cached: 캐시 적중 여부)"""
+    api_key = get_openai_api_key()
+    if not api_key:
+        yield error_result("OpenAI API 키가 설정되지 않았습니다. 환경변수 OPENAI_API_KEY를 설정해주세요.",
+                           "API 키 설정이 필요합니다.")
+        return
+    yield from stream_analysis(api_key, stock, snapshot_key)
 
 # 관련 기사 검색 함수
 def search_news_articles(company_name, ticker, country):
@@ -658,77 +512,506 @@ def search_news_articles(company_name, ticker, country):
     
     return articles
 
-# 점수 변환 함수들
-def get_stability_score(volatility, market_cap):
-    """안정성 점수 계산 (변동성 + 시가총액 규모)"""
-    volatility_map = {
-        '낮음': 5,
-        '중간': 3,
-        '높음': 2,
-        '매우높음': 1
-    }
-    market_cap_map = {
-        '대형': 5,
-        '중형': 3,
-        '소형': 1
-    }
-    return (volatility_map.get(volatility, 0) * 0.6 + market_cap_map.get(market_cap, 0) * 0.4)
-
-def get_valuation_score(per):
-    """밸류에이션 점수 계산 (PER 기준, 낮을수록 좋음)"""
-    # PER이 10 이하면 5점, 20이면 3점, 30이면 2점, 50 이상이면 1점
-    if per <= 10:
-        return 5
-    elif per <= 15:
-        return 4.5
-    elif per <= 20:
-        return 4
-    elif per <= 25:
-        return 3
-    elif per <= 35:
-        return 2
+# 실행 시간 기록 - 전체 실행과 fragment별 마지막 실행 시간(ms)을 세션 상태 'run_timings'에 남김
+# (fragment 안의 위젯을 바꾸면 해당 fragment만 다시 실행되므로 그 시간이 곧 한 번의 재실행 비용)
+def record_run_time(name, started):
+    st.session_state.setdefault('run_timings', {})[name] = (time.perf_counter() - started) * 1000
+
+def timed_fragment(func):
+    """st.fragment + 실행 시간 기록"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            record_run_time(func.__name__, started)
+    return st.fragment(wrapper)
+
+
+# 종목별 상세 분석 (주가 그래프 + 머신러닝 예측, OpenAI 분석, 관련 기사)
+# 접힌 expander 안도 매 실행마다 그려지므로, 무거운 작업은 사용자가 종목을 열고 불러오기를 눌렀을 때만
+# 이 fragment 안에서 실행합니다 (버튼을 누르면 페이지 전체가 아니라 해당 종목만 다시 실행).
+@timed_fragment
+def render_stock_detail(row, snapshot_key, forecast_version, stock_forecast, feature_store):
+    detail_key = (snapshot_key, row['티커'])
+    loaded = st.session_state.setdefault('loaded_details', set())
+    if detail_key not in loaded:
+        if not st.button("📊 주가 예측 · AI 분석 · 관련 기사 불러오기", key=f"load_detail_{row['티커']}"):
+            st.caption("버튼을 누르면 이 종목의 주가 그래프와 OpenAI 분석을 불러옵니다.")
+            return
+        loaded.add(detail_key)
+
+    # 주가 변동 그래프 및 머신러닝 예측
+    st.markdown("---")
+    st.markdown("#### 📈 주가 변동 및 머신러닝 예측")
+
+    with st.spinner(f"{row['회사명']} 주가 데이터 및 예측 생성 중..."):
+        # 과거 주가 데이터 가져오기 (3개월로 단축)
+        hist_data = get_stock_history(row['티커'], row['국가'], period="3mo")
+
+        if hist_data is not None and len(hist_data) > 0:
+            # 후보 선정 시 계산한 앙상블 예측 경로 재사용 (추가 적합 없음)
+            if stock_forecast is not None and row['티커'] in stock_forecast['tickers']:
+                forecast_col = stock_forecast['tickers'].index(row['티커'])
+                future_dates = stock_forecast['future_dates']
+                predictions = stock_forecast['paths'][:, forecast_col]
+                if np.isnan(predictions).any():
+                    future_dates, predictions = predict_stock_price(hist_data, days_ahead=30)
+            else:
+                # 패널에 없는 종목은 이동평균 트렌드 기반 예측
+                future_dates, predictions = predict_stock_price(hist_data, days_ahead=30)
+
+            # 그래프 생성 (이동평균은 피처 저장소에서 읽음) - 같은 봉/예측이면 캐시된 figure 재사용
+            fig = get_stock_chart(
+                row['티커'],
+                row['회사명'],
+                row['국가'],
+                len(hist_data),
+                str(hist_data.index[-1]),
+                forecast_version,
+                hist_data,
+                future_dates,
+                predictions,
+                feature_series(feature_store, row['티커'], 'ma20') if feature_store else None
+            )
+            st.plotly_chart(fig, use_container_width=True)
+
+            # 예측 정보 표시
+            if predictions is not None and len(predictions) > 0:
+                current_price = row['현재가']
+                # 예측 경로는 현지 통화 기준이므로 변동률을 원화 현재가에 적용
+                predicted_price_30d = current_price * predictions[-1] / hist_data['Close'].iloc[-1]
+                price_change = predicted_price_30d - current_price
+                price_change_pct = (price_change / current_price) * 100
+
+                col_pred1, col_pred2, col_pred3 = st.columns(3)
+                with col_pred1:
+                    st.metric("현재 주가", f"{int(current_price):,}원")
+                with col_pred2:
+                    st.metric("30일 후 예측 주가", f"{int(predicted_price_30d):,}원", 
+                             f"{price_change_pct:+.2f}%")
+                with col_pred3:
+                    if price_change_pct > 0:
+                        st.success(f"📈 상승 예상: {int(price_change):,}원")
+                    else:
+                        st.error(f"📉 하락 예상: {int(abs(price_change)):,}원")
+
+                # 하락 예상 주식에 대한 경고
+                if price_change_pct < 0:
+                    if price_change_pct < -10:
+                        st.error(f"⚠️ **주의**: 이 종목은 30일 후 약 {abs(price_change_pct):.1f}% 하락 예상입니다. ({int(abs(price_change)):,}원 하락 예상) 투자 시 신중히 검토하세요.")
+                    elif price_change_pct < -5:
+                        st.warning(f"⚠️ **주의**: 이 종목은 30일 후 약 {abs(price_change_pct):.1f}% 하락 예상입니다. ({int(abs(price_change)):,}원 하락 예상) 투자 결정 시 주의가 필요합니다.")
+                    else:
+                        st.info(f"ℹ️ 이 종목은 30일 후 약 {abs(price_change_pct):.1f}% 하락 예상입니다. ({int(abs(price_change)):,}원 하락 예상) 다만 소폭 하락이므로 다른 지표와 함께 종합적으로 판단하세요.")
+                else:
+                    st.success(f"✅ 이 종목은 30일 후 약 {price_change_pct:.1f}% 상승 예상입니다. ({int(price_change):,}원 상승 예상)")
+
+                st.info("💡 예측은 드리프트, Holt 지수평활, AR, 이동평균 트렌드 모델을 검증 오차 기준으로 가중 결합한 앙상블 결과입니다. 실제 주가는 다양한 요인에 의해 변동할 수 있으므로 참고용으로만 사용하세요.")
+        else:
+            st.warning(f"⚠️ {row['회사명']}의 주가 데이터를 가져올 수 없습니다.")
+
+    # OpenAI 분석 (같은 스냅샷의 같은 종목은 성공한 분석을 재사용, 새로 만들 때는 도착하는 대로 두 섹션에 표시)
+    st.markdown("---")
+    st.markdown("#### 💡 추천 이유")
+    cache_note = st.empty()
+    reason_slot = st.empty()
+    st.markdown("---")
+    st.markdown("#### ⚠️ 주의해야 할 점")
+    caution_slot = st.empty()
+
+    analyses = st.session_state.setdefault('stock_analyses', {})
+    analysis = analyses.get(detail_key)
+    if analysis is None:
+        reason_slot.caption(f"{row['회사명']} 분석 생성 중...")
+        for analysis in stream_stock_analysis(stock_profile(row), snapshot_key):
+            if analysis.get('streaming'):
+                reason_slot.write(analysis['recommendation_reason'] + ("" if analysis['caution_points'] else " ▌"))
+                if analysis['caution_points']:
+                    caution_slot.write(analysis['caution_points'] + " ▌")
+        if analysis.get('available'):
+            analyses[detail_key] = analysis
+
+    if analysis.get('cached'):
+        source = "묶음 요청으로 만든 분석" if analysis.get('batched') else "만든 분석"
+        cache_note.caption(f"🗄️ 같은 지표로 {source}을 캐시에서 불러왔습니다 (토큰 {analysis['tokens']:,} 절약)")
+    reason_slot.write(analysis['recommendation_reason'])
+    caution_slot.write(analysis['caution_points'])
+
+    st.markdown("---")
+    st.markdown("#### 📰 관련 뉴스 기사")
+
+    # 관련 기사 검색
+    articles = search_news_articles(row['회사명'], row['티커'], row['국가'])
+
+    if articles:
+        for article in articles:
+            st.markdown(f"- [{article['title']}]({article['url']}) - {article['source']}")
     else:
-        return 1
-
-def get_liquidity_score(liquidity):
-    """유동성 점수 계산"""
-    liquidity_map = {
-        '매우높음': 5,
-        '높음': 4,
-        '중간': 3,
-        '낮음': 2,
-        '매우낮음': 1
-    }
-    return liquidity_map.get(liquidity, 0)
-
-def get_technical_score(rsi):
-    """기술적 지표 점수 계산 (RSI 기준)"""
-    # RSI 40-60: 최적 (5점), 30-40 또는 60-70: 양호 (4점), 그 외: 주의 (2-3점)
-    if 40 <= rsi <= 60:
-        return 5
-    elif 30 <= rsi < 40 or 60 < rsi <= 70:
-        return 4
-    elif 20 <= rsi < 30 or 70 < rsi <= 80:
-        return 3
+        st.info("관련 기사를 찾을 수 없습니다.")
+
+
+# 추천 종목 전체 AI 분석 - 분석이 없는 종목을 한꺼번에 동시 요청하고 도착하는 순서대로 채움
+# (결과는 종목별 상세 분석과 같은 세션 상태에 저장하므로 종목을 펼치면 바로 표시, 디스크 캐시에 있는 종목은 API 호출 없음)
+@timed_fragment
+def render_bulk_analysis(snapshot_key, df_recommended):
+    analyses = st.session_state.setdefault('stock_analyses', {})
+    pending = [row for _, row in df_recommended.iterrows() if (snapshot_key, row['티커']) not in analyses]
+    if not pending:
+        st.caption(f"✅ 추천 종목 {len(df_recommended)}개의 AI 분석이 준비되었습니다. 종목을 펼쳐 확인하세요.")
+    else:
+        batched = st.toggle("한 번의 요청으로 묶어 분석", key='batch_analysis',
+                            help="추천 종목을 JSON 형식 응답 요청 하나로 묶어 공통 지시문 토큰을 한 번만 씁니다. "
+                                 "요청 수와 토큰은 줄지만 응답 하나가 길어져 첫 결과가 늦게 도착합니다.")
+        if st.button(f"🤖 추천 종목 {len(pending)}개 AI 분석 한 번에 불러오기", key='analyze_all'):
+            api_key = get_openai_api_key()
+            if not api_key:
+                st.warning("⚠️ 사이드바에 OpenAI API 키를 입력하면 전체 분석을 불러올 수 있습니다.")
+            else:
+                load_bulk_analysis(api_key, snapshot_key, pending, analyses, batched)
+
+    stats = cache_stats()
+    if stats['hits'] + stats['misses'] > 0:
+        st.caption(f"🗄️ 분석 캐시 (모든 세션): 적중률 {stats['hit_rate']:.0%} ({stats['hits']:,}/{stats['hits'] + stats['misses']:,}) · "
+                   f"절약한 토큰 {stats['tokens_saved']:,} · 저장된 분석 {stats['entries']:,}개 ({stats['bytes'] / 1024:,.0f}KB)")
+
+
+def load_bulk_analysis(api_key, snapshot_key, pending, analyses, batched=False):
+    """분석 요청을 보내고 도착하는 대로 진행 상황 표시 (캐시 적중은 즉시 도착)"""
+    started = time.perf_counter()
+    progress = st.progress(0.0, text="분석 요청 중...")
+    arrived = st.container()
+    refresh = False
+    hits, tokens_saved, tokens_used, retried = 0, 0, 0, 0
+    stocks = [stock_profile(row) for row in pending]
+    results = analyze_stocks(api_key, stocks, snapshot_key=snapshot_key, batched=batched)
+    for count, (i, analysis) in enumerate(results, start=1):
+        row = pending[i]
+        detail_key = (snapshot_key, row['티커'])
+        if analysis['available']:
+            analyses[detail_key] = analysis
+            refresh |= detail_key in st.session_state.get('loaded_details', set())
+        if analysis.get('cached'):
+            hits += 1
+            tokens_saved += analysis['tokens']
+        else:
+            tokens_used += analysis['tokens']
+            retried += batched and not analysis.get('batched', False)
+        progress.progress(count / len(pending), text=f"{count}/{len(pending)} 완료 · {time.perf_counter() - started:.1f}초")
+        icon = '🗄️' if analysis.get('cached') else '✅' if analysis['available'] else '⚠️'
+        arrived.write(f"{icon} {row['회사명']} ({row['티커']})")
+    if hits:
+        st.caption(f"이번 요청: 캐시에서 {hits}개를 API 호출 없이 불러왔습니다 (토큰 {tokens_saved:,} 절약).")
+    if hits < len(pending):
+        st.caption(f"이번 요청: 토큰 {tokens_used:,} 사용" +
+                   (f" · 묶음 응답에서 빠진 {retried}개는 종목별로 다시 요청" if retried else ""))
+    # 이미 펼쳐 둔 종목이 분석을 새로 받았으면 한 번 전체를 다시 실행해 표시 (순위는 캐시에서 재사용)
+    if refresh:
+        st.rerun()
+
+
+# OpenAI API 키 입력 (사이드바) - 키를 입력해도 이 fragment만 다시 실행되어 추천 순위를 다시 계산하지 않음
+# 키는 세션 상태에 저장하고, 종목별 상세 분석 fragment가 실행될 때 읽습니다.
+@timed_fragment
+def render_api_key_settings():
+    previous_key = st.session_state.get('openai_api_key')
+    st.markdown("#### 🤖 OpenAI 설정 (선택사항)")
+    st.caption("종목별 상세 분석을 위해 OpenAI API 키를 입력하세요.")
+    
+    # OpenAI API 키 입력
+    api_key_input = st.text_input(
+        "OpenAI API 키",
+        type="password",
+        help="OpenAI API 키를 입력하면 종목별 상세 분석을 제공합니다.",
+        placeholder="sk-..."
+    )
+    
+    if api_key_input:
+        # 세션 상태에 저장
+        st.session_state['openai_api_key'] = api_key_input
+        st.success("✅ API 키가 설정되었습니다.")
     else:
-        return 2
-
-def normalize_score(series, reverse=False):
-    """점수를 0-5 범위로 정규화"""
-    if reverse:
-        # 역정규화 (낮을수록 좋은 경우)
-        max_val = series.max()
-        min_val = series.min()
-        if max_val == min_val:
-            return pd.Series([3.0] * len(series))
-        return 5 - ((series - min_val) / (max_val - min_val) * 4)
+        # 환경변수나 secrets에서 확인
+        env_key = os.getenv("OPENAI_API_KEY", "")
+        if not env_key:
+            try:
+                env_key = st.secrets.get("OPENAI_API_KEY", "")
+            except:
+                pass
+        
+        if env_key:
+            st.session_state['openai_api_key'] = env_key
+            st.info("ℹ️ 환경변수에서 API 키를 사용합니다.")
+        else:
+            st.warning("⚠️ API 키를 입력하면 종목별 상세 분석을 받을 수 있습니다.")
+
+    # 키 없이 불러 둔 종목이 있으면 한 번 전체를 다시 실행해 분석을 채움 (순위는 캐시에서 재사용)
+    missing = st.session_state.get('loaded_details', set()) - st.session_state.get('stock_analyses', {}).keys()
+    if st.session_state.get('openai_api_key') != previous_key and missing:
+        st.rerun()
+
+
+# 보유 종목 리밸런싱 - 보유 종목 표를 고쳐도 이 fragment만 다시 실행 (추천 종목/투자 금액은 마지막 전체 실행 값)
+@timed_fragment
+def render_rebalancing(snapshot, df_recommended, investment_amount):
+    with st.expander("현재 보유 종목을 입력하면 추천 포트폴리오로 옮겨가기 위한 최소 거래를 계산합니다"):
+        st.caption("비중 차이가 2%p 이하인 종목은 매도하지 않고, 이번 달 투자 금액과 매도 대금을 부족한 종목에 배분합니다. 수수료·거래세·환전 비용을 반영합니다.")
+        holdings_input = st.data_editor(
+            pd.DataFrame({'티커': pd.Series(dtype=str), '보유주수': pd.Series(dtype=int)}),
+            num_rows="dynamic",
+            use_container_width=True,
+            key='holdings_editor'
+        )
+        holdings_input = holdings_input.dropna()
+        if len(holdings_input) > 0:
+            tickers = snapshot['tickers']
+            ticker_index = {ticker: i for i, ticker in enumerate(tickers)}
+            unknown = [t for t in holdings_input['티커'] if t not in ticker_index]
+            if unknown:
+                st.warning(f"⚠️ 알 수 없는 티커는 제외했습니다: {', '.join(map(str, unknown))}")
+            holdings = np.zeros(len(tickers), dtype=np.int64)
+            for ticker, shares in zip(holdings_input['티커'], holdings_input['보유주수']):
+                if ticker in ticker_index:
+                    holdings[ticker_index[ticker]] += max(int(shares), 0)
+        
+            target_weights = target_weight_vector(tickers, df_recommended['티커'], df_recommended['매수가능금액'])
+            plan = plan_rebalance(holdings, target_weights, snapshot['prices'], investment_amount, snapshot['countries'])
+        
+            traded = np.flatnonzero((plan['sell_shares'][0] > 0) | (plan['buy_shares'][0] > 0))
+            if len(traded) == 0:
+                st.success("✅ 현재 보유 종목이 목표 비중과 충분히 가깝습니다. 이번 달에는 거래가 필요 없습니다.")
+            else:
+                df_trades = pd.DataFrame({
+                    '회사명': snapshot['stocks']['회사명'].to_numpy()[traded],
+                    '티커': tickers[traded],
+                    '현재 보유': holdings[traded],
+                    '매도': plan['sell_shares'][0][traded],
+                    '매수': plan['buy_shares'][0][traded],
+                    '거래 후 보유': plan['holdings_after'][0][traded],
+                    '목표 비중(%)': (target_weights[traded] * 100).round(1),
+                })
+                st.dataframe(df_trades, use_container_width=True, hide_index=True)
+                col_rb1, col_rb2, col_rb3, col_rb4 = st.columns(4)
+                col_rb1.metric("매도 금액", f"{plan['sell_amount'][0]:,.0f}원")
+                col_rb2.metric("매수 금액", f"{plan['buy_amount'][0]:,.0f}원")
+                col_rb3.metric("예상 거래 비용", f"{plan['cost'][0]:,.0f}원")
+                col_rb4.metric("남는 현금", f"{plan['cash_after'][0]:,.0f}원")
+
+
+# 적립식 투자 시뮬레이션 - 기간/이율을 바꿔도 이 fragment만 다시 실행
+@timed_fragment
+def render_dca_simulation(snapshot_key, price_panel, df_recommended, savings_amount, investment_amount):
+    col_sim1, col_sim2 = st.columns(2)
+    with col_sim1:
+        sim_years = st.slider("시뮬레이션 기간 (년)", min_value=1, max_value=30, value=10, key='sim_years')
+    with col_sim2:
+        deposit_rate = st.number_input("예적금 연 이율 (%)", min_value=0.0, max_value=10.0,
+                                       value=DEFAULT_DEPOSIT_RATE * 100, step=0.1, key='deposit_rate') / 100
+
+    if price_panel is None or price_panel.empty:
+        st.info("가격 이력을 불러오지 못해 시뮬레이션을 표시할 수 없습니다.")
     else:
-        # 정규화 (높을수록 좋은 경우)
-        max_val = series.max()
-        min_val = series.min()
-        if max_val == min_val:
-            return pd.Series([3.0] * len(series))
-        return 1 + ((series - min_val) / (max_val - min_val) * 4)
+        # 포트폴리오에 쓰지 못한 투자 금액은 예적금으로 적립한다고 가정
+        monthly_savings = savings_amount + investment_amount - df_recommended['매수가능금액'].sum()
+        simulation = get_dca_simulation(
+            snapshot_key, tuple(df_recommended['티커']), tuple(df_recommended['매수가능금액'].astype(float)),
+            float(monthly_savings), sim_years, deposit_rate, price_panel
+        )
+        st.plotly_chart(create_dca_fan_chart(simulation), use_container_width=True)
+        final = {p: values[-1] for p, values in simulation['percentiles'].items()}
+        col_f1, col_f2, col_f3, col_f4 = st.columns(4)
+        col_f1.metric("누적 납입액", f"{simulation['contributed'][-1]:,.0f}원")
+        col_f2.metric("비관적 (하위 5%)", f"{final[5]:,.0f}원")
+        col_f3.metric("중앙값", f"{final[50]:,.0f}원")
+        col_f4.metric("낙관적 (상위 5%)", f"{final[95]:,.0f}원")
+        st.caption(f"예적금 적립 부분: {simulation['savings'][-1]:,.0f}원 · 변동성과 종목 간 상관은 최근 가격 이력 기준이며 실제 수익을 보장하지 않습니다.")
+
+
+# 내 포트폴리오 손익 + 가격 알림 - 장부 이름을 함께 쓰므로 하나의 fragment로 묶음
+# 매수 기록/알림 추가 버튼을 눌러도 추천 순위와 다른 섹션은 다시 그리지 않음
+@timed_fragment
+def render_portfolio_tracking(snapshot, price_panel, df_recommended):
+    # 보유 종목 손익 추적 (추천 포트폴리오를 실제로 매수한 경우)
+    st.markdown("---")
+    st.markdown("#### 💼 내 포트폴리오 손익")
+    ledger, ledger_lock = get_ledger(), get_ledger_lock()
+    col_l1, col_l2 = st.columns([3, 1])
+    with col_l1:
+        ledger_user = st.text_input("장부 이름", value="기본", key='ledger_user', help="같은 이름으로 기록한 매수 내역을 모아 손익을 계산합니다")
+    with col_l2:
+        st.write("")
+        if st.button("추천 포트폴리오 매수 기록", key='record_portfolio'):
+            bought = df_recommended[df_recommended['매수가능주수'] > 0]
+            with ledger_lock:
+                record_trades(ledger, [ledger_user] * len(bought), bought['티커'], bought['매수가능주수'],
+                              bought['현재가'], countries=bought['국가'])
+                save_ledger(ledger)
+            st.success(f"✅ {len(bought)}개 종목 매수를 기록했습니다.")
+
+    # 가격 패널의 새 봉만 증분 평가 (이미 평가한 날짜는 건너뜀)
+    fx_series, fx_rate = get_fx_series(), get_exchange_rate()
+    with ledger_lock:
+        if price_panel is not None and not price_panel.empty and len(ledger['tickers']) > 0:
+            bar_dates, bars = price_bars(ledger, price_panel, fx_series, default_fx=fx_rate)
+            last_mark = pd.Timestamp(ledger['mark_date']) if ledger['mark_date'] is not None else None
+            new_bars = np.flatnonzero(bar_dates > last_mark) if last_mark is not None else [len(bar_dates) - 1]
+            for i in new_bars:
+                mark_increment(ledger, bars[i], bar_dates[i])
+            if len(new_bars) > 0:
+                save_ledger(ledger)
+
+        summary = user_summary(ledger, ledger_user)
+        positions = user_positions(ledger, ledger_user) if summary is not None else None
+    if summary is None:
+        st.info("아직 기록된 매수 내역이 없습니다. 추천 포트폴리오를 매수했다면 위 버튼으로 기록하세요.")
+    else:
+        col_p1, col_p2, col_p3, col_p4 = st.columns(4)
+        col_p1.metric("평가금액", f"{summary['value']:,.0f}원")
+        col_p2.metric("평가손익", f"{summary['unrealized']:,.0f}원",
+                      f"{summary['unrealized'] / summary['cost'] * 100:+.2f}%" if summary['cost'] > 0 else None)
+        col_p3.metric("직전 평가 대비", f"{summary['pnl_change']:+,.0f}원")
+        col_p4.metric("실현손익", f"{summary['realized']:,.0f}원")
+        st.dataframe(positions.round(2), use_container_width=True, hide_index=True)
+        if summary['mark_date'] is not None:
+            st.caption(f"평가 기준일: {pd.Timestamp(summary['mark_date']):%Y-%m-%d} (가격 패널 종가, 미국 주식은 같은 날 환율 적용)")
+
+    # 가격 알림 (스냅샷이 갱신될 때마다 모든 사용자의 알림을 한 번에 평가)
+    st.markdown("---")
+    st.markdown("#### 🔔 가격 알림")
+    alert_book, alert_lock = get_alert_book(), get_alert_lock()
+    with alert_lock:
+        if alert_book['evaluated_key'] != snapshot['key'] and len(alert_book['tickers']) > 0:
+            fired = evaluate_alerts(alert_book, snapshot['tickers'], snapshot['prices'], snapshot['change_pct'])
+            emit_alerts(fired_records(alert_book, fired))
+            alert_book['evaluated_key'] = snapshot['key']
+            save_alert_book(alert_book)
+
+    st.caption(f"'{ledger_user}' 이름으로 알림을 등록합니다. 새 시세가 들어올 때마다 기준가 돌파나 30일 예측의 하락 전환을 확인합니다.")
+    alert_options = {f"{r['회사명']} ({r['티커']})": r for _, r in df_recommended.iterrows()}
+    col_a1, col_a2, col_a3, col_a4 = st.columns([2, 1.5, 1.5, 1])
+    with col_a1:
+        alert_stock = alert_options[st.selectbox("종목", list(alert_options), key='alert_stock')]
+    with col_a2:
+        alert_kind = st.selectbox("조건", list(ALERT_LABELS), format_func=ALERT_LABELS.get, key='alert_kind')
+    with col_a3:
+        alert_price = st.number_input("기준가 (원)", min_value=0.0, value=float(int(alert_stock['현재가'])), step=1000.0,
+                                      disabled=alert_kind == 'forecast_negative', key='alert_price')
+    with col_a4:
+        st.write("")
+        if st.button("알림 추가", key='add_alert'):
+            with alert_lock:
+                add_alerts(alert_book, [ledger_user], [alert_stock['티커']], [alert_kind], [alert_price])
+                # 새 종목의 현재 상태를 기준점으로 기록 (같은 스냅샷이면 이미 있던 알림은 울리지 않고,
+                # 장부가 아직 이 스냅샷으로 평가되지 않았다면 그 사이 울린 알림도 함께 기록)
+                fired = evaluate_alerts(alert_book, snapshot['tickers'], snapshot['prices'], snapshot['change_pct'])
+                emit_alerts(fired_records(alert_book, fired))
+                alert_book['evaluated_key'] = snapshot['key']
+                save_alert_book(alert_book)
+            st.success("✅ 알림을 추가했습니다.")
+
+    with alert_lock:
+        df_alerts = user_alerts(alert_book, ledger_user)
+    recent_alerts = read_fired_alerts(ledger_user, limit=10)
+    if len(df_alerts) > 0:
+        st.dataframe(df_alerts, use_container_width=True, hide_index=True)
+    for record in recent_alerts:
+        label = ALERT_LABELS[record['kind']]
+        if record['kind'] == 'forecast_negative':
+            st.warning(f"🔔 {record['time']} · {record['ticker']} {label}")
+        else:
+            st.warning(f"🔔 {record['time']} · {record['ticker']} {label}: 기준가 {record['threshold']:,.0f}원, 현재가 {record['price']:,.0f}원")
+
+
+# 리포트 내보내기 - 버튼을 누를 때만 묶음을 만들어 내용 해시로 저장 (같은 결과는 같은 파일을 재사용)
+# 불러온 OpenAI 분석은 누르는 시점의 세션 상태에서 읽으므로 상세 분석을 연 뒤 다시 만들면 함께 담김
+@timed_fragment
+def render_report_export(snapshot_key, inputs, weights, df_recommended, figures):
+    st.caption("현재 추천 결과(입력, 가중치, 추천 종목, 차트, 불러온 OpenAI 분석, 뉴스 링크)를 HTML 한 파일과 JSON 데이터로 저장합니다. "
+               "리포트를 여는 쪽은 대시보드를 다시 실행하거나 시세/API를 조회할 필요가 없습니다.")
+    if st.button("📤 리포트 만들기", key='export_report'):
+        tickers = set(df_recommended['티커'])
+        analyses = {ticker: analysis for (key, ticker), analysis in st.session_state.get('stock_analyses', {}).items()
+                    if key == snapshot_key and ticker in tickers}
+        news = {row['티커']: search_news_articles(row['회사명'], row['티커'], row['국가'])
+                for _, row in df_recommended.iterrows()}
+        bundle = build_report(snapshot_key, inputs, weights, df_recommended, figures, analyses, news)
+        st.session_state['report_export'] = export_report(bundle)
+
+    exported = st.session_state.get('report_export')
+    if exported is None:
+        return
+    if exported['created']:
+        st.success(f"✅ 리포트 {exported['key']}를 저장했습니다.")
+    else:
+        st.info(f"ℹ️ 같은 내용의 리포트 {exported['key']}가 이미 있어 그대로 사용합니다.")
+    # 파일 내용은 다운로드를 누를 때만 읽음 (재실행마다 수 MB를 브라우저로 보내지 않음)
+    col_r1, col_r2 = st.columns(2)
+    with col_r1:
+        st.download_button("HTML 리포트 받기", partial(report_bytes, exported['key'], 'html'),
+                           file_name=f"portfolio_report_{exported['key']}.html", mime="text/html",
+                           on_click='ignore', key='download_report_html')
+    with col_r2:
+        st.download_button("JSON 데이터 받기", partial(report_bytes, exported['key'], 'json'),
+                           file_name=f"portfolio_report_{exported['key']}.json", mime="application/json",
+                           on_click='ignore', key='download_report_json')
+
+
+# 전체 종목 표 열과 표시 형식 (조건식 검색은 추세선을 뺀 열로)
+UNIVERSE_COLUMNS = ['티커', '회사명', '국가', '섹터', '최근수익률(%)', '변동성', 'PER', '배당률(%)',
+                    '시가총액규모', '유동성', '성장률(%)', 'RSI', '뉴스감성(1~5)', '현재가',
+                    '종합점수', '매수가능주수']
+UNIVERSE_COLUMN_CONFIG = {
+    '최근수익률(%)': st.column_config.NumberColumn(format="%.1f"),
+    'PER': st.column_config.NumberColumn(format="%.1f"),
+    '배당률(%)': st.column_config.NumberColumn(format="%.2f"),
+    '성장률(%)': st.column_config.NumberColumn(format="%.1f"),
+    '뉴스감성(1~5)': st.column_config.NumberColumn(format="%.1f"),
+    '현재가': st.column_config.NumberColumn(format="%,d원"),
+    '종합점수': st.column_config.NumberColumn(format="%.2f"),
+    '매수가능주수': st.column_config.NumberColumn(format="%,d"),
+    '3개월 추이': st.column_config.LineChartColumn(help="최근 3개월 종가 추이 (현지 통화)"),
+}
+
+# 투자성향별 포트폴리오 표 (숫자 열은 숫자 그대로 정렬되도록 표시 형식만 지정)
+FRONTIER_COLUMN_CONFIG = {
+    '투자금액': st.column_config.NumberColumn(format="%,d원"),
+    '투자된금액': st.column_config.NumberColumn(format="%,d원"),
+    '예상수익률(%)': st.column_config.NumberColumn(format="%.2f"),
+    '예상변동성(%)': st.column_config.NumberColumn(format="%.2f"),
+}
+
+# 전체 종목 정보 - 펼쳤을 때만 표를 만들고 (접혀 있으면 월급 등을 바꿔도 그리지 않음),
+# 조건식을 입력하면 이 fragment만 다시 실행. 표는 보이는 행만 브라우저로 보냄 (lazy, 종목이 수천 개여도 정렬/스크롤 유지)
+@timed_fragment
+def render_universe_table(snapshot, risk_tolerance, investment_amount, price_panel):
+    with st.expander("📌 전체 종목 정보 보기", key='show_universe', on_change='rerun') as universe:
+        if not universe.open:
+            return
+        query = st.text_input(
+            "🔎 조건으로 종목 찾기",
+            value="",
+            placeholder="예: PER < 15 and 배당률 > 2 and 국가 == '한국'",
+            help="숫자 열은 <, <=, >, >=, ==, != / 문자열 열은 ==, !=, in [...] 조건을 and, or, not으로 조합합니다. "
+                 "열 이름의 괄호 단위는 생략할 수 있습니다 (배당률(%) → 배당률).",
+            key='screen_query'
+        )
+        df_all = get_universe_table(snapshot['key'], risk_tolerance, investment_amount, snapshot, price_panel)
+        if query.strip():
+            try:
+                screen_index = get_screen_index(snapshot['key'], risk_tolerance, investment_amount, df_all[UNIVERSE_COLUMNS])
+                df_all = df_all[screen(screen_index, query)]
+                st.caption(f"조건에 맞는 종목: {len(df_all)}개 / 전체 {len(snapshot['tickers'])}개")
+            except ValueError as e:
+                st.error(f"조건식 오류: {e}")
+        st.dataframe(
+            df_all,
+            use_container_width=True,
+            hide_index=True,
+            column_config=UNIVERSE_COLUMN_CONFIG,
+            lazy=True
+        )
+
 
 # 메인 타이틀
 st.title("📊 주린이 전용 포트폴리오 추천 대시보드")
@@ -789,6 +1072,13 @@ with st.spinner("📊 S&P 500과 KOSPI 200 종목 데이터를 불러오는 중.
     df_stocks = get_stock_data()
     st.success(f"✅ {len(df_stocks)}개 종목 데이터 로드 완료!")
 
+# 종목 전체의 가격 패널로 스냅샷 계산 (투자 금액/투자성향과 무관하므로 입력이 바뀌어도 재사용)
+price_panel = get_price_panel(tuple(df_stocks['티커']), tuple(df_stocks['국가']), period="3mo")
+snapshot = get_snapshot(df_stocks, price_panel)
+feature_store = load_feature_store(snapshot['feature_key'], price_panel) if snapshot['feature_key'] else None
+stock_forecast = snapshot['forecast']
+risk_model = snapshot['risk_model']
+
 # 사이드바에 입력 UI
 with st.sidebar:
     st.header("💰 투자 정보 입력")
@@ -835,36 +1125,22 @@ with st.sidebar:
     
     st.markdown(f"**현재 투자성향:** {risk_label}")
     
-    st.markdown("---")
-    st.markdown("#### 🤖 OpenAI 설정 (선택사항)")
-    st.caption("종목별 상세 분석을 위해 OpenAI API 키를 입력하세요.")
-    
-    # OpenAI API 키 입력
-    api_key_input = st.text_input(
-        "OpenAI API 키",
-        type="password",
-        help="OpenAI API 키를 입력하면 종목별 상세 분석을 제공합니다.",
-        placeholder="sk-..."
+    # 포트폴리오 구성 방식
+    portfolio_methods = {
+        '점수 가중 (기본)': 'score',
+        '최소분산': 'min_variance',
+        '리스크 패리티': 'risk_parity',
+        '평균-분산 (투자성향 반영)': 'mean_variance',
+    }
+    portfolio_method_label = st.selectbox(
+        "포트폴리오 구성 방식",
+        list(portfolio_methods),
+        help="점수 가중: 종합점수 기반 배분 / 그 외: 종목 간 수익률 공분산(Ledoit-Wolf 수축)을 반영한 비중"
     )
+    portfolio_method = portfolio_methods[portfolio_method_label]
     
-    if api_key_input:
-        # 세션 상태에 저장
-        st.session_state['openai_api_key'] = api_key_input
-        st.success("✅ API 키가 설정되었습니다.")
-    else:
-        # 환경변수나 secrets에서 확인
-        env_key = os.getenv("OPENAI_API_KEY", "")
-        if not env_key:
-            try:
-                env_key = st.secrets.get("OPENAI_API_KEY", "")
-            except:
-                pass
-        
-        if env_key:
-            st.session_state['openai_api_key'] = env_key
-            st.info("ℹ️ 환경변수에서 API 키를 사용합니다.")
-        else:
-            st.warning("⚠️ API 키를 입력하면 종목별 상세 분석을 받을 수 있습니다.")
+    st.markdown("---")
+    render_api_key_settings()
 
 # 잔액 계산
 balance = salary - expense
@@ -875,26 +1151,12 @@ if balance <= 0:
     st.stop()
 
 # 투자성향에 따른 예적금 등 안전상품/투자 배분 계산
-# 보수적 투자자일수록 안전상품 비율 높음
-if risk_tolerance <= 30:
-    # 보수적: 예적금 등 안전상품 60%, 투자 40%
-    savings_ratio = 0.6
-    investment_ratio = 0.4
-elif risk_tolerance <= 50:
-    # 중하위: 예적금 등 안전상품 40%, 투자 60%
-    savings_ratio = 0.4
-    investment_ratio = 0.6
-elif risk_tolerance <= 70:
-    # 중립: 예적금 등 안전상품 20%, 투자 80%
-    savings_ratio = 0.2
-    investment_ratio = 0.8
-else:
-    # 공격적: 예적금 등 안전상품 10%, 투자 90%
-    savings_ratio = 0.1
-    investment_ratio = 0.9
-
-savings_amount = int(balance * savings_ratio)
-investment_amount = int(balance * investment_ratio)
+# 보수적 투자자일수록 안전상품 비율 높음 (60% / 40% / 20% / 10%)
+split = split_balance(balance, risk_tolerance)
+savings_ratio = float(split['savings_ratio'])
+investment_ratio = float(split['investment_ratio'])
+savings_amount = int(split['savings_amount'])
+investment_amount = int(split['investment_amount'])
 
 # 메인 영역
 col1, col2, col3 = st.columns(3)
@@ -946,386 +1208,24 @@ with st.expander("ℹ️ 투자 추천 알고리즘 설명"):
     
     ### 🌐 포트폴리오 다양성
     
-    섹터와 국가 분산을 고려하여 다양성 보너스 점수를 추가합니다.
+    수익률 상관관계로 묶은 종목 군집과 국가 분산을 고려하여 다양성 보너스 점수를 추가합니다.
+    (섹터 이름이 달라도 함께 움직이는 종목은 같은 군집으로 봅니다)
     """)
 
 # ========== 종합 투자 의사결정 알고리즘 ==========
 # 투자성향에 따라 동적으로 가중치 조정
 
-# 1. 각 요소별 점수 계산
-df_stocks['안정성점수'] = df_stocks.apply(
-    lambda row: get_stability_score(row['변동성'], row['시가총액규모']), axis=1
-)
-df_stocks['밸류에이션점수'] = df_stocks['PER'].apply(get_valuation_score)
-df_stocks['유동성점수'] = df_stocks['유동성'].apply(get_liquidity_score)
-df_stocks['기술적지표점수'] = df_stocks['RSI'].apply(get_technical_score)
-
-# 2. 수익률, 배당률, 성장률 정규화 (0-5 점수로 변환)
-df_stocks['수익률점수'] = normalize_score(df_stocks['최근수익률(%)'])
-df_stocks['배당률점수'] = normalize_score(df_stocks['배당률(%)'])
-df_stocks['성장률점수'] = normalize_score(df_stocks['성장률(%)'])
-
-# 3. 투자성향에 따른 동적 가중치 계산
-risk_ratio = risk_tolerance / 100  # 0~1 범위
-
-# 보수적 투자자 (risk_ratio 낮음): 안정성, 배당률, 유동성, 밸류에이션 중시
-# 공격적 투자자 (risk_ratio 높음): 수익률, 성장률, 기술적 지표 중시
-# 중립 투자자: 균형잡힌 접근
-
-# 기본 가중치 (투자성향에 따라 조정)
-weights = {
-    '안정성': max(0.2, 0.4 - (risk_ratio * 0.3)),  # 0.4 ~ 0.1
-    '수익률': 0.15 + (risk_ratio * 0.15),  # 0.15 ~ 0.3
-    '성장률': 0.1 + (risk_ratio * 0.15),  # 0.1 ~ 0.25
-    '밸류에이션': max(0.1, 0.2 - (risk_ratio * 0.1)),  # 0.2 ~ 0.1
-    '배당률': max(0.05, 0.15 - (risk_ratio * 0.1)),  # 0.15 ~ 0.05
-    '뉴스감성': 0.15,  # 고정
-    '유동성': 0.1,  # 고정
-    '기술적지표': 0.05 + (risk_ratio * 0.1)  # 0.05 ~ 0.15
-}
-
-# 가중치 정규화 (합이 1이 되도록)
-total_weight = sum(weights.values())
-weights = {k: v / total_weight for k, v in weights.items()}
-
-# 4. 종합 점수 계산
-df_stocks['종합점수'] = (
-    weights['안정성'] * df_stocks['안정성점수'] +
-    weights['수익률'] * df_stocks['수익률점수'] +
-    weights['성장률'] * df_stocks['성장률점수'] +
-    weights['밸류에이션'] * df_stocks['밸류에이션점수'] +
-    weights['배당률'] * df_stocks['배당률점수'] +
-    weights['뉴스감성'] * df_stocks['뉴스감성(1~5)'] +
-    weights['유동성'] * df_stocks['유동성점수'] +
-    weights['기술적지표'] * df_stocks['기술적지표점수']
-)
-
-# 5. 포트폴리오 다양성 보너스 (섹터/국가 분산)
-# 이미 선택된 종목과 다른 섹터/국가면 보너스 점수 추가
-df_stocks['다양성보너스'] = 0.0
-# 이 부분은 추천 종목을 선택한 후에 적용 (아래에서 처리)
-
-# 총점 = 종합점수 + 다양성보너스
-df_stocks['총점'] = df_stocks['종합점수']
-
-# 매수 가능 주수 계산 (투자 금액 기준)
-df_stocks['매수가능주수'] = (investment_amount / df_stocks['현재가']).astype(int)
-df_stocks['매수가능금액'] = df_stocks['매수가능주수'] * df_stocks['현재가']
-
-# 주수 1 이상만 필터링
-df_candidates = df_stocks[df_stocks['매수가능주수'] >= 1].copy()
-
-# 주가 예측 점수 추가 (상위 30개 종목만 빠르게 예측하여 하락 예상 주식 필터링)
-# 로딩 시간 단축을 위해 상위 종목만 예측
-df_candidates['예측변동률'] = 0.0
-df_candidates['예측점수'] = 0.0
-
-# 상위 30개 종목만 예측 (더 빠른 처리)
-top_candidates = df_candidates.head(30).copy()
-
-if len(top_candidates) > 0:
-    for idx, row in top_candidates.iterrows():
-        try:
-            # 머신러닝 기반 예측 사용
-            hist_data = get_stock_history(row['티커'], row['국가'], period="3mo")
-            current_price = row['현재가']
-            
-            if hist_data is not None and len(hist_data) >= 30:
-                # 머신러닝 예측 수행
-                future_dates, predictions = predict_stock_price(hist_data, days_ahead=30)
-                
-                if predictions is not None and len(predictions) > 0:
-                    # 30일 후 예측 주가
-                    predicted_price_30d = predictions[-1]
-                    
-                    # 최종 안전장치: 예측값이 현재가의 50% 미만 또는 200% 초과인 경우 재계산
-                    if predicted_price_30d < current_price * 0.5 or predicted_price_30d > current_price * 2.0:
-                        # 비현실적인 예측값인 경우, 보수적인 트렌드 기반 예측으로 대체
-                        recent_prices = hist_data['Close'].tail(20).values
-                        if len(recent_prices) >= 10:
-                            ma_short = np.mean(recent_prices[-5:])
-                            ma_long = np.mean(recent_prices[-10:])
-                            if ma_long > 0:
-                                trend = (ma_short - ma_long) / ma_long
-                                # 트렌드를 매우 보수적으로 반영 (최대 ±15% 제한)
-                                trend = np.clip(trend, -0.15, 0.15)
-                                predicted_price_30d = current_price * (1 + trend * 0.5)  # 50%만 반영
-                            else:
-                                # 예측 실패 시 약한 상승 예상으로 설정
-                                predicted_price_30d = current_price * 1.01
-                        else:
-                            predicted_price_30d = current_price * 1.01
-                    
-                    # 예측 변동률 계산
-                    price_change_pct = ((predicted_price_30d - current_price) / current_price) * 100
-                    
-                    # 비현실적인 변동률 엄격하게 제한 (±25% 이내로 제한)
-                    # 30일 기준으로 ±25%는 현실적인 범위
-                    price_change_pct = np.clip(price_change_pct, -25, 25)
-                    
-                    df_candidates.at[idx, '예측변동률'] = price_change_pct
-                    
-                    # 예측 점수 계산
-                    if price_change_pct > 15:
-                        df_candidates.at[idx, '예측점수'] = 5.0
-                    elif price_change_pct > 10:
-                        df_candidates.at[idx, '예측점수'] = 4.0
-                    elif price_change_pct > 5:
-                        df_candidates.at[idx, '예측점수'] = 3.0
-                    elif price_change_pct > 2:
-                        df_candidates.at[idx, '예측점수'] = 2.0
-                    elif price_change_pct > 0:
-                        df_candidates.at[idx, '예측점수'] = 1.0
-                    else:
-                        df_candidates.at[idx, '예측점수'] = -10.0
-                else:
-                    # 예측 실패 시 보수적인 트렌드 기반 예측으로 대체
-                    recent_prices = hist_data['Close'].tail(20).values
-                    if len(recent_prices) >= 10:
-                        ma_short = np.mean(recent_prices[-5:])
-                        ma_long = np.mean(recent_prices[-10:])
-                        if ma_long > 0:
-                            trend = (ma_short - ma_long) / ma_long
-                            # 트렌드를 매우 보수적으로 반영 (최대 ±15% 제한)
-                            trend = np.clip(trend, -0.15, 0.15)
-                            predicted_price_30d = current_price * (1 + trend * 0.5)  # 50%만 반영
-                            price_change_pct = ((predicted_price_30d - current_price) / current_price) * 100
-                            price_change_pct = np.clip(price_change_pct, -25, 25)  # ±25% 제한
-                            df_candidates.at[idx, '예측변동률'] = price_change_pct
-                            
-                            if price_change_pct > 0:
-                                df_candidates.at[idx, '예측점수'] = max(0.5, price_change_pct / 10)
-                            else:
-                                df_candidates.at[idx, '예측점수'] = -10.0
-                        else:
-                            # 예측 불가 - 약한 상승 예상으로 설정
-                            df_candidates.at[idx, '예측변동률'] = 1.0
-                            df_candidates.at[idx, '예측점수'] = 0.5
-                    else:
-                        # 예측 불가 - 약한 상승 예상으로 설정
-                        df_candidates.at[idx, '예측변동률'] = 1.0
-                        df_candidates.at[idx, '예측점수'] = 0.5
-            else:
-                # 데이터 부족 시 약한 상승 예상으로 설정
-                df_candidates.at[idx, '예측변동률'] = 1.0
-                df_candidates.at[idx, '예측점수'] = 0.5
-        except Exception as e:
-            # 예외 발생 시 약한 상승 예상으로 설정
-            df_candidates.at[idx, '예측변동률'] = 1.0
-            df_candidates.at[idx, '예측점수'] = 0.5
-
-# 수익성과 안정성을 모두 고려한 종합 점수 계산
-# 머신러닝 예측 결과(상승/하락 예상)를 높은 가중치로 반영
-df_candidates['수익성점수'] = df_candidates['예측점수'].apply(lambda x: max(0, x))  # 양수만 (상승 예상)
-df_candidates['안정성점수_종합'] = df_candidates['안정성점수']  # 기존 안정성 점수
-
-# 수익성과 안정성의 균형을 고려한 최종 점수
-# 머신러닝 예측 결과(수익성) 50%, 안정성 25%, 기존 종합점수 25%
-# 상승 예상 정도가 높을수록 더 높은 점수
-df_candidates['최종종합점수'] = (
-    df_candidates['종합점수'] * 0.25 +  # 기존 종합점수 25%
-    df_candidates['수익성점수'] * 0.50 +  # 예측 수익성 50% (매우 높은 가중치)
-    df_candidates['안정성점수_종합'] * 0.25  # 안정성 25%
-)
-
-# 점수 순으로 정렬 (수익성과 안정성 모두 고려)
-# 1순위: 최종종합점수 (수익성+안정성 종합)
-# 2순위: 예측변동률 (수익률 예상)
-df_candidates = df_candidates.sort_values(
-    ['최종종합점수', '예측변동률'], 
-    ascending=[False, False]
-).reset_index(drop=True)
-
-# 하락 예상 주식 완전 제외 (상승 예상 종목만 추천)
-# 1. 예측변동률이 0보다 큰 종목만 추천 (상승 예상만)
-# 2. 예측점수가 음수인 종목 제외
-df_candidates = df_candidates[
-    (df_candidates['예측변동률'] > 0) |  # 상승 예상
-    ((df_candidates['예측변동률'] == 0) & (df_candidates['예측점수'] >= 0))  # 예측 없거나 중립 (하락 예상 아님)
-].copy()
-
-# 하락 예상 종목은 완전히 제외
-df_candidates = df_candidates[df_candidates['예측점수'] >= 0].copy()
-
-# 예측 데이터가 없는 종목 처리 (예측 실패한 경우만 포함)
-if len(df_candidates) == 0:
-    # 예측이 모두 실패한 경우, 예측 없이 종합점수만으로 추천
-    df_candidates = df_stocks[df_stocks['매수가능주수'] >= 1].copy()
-    df_candidates['예측변동률'] = 0.0
-    df_candidates['예측점수'] = 0.0
-    df_candidates['수익성점수'] = 0.0
-    df_candidates['최종종합점수'] = df_candidates['종합점수']
-else:
-    # 예측이 없는 종목도 추가 (예측 실패한 경우만, 하락 예상은 제외)
-    no_prediction = df_stocks[
-        (df_stocks['매수가능주수'] >= 1) & 
-        (~df_stocks['티커'].isin(df_candidates['티커']))
-    ].copy()
-    if len(no_prediction) > 0:
-        no_prediction['예측변동률'] = 0.0
-        no_prediction['예측점수'] = 0.0
-        no_prediction['수익성점수'] = 0.0
-        no_prediction['최종종합점수'] = no_prediction['종합점수']
-        df_candidates = pd.concat([df_candidates, no_prediction], ignore_index=True)
-
-# 포트폴리오 다양성 고려한 최종 추천 (개선된 알고리즘)
-def select_diversified_portfolio(df, target_stocks=10, investment_amount=0):
-    """다양성을 고려한 포트폴리오 선택 - 15~20개 종목 추천"""
-    if len(df) == 0:
-        return pd.DataFrame()
-    
-    selected = []
-    selected_sectors = set()
-    selected_countries = set()
-    remaining_amount = investment_amount
-    
-    # 1단계: 균등 분배 + 점수 가중치 혼합 방식으로 종목별 투자 금액 할당
-    # 더 많은 종목을 선택하기 위해 각 종목에 할당하는 금액을 작게 설정
-    avg_investment_per_stock = investment_amount / target_stocks
-    
-    # 최소 투자 금액 설정 (더 낮게 설정하여 더 많은 종목 선택 가능)
-    min_investment_per_stock = investment_amount / (target_stocks * 3)  # 최소 금액을 낮춤
-    
-    # 점수 순으로 정렬된 종목들을 순회
-    for idx, row in df.iterrows():
-        if len(selected) >= target_stocks * 2:  # 여유있게 선택
-            break
-        
-        # 다양성 보너스 계산 (더 강하게 적용)
-        diversity_bonus = 0.0
-        if row['섹터'] not in selected_sectors:
-            diversity_bonus += 0.8  # 증가
-        if row['국가'] not in selected_countries:
-            diversity_bonus += 0.5  # 증가
-        
-        # 최종 점수 = 최종종합점수(수익성+안정성) + 다양성보너스
-        final_score = row.get('최종종합점수', row['종합점수']) + diversity_bonus
-        
-        # 수익성과 안정성을 모두 고려한 투자 금액 할당
-        # 수익률 예상이 높고 안정성도 좋은 종목에 더 많이 할당
-        base_allocation = avg_investment_per_stock * 0.6  # 기본 60%
-        
-        # 수익성 점수 기반 보너스 (40%)
-        revenue_score = row.get('수익성점수', 0)
-        max_revenue = df['수익성점수'].max() if '수익성점수' in df.columns else 1
-        revenue_bonus = (revenue_score / max_revenue if max_revenue > 0 else 0) * avg_investment_per_stock * 0.4
-        
-        allocated_amount = base_allocation + revenue_bonus
-        
-        # 최소 투자 금액 보장
-        allocated_amount = max(allocated_amount, min_investment_per_stock)
-        
-        # 남은 금액이 부족하면 조정
-        if allocated_amount > remaining_amount:
-            allocated_amount = remaining_amount
-        
-        # 매수 가능 주수 계산
-        buyable_shares = int(allocated_amount / row['현재가'])
-        if buyable_shares < 1:
-            # 1주도 못 사면 스킵
-            continue
-        
-        actual_investment = buyable_shares * row['현재가']
-        
-        # 선택된 종목 정보 저장
-        selected.append({
-            **row.to_dict(),
-            '다양성보너스': diversity_bonus,
-            '최종점수': final_score,
-            '매수가능주수': buyable_shares,
-            '매수가능금액': actual_investment
-        })
-        
-        selected_sectors.add(row['섹터'])
-        selected_countries.add(row['국가'])
-        remaining_amount -= actual_investment
-        
-        # 남은 금액이 최소 투자 금액보다 작으면 종료
-        if remaining_amount < min_investment_per_stock:
-            break
-    
-    # 2단계: 선택된 종목들을 최종점수 순으로 정렬
-    df_selected = pd.DataFrame(selected)
-    if len(df_selected) > 0:
-        df_selected = df_selected.sort_values('최종점수', ascending=False)
-        
-        # 3단계: 최소 8개 이상 선택하도록 보장
-        # 선택된 종목이 8개 미만이면, 남은 금액으로 추가 종목 선택 시도
-        if len(df_selected) < 8 and remaining_amount > 0:
-            # 남은 종목 중에서 추가 선택 (수익성과 안정성 모두 고려)
-            remaining_df = df[~df['티커'].isin(df_selected['티커'])]
-            # 수익성과 안정성을 모두 고려하여 정렬
-            if '최종종합점수' in remaining_df.columns and '예측변동률' in remaining_df.columns:
-                remaining_df = remaining_df.sort_values(
-                    ['최종종합점수', '예측변동률'], 
-                    ascending=[False, False]
-                )
-            else:
-                remaining_df = remaining_df.sort_values('종합점수', ascending=False)
-            
-            for idx, row in remaining_df.iterrows():
-                if len(df_selected) >= 10:
-                    break
-                
-                # 남은 금액으로 최대한 매수
-                buyable_shares = int(remaining_amount / row['현재가'])
-                if buyable_shares < 1:
-                    continue
-                
-                actual_investment = buyable_shares * row['현재가']
-                
-                # 다양성 보너스 재계산
-                diversity_bonus = 0.0
-                if row['섹터'] not in set(df_selected['섹터']):
-                    diversity_bonus += 0.8
-                if row['국가'] not in set(df_selected['국가']):
-                    diversity_bonus += 0.5
-                
-                final_score = row.get('최종종합점수', row['종합점수']) + diversity_bonus
-                
-                df_selected = pd.concat([
-                    df_selected,
-                    pd.DataFrame([{
-                        **row.to_dict(),
-                        '다양성보너스': diversity_bonus,
-                        '최종점수': final_score,
-                        '매수가능주수': buyable_shares,
-                        '매수가능금액': actual_investment
-                    }])
-                ], ignore_index=True)
-                
-                remaining_amount -= actual_investment
-                if remaining_amount < min_investment_per_stock:
-                    break
-        
-        # 최종적으로 10개 내외 선택 (또는 가능한 만큼)
-        max_final = min(12, len(df_selected))
-        min_final = min(8, len(df_selected))
-        
-        if len(df_selected) >= min_final:
-            df_selected = df_selected.head(max_final)
-        else:
-            df_selected = df_selected.head(len(df_selected))
-        
-        # 최종 정렬: 수익성(예측변동률)과 안정성을 모두 고려
-        # 1순위: 최종점수, 2순위: 예측변동률 (수익률 예상)
-        if '예측변동률' in df_selected.columns:
-            df_selected = df_selected.sort_values(
-                ['최종점수', '예측변동률'], 
-                ascending=[False, False]
-            )
-        else:
-            df_selected = df_selected.sort_values('최종점수', ascending=False)
-    
-    return df_selected.reset_index(drop=True)
+# 1. 요소별 점수 (안정성, 수익률, 성장률, 밸류에이션, 배당률, 뉴스감성, 유동성, 기술적 지표)는
+#    스냅샷에서 한 번 계산한 행렬을 재사용
+# 2. 투자성향에 따른 동적 가중치 계산
+# 보수적 투자자: 안정성, 배당률, 유동성, 밸류에이션 중시 / 공격적 투자자: 수익률, 성장률, 기술적 지표 중시
+weights = score_weights(risk_tolerance)
 
-# 최종 추천 포트폴리오 생성 (15~20개 종목 추천)
-df_recommended = select_diversified_portfolio(df_candidates, target_stocks=10, investment_amount=investment_amount)
-
-# 최종점수 순으로 정렬
-if len(df_recommended) > 0:
-    df_recommended = df_recommended.sort_values('최종점수', ascending=False).reset_index(drop=True)
-    df_recommended['총점'] = df_recommended['최종점수']  # 표시용
+# 3. 종합 점수 → 후보 종목 정렬: 머신러닝 예측(수익성) 50%, 안정성 25%, 기존 종합점수 25%로 최종 점수를 계산하고
+#    하락 예상 종목은 뒤로 보냄. 전체 종목을 정렬하지 않고 종목 청크마다 상위 후보만 골라 합침 (engine.stream_candidates)
+# 4. 포트폴리오 다양성 보너스 (상관 군집/국가 분산)는 추천 종목을 선택하면서 적용
+# 순위는 (스냅샷, 투자성향, 투자 금액, 구성 방식)에만 의존하므로 다른 입력으로 다시 실행될 때는 캐시를 재사용
+df_recommended = get_recommendation(snapshot['key'], risk_tolerance, investment_amount, portfolio_method, snapshot)
 
 # 결과 출력
 st.subheader("🎯 추천 포트폴리오")
@@ -1334,6 +1234,12 @@ if len(df_recommended) == 0:
     st.warning("⚠️ 투자 가능 금액으로 매수할 수 있는 종목이 없습니다.")
     st.stop()
 
+# 너무 비싸서 대체된 상위 후보 안내
+substituted = df_recommended[df_recommended['대체대상'] != '']
+if len(substituted) > 0:
+    st.caption("🔁 종목당 투자 한도(투자 금액의 20%)로 살 수 없는 상위 종목은 요소 점수가 가장 비슷한 종목으로 대체했습니다: "
+               + ", ".join(f"{r['대체대상']} → {r['회사명']}" for _, r in substituted.iterrows()))
+
 # 자산 배분 차트
 st.markdown("#### 💰 자산 배분")
 col1, col2 = st.columns(2)
@@ -1372,47 +1278,34 @@ with col2:
 st.markdown("#### 📋 추천 종목 목록")
 
 if len(df_recommended) > 0:
-    # 표시할 컬럼 선택 (예측 변동률 추가)
-    display_columns = ['회사명', '국가', '섹터', '총점', '최근수익률(%)', 'PER', '배당률(%)', 
-                       '현재가', '매수가능주수', '매수가능금액']
-    
-    # 예측 변동률이 있으면 추가
-    if '예측변동률' in df_recommended.columns:
-        display_columns.append('예측변동률')
-    
-    df_display = df_recommended[display_columns].copy()
-    df_display['총점'] = df_display['총점'].round(2)
-    df_display['최근수익률(%)'] = df_display['최근수익률(%)'].round(1)
-    df_display['PER'] = df_display['PER'].round(1)
-    df_display['배당률(%)'] = df_display['배당률(%)'].round(2)
-    df_display['현재가'] = df_display['현재가'].apply(lambda x: f"{int(x):,}원")
-    df_display['매수가능금액'] = df_display['매수가능금액'].apply(lambda x: f"{int(x):,}원")
-    
-    # 예측 변동률 포맷팅
-    if '예측변동률' in df_display.columns:
-        def format_prediction(pct):
-            if pd.isna(pct):
-                return "예측 불가"
-            if pct > 0:
-                return f"📈 +{pct:.1f}%"
-            elif pct < -5:
-                return f"⚠️ {pct:.1f}%"
-            else:
-                return f"📉 {pct:.1f}%"
-        
-        df_display['예측변동률'] = df_display['예측변동률'].apply(format_prediction)
-    
-    column_names = ['회사명', '국가', '섹터', '종합점수', '수익률(%)', 'PER', '배당률(%)', 
-                          '현재가', '매수 주수', '매수 금액']
-    if '예측변동률' in df_display.columns:
-        column_names.append('30일 예측')
-    
-    df_display.columns = column_names
-    
+    # 3개월 추세선과 30일 예측 변화 - 가격 패널의 추세선(스냅샷당 한 번)과 스냅샷 예측에서 바로 채움
+    # (종목별 시세 조회나 차트 생성 없이 전체 흐름을 보고, 필요한 종목만 아래에서 상세 차트를 불러옴)
+    sparklines = get_sparklines(snapshot['key'], price_panel, snapshot['tickers'])
+    positions = pd.Index(snapshot['tickers']).get_indexer(df_recommended['티커'])
+    df_recommended['3개월 추이'] = [sparklines[p] if p >= 0 else None for p in positions]
+    df_recommended['예측가격변화'] = df_recommended['현재가'] * df_recommended['예측변동률'] / 100
+
+    # 숫자 열은 그대로 두고 표시할 열/이름/형식만 지정 (정렬이 숫자 기준으로 동작)
     st.dataframe(
-        df_display,
+        df_recommended,
         use_container_width=True,
-        hide_index=True
+        hide_index=True,
+        column_order=['회사명', '국가', '섹터', '총점', '최근수익률(%)', 'PER', '배당률(%)',
+                      '현재가', '3개월 추이', '매수가능주수', '매수가능금액', '예측변동률', '예측가격변화'],
+        column_config={
+            '총점': st.column_config.NumberColumn('종합점수', format="%.2f"),
+            '최근수익률(%)': st.column_config.NumberColumn('수익률(%)', format="%.1f"),
+            'PER': st.column_config.NumberColumn(format="%.1f"),
+            '배당률(%)': st.column_config.NumberColumn(format="%.2f"),
+            '현재가': st.column_config.NumberColumn(format="%,d원"),
+            '매수가능주수': st.column_config.NumberColumn('매수 주수', format="%,d"),
+            '매수가능금액': st.column_config.NumberColumn('매수 금액', format="%,d원"),
+            '예측변동률': st.column_config.NumberColumn('30일 예측', format="%+.1f%%",
+                                                    help="앙상블 모델의 30일 후 예측 변동률 (빈 칸은 예측 불가)"),
+            '3개월 추이': st.column_config.LineChartColumn(help="최근 3개월 종가 추이 (현지 통화)"),
+            '예측가격변화': st.column_config.NumberColumn('30일 예측 변화', format="%+,d원",
+                                                      help="1주 기준 30일 후 예측 주가 - 현재가"),
+        }
     )
     
     # 추천 종목 정보 표시
@@ -1426,19 +1319,24 @@ if len(df_recommended) > 0:
     
     # 상세 점수 분석 (접을 수 있는 섹션)
     with st.expander("🔍 종목별 상세 점수 분석"):
-        detail_cols = ['회사명', '안정성점수', '수익률점수', '성장률점수', '밸류에이션점수', 
-                      '배당률점수', '뉴스감성(1~5)', '유동성점수', '기술적지표점수', '다양성보너스', '최종점수']
-        df_detail = df_recommended[detail_cols].copy()
-        for col in detail_cols[1:]:  # 회사명 제외
-            df_detail[col] = df_detail[col].round(2)
-        df_detail.columns = ['회사명', '안정성', '수익률', '성장률', '밸류에이션', '배당률', 
-                            '뉴스감성', '유동성', '기술지표', '다양성보너스', '최종점수']
-        st.dataframe(df_detail, use_container_width=True, hide_index=True)
+        detail_columns = {'안정성점수': '안정성', '수익률점수': '수익률', '성장률점수': '성장률',
+                          '밸류에이션점수': '밸류에이션', '배당률점수': '배당률', '뉴스감성(1~5)': '뉴스감성',
+                          '유동성점수': '유동성', '기술적지표점수': '기술지표', '다양성보너스': '다양성보너스',
+                          '최종점수': '최종점수'}
+        st.dataframe(
+            df_recommended,
+            use_container_width=True,
+            hide_index=True,
+            column_order=['회사명', *detail_columns],
+            column_config={column: st.column_config.NumberColumn(label, format="%.2f")
+                           for column, label in detail_columns.items()}
+        )
     
     # 종목별 상세 분석 (OpenAI + 기사 링크)
     st.markdown("---")
     st.markdown("#### 📊 종목별 상세 분석")
-    st.info("💡 각 종목을 클릭하여 OpenAI 기반 투자 분석과 관련 뉴스 기사를 확인하세요.")
+    st.info("💡 전체 흐름은 위 표의 3개월 추이와 30일 예측으로 확인하고, 자세히 볼 종목만 펼친 뒤 불러오기를 누르면 주가 예측 그래프, OpenAI 기반 투자 분석과 관련 뉴스 기사를 확인할 수 있습니다.")
+    render_bulk_analysis(snapshot['key'], df_recommended)
     
     for idx, row in df_recommended.iterrows():
         with st.expander(f"📈 {row['회사명']} ({row['티커']}) - 상세 분석"):
@@ -1457,119 +1355,27 @@ if len(df_recommended) > 0:
                 st.write(f"- 매수 가능 금액: {int(row['매수가능금액']):,}원")
                 st.write(f"- 종합 점수: {row['최종점수']:.2f}")
             
-            # 주가 변동 그래프 및 머신러닝 예측
+            # 비슷한 종목 (스냅샷의 최근접 이웃 인덱스)
             st.markdown("---")
-            st.markdown("#### 📈 주가 변동 및 머신러닝 예측")
-            
-            with st.spinner(f"{row['회사명']} 주가 데이터 및 예측 생성 중..."):
-                # 과거 주가 데이터 가져오기 (3개월로 단축)
-                hist_data = get_stock_history(row['티커'], row['국가'], period="3mo")
-                
-                if hist_data is not None and len(hist_data) > 0:
-                    # 간단한 트렌드 기반 예측 (빠른 처리)
-                    try:
-                        # 간단한 이동평균 기반 예측
-                        recent_prices = hist_data['Close'].tail(20).values
-                        if len(recent_prices) >= 10:
-                            ma_short = np.mean(recent_prices[-5:])
-                            ma_long = np.mean(recent_prices[-10:])
-                            trend = (ma_short - ma_long) / ma_long
-                            
-                            # 30일 예측 (간단한 트렌드 확장)
-                            last_price = hist_data['Close'].iloc[-1]
-                            future_dates = pd.date_range(
-                                start=hist_data.index[-1] + timedelta(days=1), 
-                                periods=30, 
-                                freq='D'
-                            )
-                            predictions = [last_price * (1 + trend * (i+1) * 0.1) for i in range(30)]
-                            predictions = np.array(predictions)
-                        else:
-                            future_dates, predictions = None, None
-                    except:
-                        # 실패 시 머신러닝 예측 시도 (더 빠른 설정)
-                        future_dates, predictions = predict_stock_price(hist_data, days_ahead=30)
-                    
-                    # 그래프 생성
-                    fig = create_stock_chart(
-                        row['티커'], 
-                        row['회사명'], 
-                        row['국가'],
-                        hist_data,
-                        future_dates,
-                        predictions
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
-                    
-                    # 예측 정보 표시
-                    if predictions is not None and len(predictions) > 0:
-                        current_price = row['현재가']
-                        predicted_price_30d = predictions[-1]
-                        price_change = predicted_price_30d - current_price
-                        price_change_pct = (price_change / current_price) * 100
-                        
-                        col_pred1, col_pred2, col_pred3 = st.columns(3)
-                        with col_pred1:
-                            st.metric("현재 주가", f"{int(current_price):,}원")
-                        with col_pred2:
-                            st.metric("30일 후 예측 주가", f"{int(predicted_price_30d):,}원", 
-                                     f"{price_change_pct:+.2f}%")
-                        with col_pred3:
-                            if price_change_pct > 0:
-                                st.success(f"📈 상승 예상: {int(price_change):,}원")
-                            else:
-                                st.error(f"📉 하락 예상: {int(abs(price_change)):,}원")
-                        
-                        # 하락 예상 주식에 대한 경고
-                        if price_change_pct < 0:
-                            if price_change_pct < -10:
-                                st.error(f"⚠️ **주의**: 이 종목은 30일 후 약 {abs(price_change_pct):.1f}% 하락 예상입니다. ({int(abs(price_change)):,}원 하락 예상) 투자 시 신중히 검토하세요.")
-                            elif price_change_pct < -5:
-                                st.warning(f"⚠️ **주의**: 이 종목은 30일 후 약 {abs(price_change_pct):.1f}% 하락 예상입니다. ({int(abs(price_change)):,}원 하락 예상) 투자 결정 시 주의가 필요합니다.")
-                            else:
-                                st.info(f"ℹ️ 이 종목은 30일 후 약 {abs(price_change_pct):.1f}% 하락 예상입니다. ({int(abs(price_change)):,}원 하락 예상) 다만 소폭 하락이므로 다른 지표와 함께 종합적으로 판단하세요.")
-                        else:
-                            st.success(f"✅ 이 종목은 30일 후 약 {price_change_pct:.1f}% 상승 예상입니다. ({int(price_change):,}원 상승 예상)")
-                        
-                        st.info("💡 예측은 머신러닝 알고리즘(Random Forest)을 사용하여 트렌드, 이동평균, 변동성 등을 종합적으로 고려한 결과입니다. 실제 주가는 다양한 요인에 의해 변동할 수 있으므로 참고용으로만 사용하세요.")
+            st.markdown("#### 🔗 비슷한 종목")
+            col_sim_factor, col_sim_corr = st.columns(2)
+            stock_names = snapshot['stocks']['회사명'].to_numpy()
+            with col_sim_factor:
+                st.markdown("**요소 점수가 비슷한 종목**")
+                neighbors = nearest_stocks(snapshot['similarity'], row['티커'], space='factor')
+                if neighbors is not None:
+                    for position, distance in zip(neighbors['positions'], neighbors['distances']):
+                        st.write(f"- {stock_names[position]} ({snapshot['tickers'][position]}) · 거리 {distance:.2f}")
+            with col_sim_corr:
+                st.markdown("**주가 움직임이 비슷한 종목**")
+                neighbors = nearest_stocks(snapshot['similarity'], row['티커'], space='correlation')
+                if neighbors is None:
+                    st.caption("가격 이력이 부족해 상관관계를 계산할 수 없습니다.")
                 else:
-                    st.warning(f"⚠️ {row['회사명']}의 주가 데이터를 가져올 수 없습니다.")
-            
-            # OpenAI 분석 생성
-            with st.spinner(f"{row['회사명']} 분석 생성 중..."):
-                analysis = get_stock_analysis(
-                    company_name=row['회사명'],
-                    ticker=row['티커'],
-                    country=row['국가'],
-                    sector=row['섹터'],
-                    per=row['PER'],
-                    dividend_rate=row['배당률(%)'],
-                    growth_rate=row['성장률(%)'],
-                    volatility=row['변동성'],
-                    news_sentiment=row['뉴스감성(1~5)']
-                )
-            
-            st.markdown("---")
-            st.markdown("#### 💡 추천 이유")
-            st.write(analysis['recommendation_reason'])
-            
-            st.markdown("---")
-            st.markdown("#### ⚠️ 주의해야 할 점")
-            st.write(analysis['caution_points'])
-            
-            st.markdown("---")
-            st.markdown("#### 📰 관련 뉴스 기사")
+                    for position, correlation in zip(neighbors['positions'], neighbors['correlation']):
+                        st.write(f"- {stock_names[position]} ({snapshot['tickers'][position]}) · 상관계수 {correlation:.2f}")
             
-            # 관련 기사 검색
-            articles = search_news_articles(row['회사명'], row['티커'], row['국가'])
-            
-            if articles:
-                for article in articles:
-                    st.markdown(f"- [{article['title']}]({article['url']}) - {article['source']}")
-            else:
-                st.info("관련 기사를 찾을 수 없습니다.")
-            
-            st.markdown("---")
+            render_stock_detail(row, snapshot['key'], snapshot['feature_key'], stock_forecast, feature_store)
 
 # 포트폴리오 비중 파이차트
 st.markdown("---")
@@ -1608,6 +1414,20 @@ fig.update_layout(
 
 st.plotly_chart(fig, use_container_width=True)
 
+# 보유 종목 기준 리밸런싱 (이미 투자 중인 경우 이번 달 매수/매도할 종목만 계산)
+st.markdown("---")
+st.markdown("#### 🔄 보유 종목 리밸런싱")
+render_rebalancing(snapshot, df_recommended, investment_amount)
+
+# 적립식 투자 시뮬레이션 (이번 달 계획을 매달 반복했을 때)
+st.markdown("---")
+st.markdown("#### 📈 적립식 투자 시뮬레이션")
+st.caption(f"매달 같은 금액을 예적금과 추천 포트폴리오에 나눠 넣었을 때의 총자산 분포입니다. 최근 가격 이력에서 한 달 구간을 무작위로 뽑아 2,000개 시나리오를 만들고, 평균 수익률은 연 {LONG_RUN_RETURN*100:.0f}%로 가정합니다.")
+render_dca_simulation(snapshot['key'], price_panel, df_recommended, savings_amount, investment_amount)
+
+# 보유 종목 손익 추적 + 가격 알림
+render_portfolio_tracking(snapshot, price_panel, df_recommended)
+
 # 상세 정보 표시
 st.markdown("---")
 st.markdown("#### 📝 상세 정보")
@@ -1636,6 +1456,10 @@ if len(df_recommended) > 0:
         st.write(f"- 미투자 금액: {investment_amount - total_investment:,.0f}원")
         avg_score = df_recommended['최종점수'].mean()
         st.write(f"- 평균 종합점수: {avg_score:.2f}")
+        if risk_model is not None:
+            portfolio_cov = covariance_subset(risk_model, df_recommended['티커'].to_numpy())
+            expected_vol = portfolio_volatility(df_recommended['매수가능금액'] / total_investment, portfolio_cov)
+            st.write(f"- 예상 변동성 (1개월): {expected_vol * 100:.2f}%")
     
     with col3:
         st.markdown("**🌍 국가별 분포**")
@@ -1671,21 +1495,42 @@ if len(df_recommended) > 0:
         avg_growth = df_recommended['성장률(%)'].mean()
         st.metric("평균 성장률", f"{avg_growth:.2f}%")
 
+# 투자성향별 효율적 투자선 (0~100 전체를 한 번에 계산, 슬라이더를 움직이지 않고 비교)
+st.markdown("---")
+st.markdown("#### 📉 투자성향별 효율적 투자선")
+st.caption("같은 잔액으로 투자성향 0~100의 추천 포트폴리오를 모두 계산했습니다. 점에 마우스를 올리면 해당 투자성향의 종목 구성을 볼 수 있습니다.")
+
+frontier = get_efficient_frontier(snapshot['key'], balance, portfolio_method, snapshot)
+fig_frontier = None
+if frontier['투자된금액'].sum() > 0:
+    if frontier['예상변동성(%)'].notna().any():
+        fig_frontier = create_frontier_chart(frontier, risk_tolerance)
+        st.plotly_chart(fig_frontier, use_container_width=True)
+    else:
+        st.info("ℹ️ 가격 데이터가 없어 예상 변동성을 계산할 수 없습니다. 아래 표에서 투자성향별 구성을 확인하세요.")
+    with st.expander("📋 투자성향별 포트폴리오 표"):
+        st.dataframe(frontier, use_container_width=True, hide_index=True, column_config=FRONTIER_COLUMN_CONFIG)
+else:
+    st.info("ℹ️ 현재 잔액으로는 투자성향별 포트폴리오를 구성할 수 없습니다.")
+
+# 리포트 내보내기 (이번 실행 결과를 HTML + JSON으로 저장해 공유)
+st.markdown("---")
+st.markdown("#### 📤 리포트 내보내기")
+report_inputs = {
+    '월급': salary,
+    '소비액': expense,
+    '잔액': balance,
+    '투자성향': risk_tolerance,
+    '포트폴리오 구성 방식': portfolio_method_label,
+    '예적금 등 안전상품': savings_amount,
+    '투자 금액': investment_amount,
+}
+report_figures = {'예적금 등 안전상품 vs 투자 배분': fig_asset, '추천 포트폴리오 비중': fig}
+if fig_frontier is not None:
+    report_figures['투자성향별 효율적 투자선'] = fig_frontier
+render_report_export(snapshot['key'], report_inputs, weights, df_recommended, report_figures)
+
 # 전체 종목 정보 (접을 수 있는 섹션)
-with st.expander("📌 전체 종목 정보 보기"):
-    all_columns = ['티커', '회사명', '국가', '섹터', '최근수익률(%)', '변동성', 'PER', '배당률(%)', 
-                   '시가총액규모', '유동성', '성장률(%)', 'RSI', '뉴스감성(1~5)', '현재가', 
-                   '종합점수', '매수가능주수']
-    df_all = df_stocks[all_columns].copy()
-    df_all['종합점수'] = df_all['종합점수'].round(2)
-    df_all['최근수익률(%)'] = df_all['최근수익률(%)'].round(1)
-    df_all['PER'] = df_all['PER'].round(1)
-    df_all['배당률(%)'] = df_all['배당률(%)'].round(2)
-    df_all['성장률(%)'] = df_all['성장률(%)'].round(1)
-    df_all['현재가'] = df_all['현재가'].apply(lambda x: f"{int(x):,}원")
-    st.dataframe(
-        df_all,
-        use_container_width=True,
-        hide_index=True
-    )
+render_universe_table(snapshot, risk_tolerance, investment_amount, price_panel)
 
+record_run_time('전체 실행', run_started)
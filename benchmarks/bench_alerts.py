@@ -0,0 +1,74 @@
+"""가격 알림 평가 벤치마크 - 정렬된 기준가 구간 조회 vs 알림 전체 비교
+
+사용법: python benchmarks/bench_alerts.py [--alerts 100000] [--tickers 500] [--refreshes 50]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from alerts import new_alert_book, add_alerts, evaluate_alerts  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--alerts', type=int, default=100000)
+    parser.add_argument('--tickers', type=int, default=500)
+    parser.add_argument('--refreshes', type=int, default=50)
+    args = parser.parse_args()
+    rng = np.random.default_rng(4)
+
+    tickers = np.array([f"T{i:04d}" for i in range(args.tickers)])
+    prices = rng.uniform(1e4, 1e6, args.tickers)
+    change = rng.normal(2, 2, args.tickers)
+
+    # 현재가 ±10% 안의 돌파 알림과 예측 하락 전환 알림
+    n = args.alerts
+    picks = rng.integers(0, args.tickers, n)
+    kinds = rng.choice(['above', 'below', 'forecast_negative'], n, p=[0.45, 0.45, 0.1])
+    thresholds = prices[picks] * np.where(kinds == 'above', rng.uniform(1.0, 1.1, n), rng.uniform(0.9, 1.0, n))
+    users = np.array([f"user{i}" for i in range(n // 5)])[rng.integers(0, n // 5, n)]
+
+    book = new_alert_book()
+    t0 = time.perf_counter()
+    add_alerts(book, users, tickers[picks], kinds, thresholds)
+    print(f"알림 등록: {n:,}개 {(time.perf_counter() - t0) * 1000:.1f}ms")
+    evaluate_alerts(book, tickers, prices, change)
+
+    active = np.ones(n, dtype=bool)
+    samples, brute, fired_total = [], [], 0
+    for _ in range(args.refreshes):
+        new_prices = prices * np.exp(rng.normal(0, 0.01, args.tickers))
+        new_change = change + rng.normal(0, 0.5, args.tickers)
+
+        t0 = time.perf_counter()
+        fired = evaluate_alerts(book, tickers, new_prices, new_change)
+        samples.append(time.perf_counter() - t0)
+
+        # 비교: 알림 전체를 한 번에 비교하는 방식 (결과 검증 겸용)
+        t0 = time.perf_counter()
+        before, after = prices[picks], new_prices[picks]
+        expected = active & (
+            ((kinds == 'above') & (before < thresholds) & (thresholds <= after))
+            | ((kinds == 'below') & (after <= thresholds) & (thresholds < before))
+            | ((kinds == 'forecast_negative') & (change[picks] >= 0) & (new_change[picks] < 0))
+        )
+        brute.append(time.perf_counter() - t0)
+        assert np.array_equal(np.sort(fired['alert_id']), np.flatnonzero(expected)), "알림 결과 불일치"
+
+        active &= ~expected
+        fired_total += len(fired['alert_id'])
+        prices, change = new_prices, new_change
+
+    samples, brute = np.array(samples) * 1000, np.array(brute) * 1000
+    print(f"갱신당 평가: p50 {np.percentile(samples, 50):.2f}ms p99 {np.percentile(samples, 99):.2f}ms "
+          f"(전체 비교 p50 {np.percentile(brute, 50):.2f}ms), {args.refreshes}회 갱신 동안 발생 {fired_total:,}개")
+    print("검증: 구간 조회 결과가 전체 비교와 일치")
+
+
+if __name__ == '__main__':
+    main()
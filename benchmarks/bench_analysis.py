@@ -0,0 +1,108 @@
+"""AI 분석 벤치마크 - 종목별 요청 vs 묶음 JSON 스키마 요청 (analyze_stocks(batched=True))
+
+추천 종목 수만큼의 가상 종목 프로필로 두 방식을 번갈아 실행해 HTTP 왕복 횟수(재시도 포함), 사용 토큰,
+첫 결과까지의 시간과 전체 시간, 묶음 응답에서 빠져 종목별로 다시 요청한 종목 수를 비교합니다.
+매 실행마다 빈 임시 캐시를 써서 디스크 캐시 적중 없이 API 호출 비용만 잽니다.
+실행 전에 응답 형식이 달라도 섹션 나누기(split_sections)가 깨지지 않는지 예시 응답으로 먼저 확인합니다.
+OpenAI API 키(OPENAI_API_KEY)가 필요하며, OPENAI_BASE_URL로 호환 서버를 지정할 수 있습니다.
+
+사용법: python benchmarks/bench_analysis.py [--stocks 10] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analysis  # noqa: E402
+from analysis import analyze_stocks, split_sections, stock_profile, REQUEST_TIMEOUT  # noqa: E402
+from bench_pipeline import synthetic_snapshot  # noqa: E402
+
+
+# (응답, 스트리밍 중 여부) → (추천 이유, 주의해야 할 점)
+SECTION_EXAMPLES = [
+    ('1. 추천 이유 (2-3문단):\n좋음.\n\n2. 주의해야 할 점 (1-2문단):\n변동성.', False, ('좋음.', '변동성.')),
+    ('**추천 이유**: 좋음.\n### ⚠️ 리스크 요인\n변동성.', False, ('좋음.', '변동성.')),
+    # 추천 이유 안의 목록 항목은 제목이 아님
+    ('1. 추천 이유:\n좋음.\n- 리스크: 낮음\n\n2. 주의해야 할 점:\n변동성.', False,
+     ('좋음.\n- 리스크: 낮음', '변동성.')),
+    # 주의해야 할 점 뒤에 나온 추천 이유 제목은 본문
+    ('추천 이유: 좋음.\n주의할 점: 변동성.\n추천 근거: 실적', False, ('좋음.', '변동성.\n추천 근거: 실적')),
+    ('1. 추천 이유:\n좋음.\n2. 주의', True, ('좋음.', '')),
+    ('1. 추천 이유:\n좋음.\n- 리스', True, ('좋음.\n- 리스', '')),
+]
+
+
+def check_split_sections():
+    """예시 응답의 섹션 나누기 결과 확인"""
+    for text, partial, expected in SECTION_EXAMPLES:
+        assert split_sections(text, partial=partial) == expected, (text, split_sections(text, partial=partial))
+
+
+def install_counting_client(api_key, counter):
+    """analysis 모듈이 쓰는 API 키별 공유 클라이언트를 HTTP 요청 수를 세는 클라이언트로 교체"""
+    async def count(request):
+        counter['requests'] += 1
+
+    analysis._clients[api_key] = AsyncOpenAI(
+        api_key=api_key, max_retries=0, timeout=REQUEST_TIMEOUT,
+        http_client=DefaultAsyncHttpxClient(event_hooks={'request': [count]})
+    )
+
+
+def run(api_key, stocks, batched, counter):
+    """분석 한 번 실행 → 측정값 dict (빈 임시 캐시 사용)"""
+    counter['requests'] = 0
+    results, first = {}, None
+    with tempfile.TemporaryDirectory() as root:
+        t0 = time.perf_counter()
+        for i, result in analyze_stocks(api_key, stocks, cache_path=os.path.join(root, 'analyses.sqlite3'),
+                                        batched=batched):
+            results[i] = result
+            if first is None:
+                first = time.perf_counter() - t0
+        total = time.perf_counter() - t0
+    return {
+        'requests': counter['requests'],
+        'tokens': sum(r['tokens'] for r in results.values()),
+        'first_ms': first * 1000,
+        'total_ms': total * 1000,
+        'failed': sum(not r['available'] for r in results.values()),
+        'individual': sum(r['available'] and not r.get('batched', False) for r in results.values()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stocks', type=int, default=10, help='분석할 종목 수 (추천 종목 수)')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    check_split_sections()
+    api_key = os.getenv('OPENAI_API_KEY', '')
+    if not api_key:
+        raise SystemExit("OPENAI_API_KEY 환경변수가 필요합니다.")
+    stocks = [stock_profile(row) for _, row in synthetic_snapshot(args.stocks)['stocks'].iterrows()]
+    counter = {'requests': 0}
+    install_counting_client(api_key, counter)
+
+    runs = {'종목별 요청': [], '묶음 요청': []}
+    for _ in range(args.repeat):
+        for name, batched in (('종목별 요청', False), ('묶음 요청', True)):
+            runs[name].append(run(api_key, stocks, batched, counter))
+
+    print(f"{args.stocks}종목 × {args.repeat}회 (중앙값)")
+    for name, measured in runs.items():
+        med = {key: np.median([m[key] for m in measured]) for key in measured[0]}
+        print(f"{name:<8} | HTTP 왕복 {med['requests']:4.0f}회 | 토큰 {med['tokens']:7,.0f} | "
+              f"첫 결과 {med['first_ms']:8,.0f}ms | 전체 {med['total_ms']:8,.0f}ms | "
+              f"종목별 재요청 {med['individual']:3.0f}개 | 실패 {med['failed']:.0f}개")
+
+
+if __name__ == '__main__':
+    main()
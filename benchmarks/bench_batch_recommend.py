@@ -0,0 +1,92 @@
+"""배치 추천 처리량 벤치마크 (프로필/초)
+
+사용법: python benchmarks/bench_batch_recommend.py [--profiles 10000] [--batch 1000] [--live]
+기본은 네트워크 없이 섹터별 추정 가격과 합성 가격 패널로 스냅샷을 만들고,
+--live를 주면 yfinance 시세로 스냅샷을 만듭니다.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine import (build_snapshot, load_snapshot, recommend_batch, batch_records,  # noqa: E402
+                    build_candidates, select_diversified_portfolio, split_balance)
+from market_data import load_universe  # noqa: E402
+
+
+def synthetic_snapshot(n_dates=63, seed=0):
+    """오프라인 스냅샷: 추정 가격 + 섹터 공통 요인이 있는 합성 가격 패널"""
+    df_stocks = load_universe(fetch_prices=False)
+    rng = np.random.default_rng(seed)
+    sectors = pd.factorize(df_stocks['섹터'])[0]
+    market = rng.normal(0.0003, 0.01, n_dates)
+    sector_moves = rng.normal(0, 0.012, (n_dates, sectors.max() + 1))
+    returns = market[:, None] + sector_moves[:, sectors] + rng.normal(0.0005, 0.015, (n_dates, len(df_stocks)))
+    prices = 100 * np.exp(np.cumsum(returns, axis=0))
+    index = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=n_dates)
+    panel = pd.DataFrame(prices, index=index, columns=df_stocks['티커'].to_numpy())
+    return build_snapshot(df_stocks, panel)
+
+
+def random_profiles(n, seed=1):
+    rng = np.random.default_rng(seed)
+    salary = rng.integers(20, 120, n) * 100000
+    expense = (salary * rng.uniform(0.4, 0.95, n)).astype(np.int64)
+    return salary - expense, rng.integers(0, 101, n)
+
+
+def check_against_single(snapshot, balances, risk_tolerances, method):
+    """배치 결과가 대시보드와 같은 프로필 단위 계산과 일치하는지 확인"""
+    result = recommend_batch(snapshot, balances, risk_tolerances, method=method)
+    for p, (balance, risk_tolerance) in enumerate(zip(balances, risk_tolerances)):
+        investment_amount = int(split_balance(balance, risk_tolerance)['investment_amount'])
+        df_candidates = build_candidates(snapshot, risk_tolerance, investment_amount)
+        single = select_diversified_portfolio(
+            df_candidates, investment_amount=investment_amount, method=method,
+            risk_model=snapshot['risk_model'], risk_tolerance=risk_tolerance, similarity=snapshot['similarity']
+        )
+        batch = {h['ticker']: h['shares'] for h in batch_records(snapshot, {k: v[p:p + 1] for k, v in result.items()})[0]['holdings']}
+        expected = dict(zip(single['티커'], single['매수가능주수'])) if len(single) else {}
+        assert batch == expected, (p, batch, expected)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--profiles', type=int, default=10000)
+    parser.add_argument('--batch', type=int, default=1000)
+    parser.add_argument('--method', default='score')
+    parser.add_argument('--live', action='store_true')
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    snapshot = load_snapshot() if args.live else synthetic_snapshot()
+    print(f"스냅샷 생성: {time.perf_counter() - t0:.2f}s ({len(snapshot['tickers'])}개 종목)")
+
+    balances, risk_tolerances = random_profiles(args.profiles)
+    check_against_single(snapshot, balances[:50], risk_tolerances[:50], args.method)
+    print("검증: 처음 50개 프로필이 단일 프로필 계산과 일치")
+
+    t0 = time.perf_counter()
+    n_holdings = 0
+    for start in range(0, args.profiles, args.batch):
+        end = start + args.batch
+        result = recommend_batch(snapshot, balances[start:end], risk_tolerances[start:end], method=args.method)
+        n_holdings += int((result['positions'] >= 0).sum())
+    elapsed = time.perf_counter() - t0
+    print(f"배치 ({args.method}): {args.profiles}개 프로필 {elapsed:.2f}s → {args.profiles / elapsed:,.0f} 프로필/초, "
+          f"평균 {n_holdings / args.profiles:.1f}종목")
+
+    n_single = min(args.profiles, 200)
+    t0 = time.perf_counter()
+    check_against_single(snapshot, balances[:n_single], risk_tolerances[:n_single], args.method)
+    elapsed = time.perf_counter() - t0
+    print(f"단일 프로필 반복 (비교): {n_single / elapsed:,.0f} 프로필/초")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""손익 장부 평가 벤치마크 - 전체 평가 vs 새 봉(가격 갱신)마다 증분 평가
+
+사용법: python benchmarks/bench_ledger.py [--users 20000] [--bars 60]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ledger import new_ledger, record_trades, mark_to_market, mark_increment, price_bars  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--tickers', type=int, default=80)
+    parser.add_argument('--positions', type=int, default=10, help='사용자당 보유 종목 수')
+    parser.add_argument('--bars', type=int, default=60)
+    parser.add_argument('--stale', type=float, default=0.5, help='봉마다 가격이 그대로인 종목 비율')
+    parser.add_argument('--fixed-fx', action='store_true', help='환율 고정 (한국 장중처럼 일부 종목만 갱신)')
+    args = parser.parse_args()
+    rng = np.random.default_rng(3)
+
+    # 종목 절반은 미국(달러), 날짜 × 종목 현지 통화 가격 패널과 환율 시계열
+    tickers = np.array([f"T{i:03d}" for i in range(args.tickers)])
+    countries = np.where(np.arange(args.tickers) % 2 == 0, '한국', '미국')
+    dates = pd.bdate_range('2026-01-02', periods=args.bars + 1)
+    start = np.where(countries == '미국', rng.uniform(20, 500, args.tickers), rng.uniform(1e4, 5e5, args.tickers))
+    panel = pd.DataFrame(start * np.exp(np.cumsum(rng.normal(0, 0.015, (len(dates), args.tickers)), axis=0)),
+                         index=dates, columns=tickers)
+    # 봉마다 일부 종목만 가격이 바뀌는 경우(장중 갱신)를 흉내내기 위해 --stale 비율은 전날 가격 유지
+    stale = rng.random(panel.shape) < args.stale
+    stale[0] = False
+    panel = panel.mask(stale).ffill()
+    fx = pd.Series(1350 * np.exp(np.cumsum(rng.normal(0, 0.003, len(dates)))), index=dates)
+    if args.fixed_fx:
+        fx[:] = 1350.0
+
+    ledger = new_ledger()
+    n = args.users * args.positions
+    picks = rng.integers(0, args.tickers, n)
+    users = np.repeat([f"user{i}" for i in range(args.users)], args.positions)
+    t0 = time.perf_counter()
+    record_trades(ledger, users, tickers[picks], rng.integers(1, 30, n),
+                  start[picks] * np.where(countries[picks] == '미국', fx.iloc[0], 1.0), countries=countries[picks])
+    print(f"체결 기록: {n:,}건 {(time.perf_counter() - t0) * 1000:.1f}ms, 포지션 {len(ledger['pos_user']):,}개")
+
+    _, bars = price_bars(ledger, panel, fx)
+    mark_to_market(ledger, bars[0], dates[0])
+
+    t0 = time.perf_counter()
+    n_users = 0
+    for i in range(1, len(dates)):
+        n_users += len(mark_increment(ledger, bars[i], dates[i]))
+    incremental = (time.perf_counter() - t0) / args.bars
+
+    full_ledger = {k: (v.copy() if isinstance(v, np.ndarray) else v) for k, v in ledger.items()}
+    t0 = time.perf_counter()
+    for i in range(1, len(dates)):
+        mark_to_market(full_ledger, bars[i], dates[i])
+    full = (time.perf_counter() - t0) / args.bars
+
+    print(f"봉당 전체 평가: {full * 1000:.2f}ms, 증분 평가: {incremental * 1000:.2f}ms "
+          f"({args.users:,}명, {args.bars}봉, 봉당 평가금액이 바뀐 사용자 평균 {n_users / args.bars:,.0f}명)")
+
+    assert np.allclose(ledger['value'], full_ledger['value']), "증분 평가 결과 불일치"
+    print("검증: 증분 평가 결과가 전체 평가와 일치")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+"""후보 선정 벤치마크 - 전체 정렬(rank_candidates) vs 종목 청크 + argpartition 상위 k개(stream_candidates)
+
+종목 수를 늘려 가며 (한국/미국 + 일본/유럽을 더한 글로벌 유니버스 가정) 대시보드 한 번의 재실행
+(프로필 하나의 후보 표)과 효율적 투자선(투자성향 101개 배치)의 지연 시간과 최대 메모리를 비교합니다.
+
+--panel-tickers 크기는 가상 가격 패널(3개월 종가)로 build_snapshot 전체(피처 저장소, 앙상블 예측,
+종목 × 종목 Ledoit-Wolf 공분산과 상관 군집, 비슷한 종목 인덱스)를 실행해 빌드 시간과 최대 메모리를 함께 잽니다.
+스냅샷 빌드는 후보 선정과 달리 종목 수로 제한되지 않으며 공분산/군집 때문에 종목 수의 제곱 이상으로 늘어납니다
+(수만 종목은 메모리에 들어가지 않음). 그 밖의 크기는 가격 패널 없이 만든 스냅샷으로 후보 선정만 잽니다.
+
+사용법: python benchmarks/bench_pipeline.py [--tickers 260,2600,10000,30000] [--panel-tickers 260,2600] [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from allocation import allocate_portfolio_batch  # noqa: E402
+from engine import (build_snapshot, build_candidates, composite_scores, get_prediction_score,  # noqa: E402
+                    recommend_batch, efficient_frontier, split_balance, FORECAST_DAYS, RISK_LEVELS)
+from feature_store import compute_features, FEATURE_INDEX  # noqa: E402
+from forecast import ensemble_forecast  # noqa: E402
+from risk_model import build_risk_model  # noqa: E402
+from similarity import build_similarity_index  # noqa: E402
+
+
+def synthetic_universe(n, seed=0):
+    """load_universe와 같은 열 구성의 가상 글로벌 유니버스 (종목 × 열 DataFrame)"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        '티커': [f"T{i:05d}" for i in range(n)],
+        '회사명': [f"종목{i}" for i in range(n)],
+        '국가': rng.choice(['한국', '미국', '일본', '유럽'], n),
+        '섹터': rng.choice(['기술', '금융', '헬스케어', '에너지', '소비재', '산업재', '통신', '소재'], n),
+        '최근수익률(%)': rng.uniform(-5, 15, n).round(1),
+        '변동성': rng.choice(['낮음', '중간', '높음', '매우높음'], n, p=[0.3, 0.4, 0.25, 0.05]),
+        '뉴스감성(1~5)': rng.uniform(2, 5, n).round(1),
+        'PER': rng.uniform(8, 60, n).round(1),
+        '배당률(%)': rng.uniform(0, 4, n).round(2),
+        '시가총액규모': rng.choice(['대형', '중형', '소형'], n, p=[0.6, 0.3, 0.1]),
+        '유동성': rng.choice(['매우높음', '높음', '중간', '낮음'], n, p=[0.3, 0.4, 0.25, 0.05]),
+        '성장률(%)': rng.uniform(0, 30, n).round(1),
+        'RSI': rng.uniform(30, 75, n).round(0).astype(int),
+        '현재가': np.exp(rng.uniform(np.log(5e3), np.log(2e6), n)),
+    })
+
+
+def synthetic_panel(df, days=63, seed=0):
+    """가상 종가 패널 (영업일 × 티커, 3개월) - 섹터 공통 요인 + 개별 변동의 기하 브라운 운동, 마지막 종가 = 현재가"""
+    rng = np.random.default_rng(seed)
+    sectors, sector_codes = np.unique(df['섹터'].to_numpy(), return_inverse=True)
+    market = rng.normal(0, 0.008, (days, 1))
+    sector = rng.normal(0, 0.01, (days, len(sectors)))[:, sector_codes]
+    drift = rng.normal(0.0005, 0.001, len(df))
+    log_returns = drift + market + sector + rng.normal(0, 0.015, (days, len(df)))
+    log_prices = np.cumsum(log_returns, axis=0)
+    prices = df['현재가'].to_numpy() * np.exp(log_prices - log_prices[-1])
+    index = pd.bdate_range(end='2026-09-30', periods=days)
+    return pd.DataFrame(prices, index=index, columns=df['티커'].to_numpy())
+
+
+def synthetic_snapshot(n, seed=0):
+    """가격 패널 없이 만든 가상 유니버스 스냅샷 (예측 변동률은 무작위, 위험 모델 없음)"""
+    rng = np.random.default_rng(seed + 1)
+    snapshot = build_snapshot(synthetic_universe(n, seed), None)
+    change_pct = np.clip(rng.normal(2, 6, n), -25, 25)
+    snapshot['change_pct'] = change_pct
+    snapshot['prediction_score'] = get_prediction_score(change_pct)
+    snapshot['revenue_score'] = np.maximum(snapshot['prediction_score'], 0)
+    return snapshot
+
+
+def rank_candidates(snapshot, composite, budgets):
+    """이전 방식: 프로필별 후보 종목 전체 정렬 (프로필 × 종목 배열) - stream_candidates와 같은 순서
+
+    1. 투자 금액으로 1주 이상 살 수 있는 종목 중 하락 예상(예측점수 < 0)이 아닌 종목을
+       최종종합점수(종합점수 25% + 예측 수익성 50% + 안정성 25%), 예측변동률 순으로 정렬
+    2. 그 뒤에 하락 예상 종목을 예측 없이 종합점수로 추가 (원래 순서)
+    3. 남는 종목이 하나도 없으면 예측 없이 매수 가능 종목 전체를 종합점수로 사용
+
+    반환값 (dict): order(종목 위치, 후보가 아닌 칸은 -1), valid, 후보 순서의 final_score,
+    revenue_score, change_pct, prediction_score
+    """
+    composite = np.atleast_2d(composite)
+    budgets = np.atleast_1d(np.asarray(budgets, dtype=np.float64))
+    n_profiles, n_stocks = composite.shape
+
+    # 매수 가능 주수 계산 (투자 금액 기준)
+    buyable = (budgets[:, None] / snapshot['prices'][None, :]).astype(np.int64) >= 1
+    final_score = (
+        composite * 0.25 +                     # 기존 종합점수 25%
+        snapshot['revenue_score'] * 0.50 +     # 예측 수익성 50% (매우 높은 가중치)
+        snapshot['stability'] * 0.25           # 안정성 25%
+    )
+    rising = buyable & (snapshot['prediction_score'] >= 0)
+    rising &= rising.any(axis=1, keepdims=True)  # 모두 하락 예상이면 예측 없이 추천
+
+    # 정렬 키: (구분, -최종종합점수, -예측변동률, 원래 순서) - 구분 0: 상승/중립, 1: 예측 제외, 2: 매수 불가
+    tier = np.where(rising, 0, np.where(buyable, 1, 2))
+    keys = (
+        np.broadcast_to(np.arange(n_stocks), composite.shape),
+        np.where(rising, -snapshot['change_pct'], 0.0),
+        np.where(rising, -final_score, 0.0),
+        tier,
+    )
+    order = np.lexsort(keys, axis=-1)
+    valid = np.arange(n_stocks) < buyable.sum(axis=1, keepdims=True)
+
+    def ordered(values):
+        return np.where(valid, np.take_along_axis(values, order, axis=1), 0.0)
+
+    return {
+        'order': np.where(valid, order, -1),
+        'valid': valid,
+        'final_score': ordered(np.where(rising, final_score, composite)),
+        'revenue_score': ordered(np.where(rising, snapshot['revenue_score'], 0.0)),
+        'change_pct': ordered(np.where(rising, snapshot['change_pct'], 0.0)),
+        'prediction_score': ordered(np.where(rising, snapshot['prediction_score'], 0.0)),
+    }
+
+
+def full_sort_candidates(snapshot, risk_tolerance, investment_amount):
+    """이전 방식: 전체 종목에 점수 열을 더한 뒤 전체 정렬한 후보 표"""
+    df = snapshot['stocks'].copy()
+    df['종합점수'] = composite_scores(snapshot, risk_tolerance)
+    df['다양성보너스'] = 0.0
+    df['총점'] = df['종합점수']
+    df['매수가능주수'] = (investment_amount / df['현재가']).astype(int)
+    df['매수가능금액'] = df['매수가능주수'] * df['현재가']
+    ranked = rank_candidates(snapshot, df['종합점수'].to_numpy()[None, :], [investment_amount])
+    valid = ranked['valid'][0]
+    df = df.iloc[ranked['order'][0][valid]].reset_index(drop=True)
+    for column, key in (('예측변동률', 'change_pct'), ('예측점수', 'prediction_score'),
+                        ('수익성점수', 'revenue_score'), ('최종종합점수', 'final_score')):
+        df[column] = ranked[key][0][valid]
+    return df
+
+
+def full_sort_batch(snapshot, balances, risk_tolerances, target_stocks=10):
+    """이전 방식의 recommend_batch (프로필 × 전체 종목 정렬 후 배분, 점수 가중)"""
+    split = split_balance(balances, risk_tolerances)
+    budgets = split['investment_amount'].astype(np.float64)
+    ranked = rank_candidates(snapshot, composite_scores(snapshot, risk_tolerances), budgets)
+    order = np.where(ranked['valid'], ranked['order'], 0)
+    plan = allocate_portfolio_batch(
+        prices=snapshot['prices'][order], scores=ranked['final_score'], budgets=budgets,
+        groups=snapshot['group_codes'][order], countries=snapshot['country_codes'][order],
+        revenue_scores=ranked['revenue_score'], valid=ranked['valid'], target_stocks=target_stocks
+    )
+    bought = plan['positions'] >= 0
+    return np.where(bought, np.take_along_axis(order, np.where(bought, plan['positions'], 0), axis=1), -1), plan['shares']
+
+
+def check_small_balances(snapshot):
+    """후보가 하나도 없는 배치 (잔액 0/음수, 어떤 종목도 1주 살 수 없는 예산)도 빈 포트폴리오로 계산되는지 검증"""
+    for balances in ([0], [10000], [-5], [0, -5, 10000]):
+        result = recommend_batch(snapshot, balances, 50)
+        assert (result['positions'] < 0).all() and (result['shares'] == 0).all(), f"잔액 {balances}: 빈 포트폴리오가 아님"
+    frontier = efficient_frontier(snapshot, 10000)
+    assert (frontier['종목수'] == 0).all(), "작은 잔액의 투자선에 종목이 있음"
+    assert len(build_candidates(snapshot, 50, 0)) == 0, "투자 금액 0의 후보가 있음"
+
+
+def measure_build(df, panel):
+    """가격 패널 스냅샷 빌드 → (스냅샷, 전체 ms, 최대 메모리 MB, {단계: ms})
+
+    단계별 시간은 같은 계산을 따로 한 번씩 실행해 잽니다 (피처 계산은 디스크 저장소 재사용과 무관하게 항상 계산).
+    """
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    snapshot = build_snapshot(df, panel)
+    total = (time.perf_counter() - t0) * 1000
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+
+    stages = {}
+
+    def stage(name, fn):
+        t0 = time.perf_counter()
+        result = fn()
+        stages[name] = (time.perf_counter() - t0) * 1000
+        return result
+
+    features = stage('피처', lambda: compute_features(panel.values))
+    stage('예측', lambda: ensemble_forecast(panel.values, horizon=FORECAST_DAYS, features=features,
+                                          feature_index=FEATURE_INDEX))
+    risk_model = stage('위험 모델', lambda: build_risk_model(panel.values, list(panel.columns)))
+    stage('유사 종목', lambda: build_similarity_index(snapshot['tickers'], snapshot['factors'], risk_model))
+    return snapshot, total, peak, stages
+
+
+def measure(fn, repeat):
+    """(결과, 평균 ms, 최대 메모리 MB) - 메모리는 tracemalloc으로 한 번 측정"""
+    tracemalloc.start()
+    result = fn()
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return result, (time.perf_counter() - t0) / repeat * 1000, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tickers', default='260,2600,10000,30000')
+    parser.add_argument('--panel-tickers', default='260,2600', help='가격 패널로 스냅샷 전체를 빌드할 종목 수')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--amount', type=int, default=600000, help='대시보드 투자 금액 (원)')
+    args = parser.parse_args()
+
+    balances = np.full(len(RISK_LEVELS), args.amount / 0.6)
+    panel_sizes = {int(x) for x in args.panel_tickers.split(',') if x}
+    for n in sorted({int(x) for x in args.tickers.split(',')} | panel_sizes):
+        if n in panel_sizes:
+            df = synthetic_universe(n)
+            snapshot, build_ms, build_mb, stages = measure_build(df, synthetic_panel(df))
+            print(f"{n:>6,}종목 스냅샷 빌드 (가격 패널) | {build_ms:9,.0f}ms {build_mb:7.1f}MB | "
+                  + " ".join(f"{name} {ms:,.0f}ms" for name, ms in stages.items()))
+        else:
+            snapshot = synthetic_snapshot(n)
+            print(f"{n:>6,}종목 스냅샷 (가격 패널 없음: 예측/위험 모델/유사 종목 빌드 제외)")
+        check_small_balances(snapshot)
+
+        old, old_ms, old_mb = measure(lambda: full_sort_candidates(snapshot, 50, args.amount), args.repeat)
+        new, new_ms, new_mb = measure(lambda: build_candidates(snapshot, 50, args.amount), args.repeat)
+        pool = old[old['현재가'] <= args.amount * 0.2].head(20)
+        assert list(pool['티커']) == list(new[new['현재가'] <= args.amount * 0.2].head(20)['티커']), "후보 풀 불일치"
+        print(f"{n:>6,}종목 후보 표 | 전체 정렬 {old_ms:7.2f}ms {old_mb:6.1f}MB ({len(old):,}행) | "
+              f"청크 상위 k {new_ms:6.2f}ms {new_mb:5.1f}MB ({len(new)}행)")
+
+        # 전체 정렬 기준선에는 비싼 상위 종목 대체 단계가 없으므로 대체 없이 비교하고, 대체 포함 시간은 따로 잽니다
+        ranking_only = dict(snapshot, similarity=None)
+        (old_pos, old_shares), old_ms, old_mb = measure(lambda: full_sort_batch(snapshot, balances, RISK_LEVELS), 1)
+        new_result, new_ms, new_mb = measure(lambda: recommend_batch(ranking_only, balances, RISK_LEVELS), 1)
+        assert np.array_equal(old_pos, new_result['positions']) and np.array_equal(old_shares, new_result['shares']), \
+            "배치 결과 불일치"
+        _, full_ms, _ = measure(lambda: recommend_batch(snapshot, balances, RISK_LEVELS), 1)
+        print(f"{'':>6} 투자선 101개 | 전체 정렬 {old_ms:7.2f}ms {old_mb:6.1f}MB | "
+              f"청크 상위 k {new_ms:6.2f}ms {new_mb:5.1f}MB | 대체 포함 {full_ms:6.2f}ms")
+    print("검증: 후보 풀과 (대체 전) 배치 배분 결과가 전체 정렬과 일치, 후보가 없는 작은 잔액은 빈 포트폴리오")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""리밸런싱 계획 벤치마크 - 추적 중인 사용자 전체 계획 vs 가격 갱신 시 증분 재계산
+
+사용법: python benchmarks/bench_rebalance.py [--users 20000] [--changed 10]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_batch_recommend import synthetic_snapshot, random_profiles  # noqa: E402
+from engine import recommend_batch  # noqa: E402
+from rebalance import plan_rebalance, build_rebalance_book, update_book_prices  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--changed', type=int, default=10, help='가격 갱신 한 번에 바뀌는 종목 수')
+    args = parser.parse_args()
+
+    snapshot = synthetic_snapshot()
+    n_stocks = len(snapshot['tickers'])
+    rng = np.random.default_rng(2)
+
+    # 사용자별 목표 포트폴리오 (배치 추천)와 지난달 추천에서 조금씩 달라진 보유 주식
+    balances, risk_tolerances = random_profiles(args.users)
+    result = recommend_batch(snapshot, balances, risk_tolerances)
+    rows, cols = np.nonzero(result['positions'] >= 0)
+    targets = np.zeros((args.users, n_stocks))
+    targets[rows, result['positions'][rows, cols]] = result['amounts'][rows, cols]
+    targets /= np.maximum(targets.sum(axis=1, keepdims=True), 1e-12)
+    holdings = np.zeros((args.users, n_stocks), dtype=np.int64)
+    holdings[rows, result['positions'][rows, cols]] = result['shares'][rows, cols] * rng.integers(1, 4, len(rows))
+    cash = result['investment_amount'].astype(np.float64)
+
+    t0 = time.perf_counter()
+    book = build_rebalance_book(holdings, targets, snapshot['prices'], cash, snapshot['countries'])
+    full = time.perf_counter() - t0
+    print(f"전체 계획: {args.users}명 {full * 1000:.1f}ms → {args.users / full:,.0f} 명/초, "
+          f"평균 거래 {book['plan']['n_trades'].mean():.1f}건, 평균 비용 {book['plan']['cost'].mean():,.0f}원")
+
+    elapsed, n_rows = 0.0, 0
+    prices = snapshot['prices'].copy()
+    for _ in range(20):
+        changed = rng.choice(n_stocks, args.changed, replace=False)
+        prices[changed] *= np.exp(rng.normal(0, 0.01, args.changed))
+        t0 = time.perf_counter()
+        n_rows += len(update_book_prices(book, prices))
+        elapsed += time.perf_counter() - t0
+    print(f"증분 갱신 ({args.changed}개 종목 가격 변경): 평균 {elapsed / 20 * 1000:.1f}ms, 재계산 사용자 평균 {n_rows / 20:,.0f}명")
+
+    # 증분 결과가 처음부터 다시 계산한 결과와 같은지 확인
+    fresh = plan_rebalance(holdings, targets, prices, cash, snapshot['countries'])
+    assert all(np.allclose(book['plan'][k], fresh[k]) for k in fresh), "증분 갱신 결과 불일치"
+    print("검증: 증분 갱신 결과가 전체 재계산과 일치")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""대시보드 재실행 시간 벤치마크 - 입력 하나를 바꿨을 때 한 번의 재실행에 걸리는 시간
+
+streamlit.testing의 AppTest로 app.py를 실행한 뒤 사이드바 입력(월급, API 키)과 섹션 안의 입력
+(조건 검색, 시뮬레이션 기간)을 하나씩 바꿔 가며 시간을 잽니다.
+AppTest는 위젯을 바꾸면 항상 스크립트 전체를 다시 실행하므로, 브라우저에서 fragment 안의 위젯을 바꿨을 때의
+비용은 앱이 세션 상태 'run_timings'에 남긴 해당 fragment의 실행 시간으로 봅니다.
+(run_timings가 없는 이전 버전은 모든 입력이 전체 재실행)
+시세를 받아오므로 네트워크가 필요하며, 첫 실행 뒤에는 캐시된 시세를 사용합니다.
+
+사용법: python benchmarks/bench_reruns.py [--app app.py] [--repeat 3]
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+from streamlit.testing.v1 import AppTest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def find_widget(widgets, label=None, key=None):
+    """라벨 또는 키로 위젯 찾기 (없으면 None)"""
+    for widget in widgets:
+        if (key is not None and widget.key == key) or (label is not None and widget.label == label):
+            return widget
+    return None
+
+
+def open_universe(at):
+    """전체 종목 표가 펼쳤을 때만 그려지면 펼친 상태로 재실행"""
+    if find_widget(at.text_input, key='screen_query') is None:
+        at.session_state['show_universe'] = True
+        at.run()
+
+
+def scenarios(at):
+    """(이름, 입력이 속한 fragment 또는 None(전체 재실행), 입력을 바꾸는 함수) - 매번 값이 달라지도록 실행 횟수를 받음"""
+    return [
+        ("같은 입력 재실행", None, lambda i: at.run()),
+        ("월급 변경", None,
+         lambda i: find_widget(at.sidebar.number_input, label="월급 (원)").set_value(3000000 + 100000 * (i + 1)).run()),
+        ("API 키 입력", 'render_api_key_settings',
+         lambda i: find_widget(at.sidebar.text_input, label="OpenAI API 키").input(f"sk-test-{i}").run()),
+        ("조건 검색 입력", 'render_universe_table',
+         lambda i: find_widget(at.text_input, key='screen_query').input(f"PER < {15 + i}").run()),
+        ("시뮬레이션 기간 변경", 'render_dca_simulation',
+         lambda i: find_widget(at.slider, key='sim_years').set_value(11 + i).run()),
+    ]
+
+
+def run_timings(at):
+    """앱이 기록한 마지막 실행 시간 (이전 버전이면 빈 dict)"""
+    return at.session_state['run_timings'] if 'run_timings' in at.session_state else {}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--app', default=os.path.join(ROOT, 'app.py'))
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    at = AppTest.from_file(args.app, default_timeout=600)
+    t0 = time.perf_counter()
+    at.run()
+    print(f"첫 실행 (시세 로드 포함): {(time.perf_counter() - t0) * 1000:,.0f}ms")
+    if at.exception:
+        raise SystemExit(f"앱 실행 오류: {at.exception[0].value}")
+    open_universe(at)
+
+    for name, fragment, change in scenarios(at):
+        full, partial = [], []
+        for i in range(args.repeat):
+            t0 = time.perf_counter()
+            change(i)
+            full.append((time.perf_counter() - t0) * 1000)
+            if at.exception:
+                raise SystemExit(f"{name} 오류: {at.exception[0].value}")
+            timings = run_timings(at)
+            partial.append(timings[fragment] if fragment in timings else full[-1])
+        scope = f"fragment {fragment}" if fragment in run_timings(at) else "전체 재실행"
+        print(f"{name:<12} 전체 재실행 중앙값 {np.median(full):8,.1f}ms | "
+              f"브라우저 재실행 ({scope}) 중앙값 {np.median(partial):8,.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""조건식 검색기 벤치마크 - 정렬 인덱스(searchsorted) vs pandas DataFrame.query 전체 스캔
+
+사용법: python benchmarks/bench_screener.py [--tickers 10000] [--repeat 200]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from screener import build_screen_index, screen  # noqa: E402
+
+QUERIES = [
+    ("PER < 15 and 배당률 > 2 and 국가 == '한국'",
+     "PER < 15 and `배당률(%)` > 2 and 국가 == '한국'"),
+    ("10 <= PER < 20 and RSI < 30 or 섹터 in ['기술', '금융']",
+     "(10 <= PER < 20 and RSI < 30) or 섹터 in ['기술', '금융']"),
+    ("성장률 > 10 and 성장률 < 20 and 변동성 != '매우높음' and 시가총액규모 == '대형'",
+     "`성장률(%)` > 10 and `성장률(%)` < 20 and 변동성 != '매우높음' and 시가총액규모 == '대형'"),
+    ("not (RSI > 70) and 뉴스감성 >= 4",
+     "not (RSI > 70) and `뉴스감성(1~5)` >= 4"),
+]
+
+
+def synthetic_universe(n, seed=0):
+    """load_universe와 같은 열 구성의 가상 종목 표"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        '티커': [f"T{i:05d}" for i in range(n)],
+        '국가': rng.choice(['한국', '미국'], n),
+        '섹터': rng.choice(['기술', '금융', '헬스케어', '에너지', '소비재', '산업재', '통신', '소재'], n),
+        '최근수익률(%)': rng.normal(0, 10, n).round(1),
+        '변동성': rng.choice(['낮음', '중간', '높음', '매우높음'], n),
+        '뉴스감성(1~5)': rng.uniform(1, 5, n).round(1),
+        'PER': rng.uniform(5, 50, n).round(1),
+        '배당률(%)': rng.uniform(0, 6, n).round(2),
+        '시가총액규모': rng.choice(['대형', '중형', '소형'], n),
+        '성장률(%)': rng.normal(8, 10, n).round(1),
+        'RSI': rng.integers(10, 90, n),
+        '현재가': rng.uniform(1e3, 1e6, n),
+    })
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - t0)
+    samples = np.array(samples) * 1000
+    return result, np.percentile(samples, 50), np.percentile(samples, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tickers', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    df = synthetic_universe(args.tickers)
+    t0 = time.perf_counter()
+    index = build_screen_index(df)
+    print(f"인덱스 생성: {args.tickers:,}종목 {(time.perf_counter() - t0) * 1000:.1f}ms")
+
+    for query, pandas_query in QUERIES:
+        mask, p50, p99 = timed(lambda: screen(index, query), args.repeat)
+        expected, q50, q99 = timed(lambda: df.eval(pandas_query).to_numpy(), args.repeat)
+        assert np.array_equal(mask, expected), f"결과 불일치: {query}"
+        print(f"{query}\n  → {mask.sum():,}종목 | 인덱스 p50 {p50:.3f}ms p99 {p99:.3f}ms | "
+              f"pandas p50 {q50:.3f}ms p99 {q99:.3f}ms")
+    print("검증: 모든 조건식 결과가 pandas와 일치")
+
+
+if __name__ == '__main__':
+    main()
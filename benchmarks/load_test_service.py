@@ -0,0 +1,134 @@
+"""추천 서비스 부하 테스트 (keep-alive 연결 여러 개로 동시 요청, 초당 처리량과 지연 시간 측정)
+
+사용법:
+    python benchmarks/load_test_service.py                      # 합성 스냅샷으로 서비스를 별도 프로세스에서 띄워 측정
+    python benchmarks/load_test_service.py --url http://127.0.0.1:8000   # 이미 실행 중인 서비스 측정
+옵션: --connections 64 --duration 10 --profiles 2000
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _serve(port, ready):
+    """합성 스냅샷으로 서비스 실행 (자식 프로세스)"""
+    from bench_batch_recommend import synthetic_snapshot
+    from service import RecommendationService, start_server
+
+    async def run():
+        server = await start_server(RecommendationService(synthetic_snapshot), '127.0.0.1', port)
+        ready.set()
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(run())
+
+
+def request_mix(n_profiles, tickers, seed=0):
+    """엔드포인트 요청 목록: 포트폴리오 60%, 점수 20%, 예측 15%, 종목 목록 5%"""
+    rng = np.random.default_rng(seed)
+    balances = rng.integers(5, 80, n_profiles) * 10000 * 10
+    risks = rng.integers(0, 101, n_profiles)
+    paths = []
+    for _ in range(20000):
+        r = rng.random()
+        if r < 0.6:
+            i = rng.integers(n_profiles)
+            paths.append(f"/portfolio?balance={balances[i]}&risk_tolerance={risks[i]}")
+        elif r < 0.8:
+            paths.append(f"/score?risk_tolerance={rng.integers(0, 101)}")
+        elif r < 0.95:
+            paths.append(f"/forecast/{tickers[rng.integers(len(tickers))]}")
+        else:
+            paths.append("/universe")
+    return paths
+
+
+async def _fetch(reader, writer, host, path):
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        if line.lower().startswith(b'content-length:'):
+            length = int(line.split(b':')[1])
+    body = await reader.readexactly(length)
+    return status, body
+
+
+async def _worker(host, port, paths, deadline, latencies, statuses, offset):
+    reader, writer = await asyncio.open_connection(host, port)
+    i = offset
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        status, _ = await _fetch(reader, writer, host, paths[i % len(paths)])
+        latencies.append(time.perf_counter() - start)
+        statuses[status] = statuses.get(status, 0) + 1
+        i += 1
+    writer.close()
+
+
+async def run_load(host, port, connections, duration, profiles):
+    reader, writer = await asyncio.open_connection(host, port)
+    import json
+    _, body = await _fetch(reader, writer, host, "/universe")
+    writer.close()
+    tickers = [s['ticker'] for s in json.loads(body)['stocks']]
+    paths = request_mix(profiles, tickers)
+
+    latencies, statuses = [], {}
+    deadline = time.perf_counter() + duration
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        _worker(host, port, paths, deadline, latencies, statuses, k * (len(paths) // connections))
+        for k in range(connections)
+    ])
+    elapsed = time.perf_counter() - start
+
+    lat = np.array(latencies) * 1000
+    print(f"연결 {connections}개, {elapsed:.1f}s 동안 {len(lat)}건 → {len(lat) / elapsed:,.0f} 요청/초")
+    print(f"지연 시간(ms): p50 {np.percentile(lat, 50):.1f} / p95 {np.percentile(lat, 95):.1f} / p99 {np.percentile(lat, 99):.1f}")
+    print(f"상태 코드: {statuses}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url')
+    parser.add_argument('--connections', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--profiles', type=int, default=2000)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        url = urlsplit(args.url)
+        host, port = url.hostname, url.port or 80
+    else:
+        host, port = '127.0.0.1', args.port
+        ready = multiprocessing.Event()
+        server = multiprocessing.Process(target=_serve, args=(port, ready), daemon=True)
+        server.start()
+        if not ready.wait(120):
+            sys.exit("서비스가 시작되지 않았습니다.")
+    try:
+        asyncio.run(run_load(host, port, args.connections, args.duration, args.profiles))
+    finally:
+        if server is not None:
+            server.terminate()
+
+
+if __name__ == '__main__':
+    main()
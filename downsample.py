@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import plotly
+
+# 차트용 시계열 다운샘플링과 전송량 줄이기 (Streamlit 비의존)
+# LTTB(Largest-Triangle-Three-Buckets): 첫/마지막 점은 그대로 두고 가운데를 n_out-2개 구간으로 나눈 뒤,
+# 구간마다 (직전에 고른 점, 다음 구간의 평균 점)과 만드는 삼각형 넓이가 가장 큰 점 하나를 고릅니다.
+# 차트 폭(픽셀)보다 점이 많을 때 모양(고점/저점)을 유지하면서 브라우저로 보내는 점 수를 폭 이하로 줄입니다.
+
+# plotly 6부터는 NumPy 배열을 dtype 그대로 base64로 보내므로 float32가 절반 크기이고,
+# 그 이전 버전은 JSON 숫자 목록이라 float32로 바꾸면 오히려 자릿수가 늘어나 반올림한 float64를 보냅니다.
+TYPED_ARRAYS = int(plotly.__version__.split('.')[0]) >= 6
+
+
+def lttb_indices(x, y, n_out):
+    """LTTB로 고른 점의 위치 (오름차순, 첫/마지막 점 포함) - 점이 n_out개 이하이면 전체 위치"""
+    n = len(y)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    y = np.where(np.isfinite(y), y, np.nanmean(y) if np.isfinite(y).any() else 0.0)
+
+    # 가운데 점(1 ~ n-2)을 n_out-2개 구간으로 나눈 경계와 구간별 평균 점 (누적합으로 한 번에 계산)
+    edges = np.floor(np.linspace(1, n - 1, n_out - 1)).astype(np.int64)
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x[:n - 1], edges[:-1]) / counts
+    mean_y = np.add.reduceat(y[:n - 1], edges[:-1]) / counts
+    # 마지막 구간의 "다음 구간"은 마지막 점
+    next_x = np.append(mean_x[1:], x[-1])
+    next_y = np.append(mean_y[1:], y[-1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        area = np.abs((x[a] - next_x[i]) * (y[start:stop] - y[a]) - (x[a] - x[start:stop]) * (next_y[i] - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def compact_values(values, decimals=2):
+    """차트로 보낼 값 배열 (typed array를 지원하면 float32, 아니면 반올림한 float64)"""
+    values = np.asarray(values, dtype=np.float64)
+    if TYPED_ARRAYS:
+        return values.astype(np.float32)
+    return np.round(values, decimals)
+
+
+def compact_dates(dates):
+    """일봉 날짜를 'YYYY-MM-DD' 문자열로 (기본 ISO 시각 문자열보다 절반 이하 크기)"""
+    return pd.DatetimeIndex(dates).strftime('%Y-%m-%d').to_numpy()
+
+
+SPARKLINE_POINTS = 30  # 표 안 작은 추세선의 점 수 (3개월 일봉 ≈ 2~3일에 한 점)
+
+
+def sparkline_lists(panel, tickers, n_points=SPARKLINE_POINTS):
+    """가격 패널(날짜 × 티커)에서 종목별 추세선 점 목록을 한 번에 생성 (tickers 순서, 이력이 없으면 None)
+
+    날짜를 n_points개 구간으로 나눠 구간 마지막 종가를 고르므로 종목 수와 무관하게 행렬 인덱싱 한 번으로 끝납니다.
+    빈 날은 직전 종가, 상장 전 구간은 첫 종가로 채우며, 표의 LineChartColumn이 행마다 범위를 맞추므로 통화는 그대로 둡니다.
+    """
+    if panel is None or panel.empty:
+        return [None] * len(tickers)
+    close = panel.reindex(columns=list(tickers)).ffill().bfill().to_numpy(dtype=np.float64)
+    n = len(close)
+    rows = np.unique(np.ceil(np.linspace(0, n, min(n_points, n) + 1)[1:]).astype(np.int64) - 1)
+    points = np.round(close[rows].T, 2)
+    available = np.isfinite(points).all(axis=1)
+    return [p.tolist() if ok else None for p, ok in zip(points, available)]
@@ -0,0 +1,716 @@
+import hashlib
+import time
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from allocation import allocate_portfolio, allocate_portfolio_batch
+from feature_store import materialize_features, open_feature_store, FEATURE_INDEX
+from forecast import ensemble_forecast
+from market_data import load_universe, fetch_price_panel
+from risk_model import build_risk_model, cluster_labels, covariance_subset, optimize_weights
+from similarity import build_similarity_index, factor_order, substitute_candidates
+
+# 추천 엔진 (Streamlit 비의존)
+# 종목 데이터 + 가격 패널로 만든 스냅샷(요소 점수 행렬, 앙상블 예측, 위험 모델)을 한 번 계산하고,
+# 사용자 프로필(투자 가능 금액, 투자성향)마다 종합점수 → 후보 정렬 → 정수 주식 수 배분을 수행합니다.
+# 대시보드(app.py)는 프로필 하나, recommend_batch는 여러 프로필을 행렬 연산으로 한 번에 처리합니다.
+
+# 투자성향 가중치 키와 해당 요소 점수 컬럼 (같은 순서)
+WEIGHT_KEYS = ('안정성', '수익률', '성장률', '밸류에이션', '배당률', '뉴스감성', '유동성', '기술적지표')
+FACTOR_COLUMNS = ('안정성점수', '수익률점수', '성장률점수', '밸류에이션점수', '배당률점수',
+                  '뉴스감성(1~5)', '유동성점수', '기술적지표점수')
+
+FORECAST_DAYS = 30
+RISK_LEVELS = np.arange(0, 101)  # 효율적 투자선에서 계산할 투자성향 (0~100 전체)
+SNAPSHOT_TTL = 300  # 헤드리스 스냅샷 재사용 시간 (초) - 대시보드 캐시 주기와 동일
+SCORE_BLOCK = 2 ** 18  # 후보 선정 시 한 번에 계산하는 (프로필 × 종목) 칸 수 - 청크 크기 = SCORE_BLOCK / 프로필 수
+CANDIDATE_POOL = 4  # 프로필 하나의 후보 표에 남기는 종목당 상한 이하 종목 수 = target_stocks × 4
+_TIER_OFFSET = float(2 ** 40)  # 예측 제외 종목의 정렬 키 = 오프셋 + 종목 위치 (상승/중립 종목보다 항상 뒤)
+
+# 범주형 요소의 점수 매핑 (없는 값은 0점)
+VOLATILITY_SCORES = {'낮음': 5, '중간': 3, '높음': 2, '매우높음': 1}
+MARKET_CAP_SCORES = {'대형': 5, '중형': 3, '소형': 1}
+LIQUIDITY_SCORES = {'매우높음': 5, '높음': 4, '중간': 3, '낮음': 2, '매우낮음': 1}
+
+_snapshot_cache = {'snapshot': None, 'loaded_at': 0.0}
+
+
+# 점수 변환 함수들
+def get_prediction_score(price_change_pct):
+    """예측 점수 계산 (30일 예측 변동률 기준, 하락 예상은 -10점)"""
+    pct = np.asarray(price_change_pct, dtype=float)
+    return np.select(
+        [pct > 15, pct > 10, pct > 5, pct > 2, pct > 0],
+        [5.0, 4.0, 3.0, 2.0, 1.0],
+        default=-10.0
+    )
+
+def normalize_score(series, reverse=False):
+    """점수를 0-5 범위로 정규화"""
+    if reverse:
+        # 역정규화 (낮을수록 좋은 경우)
+        max_val = series.max()
+        min_val = series.min()
+        if max_val == min_val:
+            return pd.Series([3.0] * len(series))
+        return 5 - ((series - min_val) / (max_val - min_val) * 4)
+    else:
+        # 정규화 (높을수록 좋은 경우)
+        max_val = series.max()
+        min_val = series.min()
+        if max_val == min_val:
+            return pd.Series([3.0] * len(series))
+        return 1 + ((series - min_val) / (max_val - min_val) * 4)
+
+
+def score_weight_matrix(risk_tolerances):
+    """투자성향(0~100)별 요소 가중치 행렬 (..., 8) - 열 순서는 WEIGHT_KEYS
+
+    보수적 투자자 (risk_ratio 낮음): 안정성, 배당률, 유동성, 밸류에이션 중시
+    공격적 투자자 (risk_ratio 높음): 수익률, 성장률, 기술적 지표 중시
+    """
+    risk_ratio = np.asarray(risk_tolerances, dtype=np.float64) / 100  # 0~1 범위
+    raw = np.stack(np.broadcast_arrays(
+        np.maximum(0.2, 0.4 - (risk_ratio * 0.3)),   # 안정성: 0.4 ~ 0.1
+        0.15 + (risk_ratio * 0.15),                  # 수익률: 0.15 ~ 0.3
+        0.1 + (risk_ratio * 0.15),                   # 성장률: 0.1 ~ 0.25
+        np.maximum(0.1, 0.2 - (risk_ratio * 0.1)),   # 밸류에이션: 0.2 ~ 0.1
+        np.maximum(0.05, 0.15 - (risk_ratio * 0.1)), # 배당률: 0.15 ~ 0.05
+        0.15,                                        # 뉴스감성: 고정
+        0.1,                                         # 유동성: 고정
+        0.05 + (risk_ratio * 0.1),                   # 기술적지표: 0.05 ~ 0.15
+    ), axis=-1)
+    # 가중치 정규화 (합이 1이 되도록)
+    return raw / raw.sum(axis=-1, keepdims=True)
+
+
+def score_weights(risk_tolerance):
+    """투자성향 하나의 요소 가중치 (dict)"""
+    return dict(zip(WEIGHT_KEYS, score_weight_matrix(risk_tolerance).tolist()))
+
+
+def split_balance(balance, risk_tolerance):
+    """투자성향에 따른 예적금 등 안전상품/투자 배분 (스칼라 또는 프로필 배열)
+
+    보수적 투자자일수록 안전상품 비율 높음: ≤30 60%, ≤50 40%, ≤70 20%, 그 외 10%
+    """
+    risk_tolerance = np.asarray(risk_tolerance)
+    conditions = [risk_tolerance <= 30, risk_tolerance <= 50, risk_tolerance <= 70]
+    savings_ratio = np.select(conditions, [0.6, 0.4, 0.2], default=0.1)
+    investment_ratio = np.select(conditions, [0.4, 0.6, 0.8], default=0.9)
+    balance = np.asarray(balance, dtype=np.float64)
+    return {
+        'savings_ratio': savings_ratio,
+        'investment_ratio': investment_ratio,
+        'savings_amount': np.trunc(balance * savings_ratio).astype(np.int64),
+        'investment_amount': np.trunc(balance * investment_ratio).astype(np.int64),
+    }
+
+
+def add_factor_scores(df_stocks):
+    """요소별 점수 컬럼 추가 (투자성향과 무관하므로 스냅샷마다 한 번만 계산)
+
+    행 단위 apply 대신 열 전체를 한 번에 변환합니다.
+    - 안정성: 변동성 60% + 시가총액 규모 40% (범주별 매핑)
+    - 밸류에이션: PER 10 이하 5점, 15 이하 4.5점, 20 이하 4점, 25 이하 3점, 35 이하 2점, 그 외 1점
+    - 기술적 지표: RSI 40~60 5점, 30~40/60~70 4점, 20~30/70~80 3점, 그 외 2점
+    """
+    df = df_stocks.copy()
+    df['안정성점수'] = (df['변동성'].map(VOLATILITY_SCORES).fillna(0).to_numpy(dtype=np.float64) * 0.6
+                     + df['시가총액규모'].map(MARKET_CAP_SCORES).fillna(0).to_numpy(dtype=np.float64) * 0.4)
+    per = df['PER'].to_numpy(dtype=np.float64)
+    df['밸류에이션점수'] = np.select(
+        [per <= 10, per <= 15, per <= 20, per <= 25, per <= 35], [5, 4.5, 4, 3, 2], default=1
+    )
+    df['유동성점수'] = df['유동성'].map(LIQUIDITY_SCORES).fillna(0).to_numpy(dtype=np.int64)
+    rsi = df['RSI'].to_numpy(dtype=np.float64)
+    df['기술적지표점수'] = np.select(
+        [(40 <= rsi) & (rsi <= 60),
+         ((30 <= rsi) & (rsi < 40)) | ((60 < rsi) & (rsi <= 70)),
+         ((20 <= rsi) & (rsi < 30)) | ((70 < rsi) & (rsi <= 80))],
+        [5, 4, 3], default=2
+    )
+
+    # 수익률, 배당률, 성장률 정규화 (0-5 점수로 변환)
+    df['수익률점수'] = normalize_score(df['최근수익률(%)'])
+    df['배당률점수'] = normalize_score(df['배당률(%)'])
+    df['성장률점수'] = normalize_score(df['성장률(%)'])
+    return df
+
+
+def build_snapshot(df_stocks, price_panel, days_ahead=FORECAST_DAYS):
+    """모든 프로필이 공유하는 스냅샷 계산: 요소 점수 행렬 + 앙상블 예측 + 위험 모델
+
+    price_panel은 프로필과 무관하도록 종목 전체(df_stocks)의 가격 패널을 사용합니다.
+    반환값 (dict): key, stocks(요소 점수 포함), factors(종목 × 요소), prices, 종목별 예측 배열,
+    feature_key, forecast, risk_model, groups(분산 그룹 라벨)와 정수 코드, similarity(비슷한 종목 인덱스)
+    """
+    df = add_factor_scores(df_stocks).reset_index(drop=True)
+    tickers = df['티커'].to_numpy()
+
+    feature_key, forecast, risk_model = None, None, None
+    if price_panel is not None and not price_panel.empty:
+        feature_key = materialize_features(price_panel)
+        features = open_feature_store(feature_key, price_panel=price_panel)['tensor']
+        # 가격 패널 전체 앙상블 예측 (드리프트 / Holt 지수평활 / AR / 이동평균 트렌드)
+        forecast = ensemble_forecast(price_panel.values, horizon=days_ahead, features=features,
+                                     feature_index=FEATURE_INDEX)
+        forecast['tickers'] = list(price_panel.columns)
+        forecast['future_dates'] = pd.date_range(
+            start=price_panel.index[-1] + timedelta(days=1), periods=days_ahead, freq='D'
+        )
+        # 위험 모델 (Ledoit-Wolf 수축 공분산 + 수익률 상관 군집)
+        risk_model = build_risk_model(price_panel.values, list(price_panel.columns))
+
+    if forecast is not None:
+        change_by_ticker = pd.Series(forecast['change_pct'], index=forecast['tickers'])
+        price_change_pct = pd.Series(tickers).map(change_by_ticker).to_numpy(dtype=np.float64)
+    else:
+        price_change_pct = np.full(len(df), np.nan)
+    has_forecast = np.isfinite(price_change_pct)
+
+    # 예측 변동률은 ±25% 이내로 제한 (30일 기준 현실적인 범위), 데이터 부족 시 약한 상승 예상
+    change_pct = np.where(has_forecast, np.clip(price_change_pct, -25, 25), 1.0)
+    prediction_score = np.where(has_forecast, get_prediction_score(change_pct), 0.5)
+
+    if risk_model is not None:
+        groups = cluster_labels(risk_model, tickers, df['섹터'].to_numpy())
+    else:
+        groups = df['섹터'].to_numpy()
+
+    # 스냅샷 키: 피처 저장소 키(가격 패널) + 종목 데이터(현재가 등) 해시 - 캐시 키로 사용
+    digest = hashlib.sha1(str(feature_key).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df_stocks, index=False).values.tobytes())
+
+    factors = df[list(FACTOR_COLUMNS)].to_numpy(dtype=np.float64)
+    return {
+        'key': digest.hexdigest()[:16],
+        'stocks': df,
+        'tickers': tickers,
+        'factors': factors,
+        'prices': df['현재가'].to_numpy(dtype=np.float64),
+        'stability': df['안정성점수'].to_numpy(dtype=np.float64),
+        'countries': df['국가'].to_numpy(),
+        'groups': groups,
+        # 배치 배분에서 라벨 비교를 정수로 하기 위한 코드
+        'country_codes': pd.factorize(df['국가'])[0],
+        'group_codes': pd.factorize(pd.Series(groups))[0],
+        'change_pct': change_pct,
+        'prediction_score': prediction_score,
+        'revenue_score': np.maximum(prediction_score, 0),  # 수익성 점수: 양수만 (상승 예상)
+        'feature_key': feature_key,
+        'forecast': forecast,
+        'risk_model': risk_model,
+        'similarity': build_similarity_index(tickers, factors, risk_model),
+    }
+
+
+def load_snapshot(period="3mo", fetch_prices=True, ttl=SNAPSHOT_TTL):
+    """헤드리스 환경용 스냅샷 (프로세스 안에서 ttl초 동안 재사용)"""
+    now = time.time()
+    if _snapshot_cache['snapshot'] is not None and now - _snapshot_cache['loaded_at'] < ttl:
+        return _snapshot_cache['snapshot']
+
+    df_stocks = load_universe(fetch_prices=fetch_prices)
+    price_panel = fetch_price_panel(tuple(df_stocks['티커']), tuple(df_stocks['국가']), period=period)
+    snapshot = build_snapshot(df_stocks, price_panel)
+    _snapshot_cache.update(snapshot=snapshot, loaded_at=now)
+    return snapshot
+
+
+def composite_scores(snapshot, risk_tolerances):
+    """투자성향별 종합점수 (프로필 × 종목) = 가중치 행렬 @ 요소 점수 행렬ᵀ"""
+    return score_weight_matrix(risk_tolerances) @ snapshot['factors'].T
+
+
+def _top_k(primary, secondary, positions, k):
+    """행마다 (primary, secondary, positions) 사전식 순서의 앞 k개 열 위치 (순서대로, 부족하면 -1)
+
+    primary가 inf인 칸은 후보가 아닙니다. argpartition으로 k번째 primary 값 이하인 칸만 남긴 뒤
+    그 칸들만 정렬하므로 전체 정렬 없이 O(열 수)로 동작합니다.
+    """
+    n_rows, n = primary.shape
+    positions = np.broadcast_to(positions, primary.shape)
+    if n > k:
+        kth = np.partition(primary, k - 1, axis=1)[:, k - 1:k]
+        keep = (primary <= kth) & np.isfinite(primary)
+        width = int(keep.sum(axis=1).max())
+        if width == 0:
+            return np.zeros((n_rows, 0), dtype=np.int64)
+        cols = np.argpartition(~keep, width - 1, axis=1)[:, :width]
+    else:
+        cols = np.broadcast_to(np.arange(n), primary.shape)
+
+    def take(values, index):
+        return np.take_along_axis(values, index, axis=1)
+
+    order = np.lexsort((take(positions, cols), take(secondary, cols), take(primary, cols)), axis=-1)[:, :k]
+    cols = take(cols, order)
+    return np.where(np.isfinite(take(primary, cols)), cols, -1)
+
+
+def top_positions(values, k):
+    """값이 큰 순서로 상위 k개 위치 (같으면 앞 위치 먼저) - 전체 정렬 대신 argpartition"""
+    values = np.asarray(values, dtype=np.float64)
+    cols = _top_k(-values[None, :], np.zeros((1, len(values))), np.arange(len(values)), k)[0]
+    return cols[cols >= 0]
+
+
+def _candidate_block(snapshot, weights, budgets, any_rising, positions, max_prices=None):
+    """positions 종목의 (프로필 × 종목) 정렬 키와 후보 점수 (후보 순서 규칙은 stream_candidates 참고)
+
+    정렬 키: primary(상승/중립은 -최종종합점수, 예측 제외는 오프셋 + 종목 위치, 후보가 아니면 inf),
+    secondary(-예측변동률), positions
+    """
+    prices = snapshot['prices'][positions]
+    buyable = (budgets[:, None] / prices[None, :]).astype(np.int64) >= 1
+    rising = buyable & (snapshot['prediction_score'][positions] >= 0)[None, :] & any_rising[:, None]
+    eligible = buyable if max_prices is None else buyable & (prices[None, :] <= np.asarray(max_prices)[:, None])
+    composite = weights @ snapshot['factors'][positions].T
+    revenue_score = snapshot['revenue_score'][positions]
+    final_score = composite * 0.25 + revenue_score * 0.50 + snapshot['stability'][positions] * 0.25
+    return {
+        'primary': np.where(eligible, np.where(rising, -final_score, _TIER_OFFSET + positions), np.inf),
+        'secondary': np.where(rising, -snapshot['change_pct'][positions], 0.0),
+        'positions': np.broadcast_to(positions, buyable.shape),
+        'composite': composite,
+        'final_score': np.where(rising, final_score, composite),
+        'revenue_score': np.where(rising, revenue_score, 0.0),
+        'change_pct': np.where(rising, snapshot['change_pct'][positions], 0.0),
+        'prediction_score': np.where(rising, snapshot['prediction_score'][positions], 0.0),
+    }
+
+
+def _profile_totals(snapshot, budgets, chunks):
+    """프로필별 집계 (매수 가능 종목 수, 상승/중립 종목 유무, 수익성 점수 최댓값)를 종목 청크 단위로 계산"""
+    n_valid = np.zeros(len(budgets), dtype=np.int64)
+    any_rising = np.zeros(len(budgets), dtype=bool)
+    max_revenue = np.zeros(len(budgets))
+    for start, stop in chunks:
+        buyable = (budgets[:, None] / snapshot['prices'][None, start:stop]).astype(np.int64) >= 1
+        rising = buyable & (snapshot['prediction_score'][None, start:stop] >= 0)
+        n_valid += buyable.sum(axis=1)
+        any_rising |= rising.any(axis=1)
+        max_revenue = np.maximum(max_revenue, np.where(rising, snapshot['revenue_score'][None, start:stop], 0.0).max(axis=1))
+    return n_valid, any_rising, max_revenue
+
+
+def _chunks(n, chunk_size):
+    return [(start, min(start + chunk_size, n)) for start in range(0, n, chunk_size)]
+
+
+def stream_candidates(snapshot, risk_tolerances, budgets, k, max_prices=None, chunk_size=None):
+    """프로필별 상위 k개 후보를 종목 청크 단위로 계산
+
+    후보 순서:
+    1. 투자 금액으로 1주 이상 살 수 있는 종목 중 하락 예상(예측점수 < 0)이 아닌 종목을
+       최종종합점수(종합점수 25% + 예측 수익성 50% + 안정성 25%), 예측변동률 순으로 정렬
+    2. 그 뒤에 하락 예상 종목을 예측 없이 원래 순서로 추가
+    3. 상승/중립 종목이 하나도 없는 프로필은 예측 없이 매수 가능 종목 전체를 종합점수로 사용
+
+    종목을 chunk_size개(기본: SCORE_BLOCK / 프로필 수)씩 나눠 종합점수 → 최종종합점수 → 정렬 키를 만들고, 청크마다 argpartition으로 고른
+    상위 k개를 지금까지의 상위 k개와 합쳐 다시 고릅니다. 종목 수가 늘어도 (프로필 × 청크) 크기 배열만 씁니다.
+    max_prices: 프로필별 가격 상한 - 주어지면 상한 이하 종목만 후보 (배분 엔진의 종목당 상한)
+    반환값 (dict): 후보 순서의 (프로필, k) 배열 order(종목 위치, 후보가 아닌 칸은 -1), valid, final_score,
+    revenue_score, change_pct, prediction_score와 프로필별 n_valid(매수 가능 종목 수), any_rising,
+    max_revenue(매수 가능 후보 전체의 수익성 점수 최댓값)
+    """
+    budgets = np.atleast_1d(np.asarray(budgets, dtype=np.float64))
+    n_profiles = len(budgets)
+    weights = np.broadcast_to(score_weight_matrix(risk_tolerances), (n_profiles, len(WEIGHT_KEYS)))
+    if chunk_size is None:
+        chunk_size = max(256, SCORE_BLOCK // n_profiles)
+    chunks = _chunks(len(snapshot['tickers']), chunk_size)
+    n_valid, any_rising, max_revenue = _profile_totals(snapshot, budgets, chunks)
+
+    keys = ('primary', 'secondary', 'positions', 'final_score', 'revenue_score', 'change_pct', 'prediction_score')
+    best = {key: np.zeros((n_profiles, 0), dtype=np.int64 if key == 'positions' else np.float64) for key in keys}
+    for start, stop in chunks:
+        block = _candidate_block(snapshot, weights, budgets, any_rising, np.arange(start, stop), max_prices)
+        block = {key: np.concatenate([best[key], block[key]], axis=1) for key in keys}
+        cols = _top_k(block['primary'], block['secondary'], block['positions'], k)
+        best = {key: np.take_along_axis(value, np.maximum(cols, 0), axis=1) for key, value in block.items()}
+        best['primary'] = np.where(cols >= 0, best['primary'], np.inf)
+
+    if best['primary'].shape[1] == 0:
+        # 어떤 프로필에도 후보가 없으면 (잔액 0, 모든 종목보다 작은 예산) 빈 후보 한 칸으로 채움 - 배분 엔진은 너비 1 이상을 기대
+        best = {key: np.zeros((n_profiles, 1), dtype=value.dtype) for key, value in best.items()}
+        best['primary'][:] = np.inf
+    valid = np.isfinite(best['primary'])
+    result = {key: np.where(valid, best[key], 0.0)
+              for key in ('final_score', 'revenue_score', 'change_pct', 'prediction_score')}
+    result.update(order=np.where(valid, best['positions'], -1), valid=valid, n_valid=n_valid,
+                  any_rising=any_rising, max_revenue=max_revenue)
+    return result
+
+
+def _position_cap(budgets):
+    """allocate_portfolio 기본값의 종목당 최대 투자 금액 (예산의 20%, 12종목이면 1/12 이상)"""
+    return np.asarray(budgets, dtype=np.float64) * max(0.2, 1.0 / 12)
+
+
+def build_candidates(snapshot, risk_tolerance, investment_amount, target_stocks=10):
+    """프로필 하나의 후보 종목 DataFrame (stream_candidates 순서, 예측/최종 점수 컬럼 포함)
+
+    전체 종목을 정렬하지 않고 stream_candidates로 고른 종목만 표로 만듭니다.
+    - 상위 target_stocks개 (너무 비싼 종목 대체 판단용)
+    - 종목당 상한 이하 상위 target_stocks × CANDIDATE_POOL개 (배분 후보 풀)
+    - 상위 종목 중 상한을 넘는 종목마다 스냅샷 전체에서 가장 비슷한 상한 이하 종목 (대체 후보)
+    전체 후보 기준 수익성 점수 최댓값은 attrs['max_revenue']에 기록해 배분 비중이 전체 정렬 때와 같게 합니다.
+    """
+    budgets = np.array([investment_amount], dtype=np.float64)
+    cap = _position_cap(budgets)
+    top = stream_candidates(snapshot, risk_tolerance, budgets, target_stocks)
+    pool = stream_candidates(snapshot, risk_tolerance, budgets, target_stocks * CANDIDATE_POOL, max_prices=cap)
+    leaders = top['order'][0][top['valid'][0]]
+    positions = [leaders, pool['order'][0][pool['valid'][0]]]
+
+    blocked = leaders[snapshot['prices'][leaders] > cap[0]]
+    similarity = snapshot.get('similarity')
+    if len(blocked) > 0 and similarity is not None:
+        allowed = snapshot['prices'] <= cap[0]
+        allowed[leaders] = False
+        for position in blocked:
+            positions.append(substitute_candidates(similarity, snapshot['tickers'][position], allowed, k=len(blocked)))
+
+    # 고른 종목만 다시 정렬 키로 정렬 (전체 순서에서 이 종목들의 상대 순서와 같음)
+    positions = np.unique(np.concatenate(positions).astype(np.int64))
+    block = _candidate_block(snapshot, score_weight_matrix(risk_tolerance)[None, :], budgets,
+                             top['any_rising'], positions)
+    order = np.lexsort((positions, block['secondary'][0], block['primary'][0]))
+    order = order[np.isfinite(block['primary'][0][order])]
+
+    stocks = snapshot['stocks'].iloc[positions[order]].reset_index(drop=True)
+    composite = block['composite'][0][order]
+    shares = (investment_amount / stocks['현재가']).astype(int)
+    df_candidates = pd.concat([stocks, pd.DataFrame({
+        '종합점수': composite,
+        '다양성보너스': 0.0,
+        '총점': composite,
+        '매수가능주수': shares,
+        '매수가능금액': shares * stocks['현재가'],
+        '예측변동률': block['change_pct'][0][order],
+        '예측점수': block['prediction_score'][0][order],
+        '수익성점수': block['revenue_score'][0][order],
+        '최종종합점수': block['final_score'][0][order],
+    })], axis=1)
+    df_candidates.attrs['max_revenue'] = float(pool['max_revenue'][0])
+    return df_candidates
+
+
+def _covariance_weight_fn(risk_model, tickers, expected, method, risk_tolerance):
+    """선정된 종목의 공분산으로 목표 비중을 계산하는 weight_fn (기대수익률은 30일 예측 변동률)"""
+    def weight_fn(picks):
+        cov = covariance_subset(risk_model, tickers[picks])
+        mu = expected[picks] if expected is not None else None
+        return optimize_weights(cov, method, mu=mu, risk_tolerance=risk_tolerance)
+    return weight_fn
+
+
+def _pick_substitutes(similarity, tickers, allowed, orders=None):
+    """tickers 순서대로 요소 공간에서 가장 비슷한 allowed 종목 위치 (없으면 -1) - 한 번 고른 종목은 다시 고르지 않음
+
+    orders: 티커 → factor_order 결과 캐시 (여러 프로필이 같은 종목을 대체할 때 공유)
+    """
+    orders = {} if orders is None else orders
+    allowed = allowed.copy()
+    found = np.full(len(tickers), -1, dtype=np.int64)
+    for i, ticker in enumerate(tickers):
+        if ticker not in orders:
+            orders[ticker] = factor_order(similarity, ticker)
+        nearest = substitute_candidates(similarity, ticker, allowed, k=1, order=orders[ticker])
+        if len(nearest) > 0:
+            found[i] = nearest[0]
+            allowed[nearest[0]] = False
+    return found
+
+
+def _substitute_unaffordable(df, similarity, investment_amount, target_stocks, score_col):
+    """상위 후보 중 종목당 상한으로 1주도 살 수 없는 종목을 요소 공간에서 가장 비슷한 후보로 대체
+
+    대체 종목은 원래 종목 바로 뒤로 옮기고 원래 종목의 점수를 이어받습니다 ('대체대상'에 원래 회사명).
+    """
+    df = df.reset_index(drop=True)
+    df['대체대상'] = ''
+    cap = _position_cap(investment_amount)
+    prices = df['현재가'].to_numpy(dtype=np.float64)
+    top = np.arange(min(target_stocks, len(df)))
+    blocked = top[prices[top] > cap]
+    if len(blocked) == 0:
+        return df
+
+    # 살 수 있고 아직 상위 후보가 아닌 종목만 대체 후보 (스냅샷 종목 위치 기준 마스크)
+    positions = np.array([similarity['ticker_index'].get(t, -1) for t in df['티커']])
+    eligible = (positions >= 0) & (prices <= cap)
+    eligible[top] = False
+    allowed = np.zeros(len(similarity['ticker_index']), dtype=bool)
+    allowed[positions[eligible]] = True
+    row_of = {p: r for r, p in enumerate(positions) if p >= 0}
+
+    order = list(range(len(df)))
+    scores = df[score_col].to_numpy(dtype=np.float64).copy()
+    found = _pick_substitutes(similarity, df['티커'].to_numpy()[blocked], allowed)
+    for b, position in zip(blocked, found):
+        if position < 0:
+            continue
+        r = row_of[position]
+        scores[r] = max(scores[r], scores[b])
+        df.loc[r, '대체대상'] = df['회사명'].iloc[b]
+        order.remove(r)
+        order.insert(order.index(b) + 1, r)
+    df[score_col] = scores
+    return df.iloc[order].reset_index(drop=True)
+
+
+# 포트폴리오 다양성 고려한 최종 추천 (정수 주식 수 배분 엔진)
+def select_diversified_portfolio(df, target_stocks=10, investment_amount=0, method='score', risk_model=None, risk_tolerance=50,
+                                 similarity=None):
+    """다양성을 고려한 포트폴리오 선택 - 예산 안에서 정수 주식 수 배분 (8~12개 종목)
+
+    method: 'score'(점수 가중) 또는 공분산 기반 'min_variance' / 'risk_parity' / 'mean_variance'
+    다양성 보너스는 수익률 상관 군집 기준 (위험 모델에 없는 종목은 섹터 기준)
+    similarity: 스냅샷의 비슷한 종목 인덱스 - 주어지면 너무 비싼 상위 후보를 비슷한 종목으로 대체
+    """
+    if len(df) == 0:
+        return pd.DataFrame()
+
+    score_col = '최종종합점수' if '최종종합점수' in df.columns else '종합점수'
+    max_revenue = df.attrs.get('max_revenue')  # build_candidates가 남긴 전체 후보 기준 최댓값
+    if similarity is not None:
+        df = _substitute_unaffordable(df, similarity, investment_amount, target_stocks, score_col)
+
+    weight_fn = None
+    if method != 'score' and risk_model is not None:
+        expected = df['예측변동률'].to_numpy() / 100 if '예측변동률' in df.columns else None
+        weight_fn = _covariance_weight_fn(risk_model, df['티커'].to_numpy(), expected, method, risk_tolerance)
+
+    if risk_model is not None:
+        groups = cluster_labels(risk_model, df['티커'].to_numpy(), df['섹터'].to_numpy())
+    else:
+        groups = df['섹터'].to_numpy()
+
+    plan = allocate_portfolio(
+        prices=df['현재가'].to_numpy(),
+        scores=df[score_col].to_numpy(),
+        budget=investment_amount,
+        groups=groups,
+        countries=df['국가'].to_numpy(),
+        revenue_scores=df['수익성점수'].to_numpy() if '수익성점수' in df.columns else None,
+        target_stocks=target_stocks,
+        weight_fn=weight_fn,
+        max_revenue=max_revenue
+    )
+    if len(plan['positions']) == 0:
+        return pd.DataFrame()
+
+    df_selected = df.iloc[plan['positions']].copy()
+    df_selected['분산그룹'] = groups[plan['positions']]
+    df_selected['다양성보너스'] = plan['diversity_bonus']
+    df_selected['최종점수'] = plan['final_score']
+    df_selected['매수가능주수'] = plan['shares']
+    df_selected['매수가능금액'] = plan['amounts']
+
+    # 최종 정렬: 1순위 최종점수, 2순위 예측변동률 (수익률 예상)
+    if '예측변동률' in df_selected.columns:
+        df_selected = df_selected.sort_values(['최종점수', '예측변동률'], ascending=[False, False])
+    else:
+        df_selected = df_selected.sort_values('최종점수', ascending=False)
+
+    return df_selected.reset_index(drop=True)
+
+
+def _substitute_ranked(snapshot, ranked, risk_tolerances, budgets, target_stocks):
+    """recommend_batch 후보 풀(stream_candidates 결과)에 _substitute_unaffordable과 같은 대체 규칙 적용
+
+    프로필별 상위 target_stocks개 중 종목당 상한을 넘는 종목마다 상한 이하의 가장 비슷한 종목을 그 순위 바로 뒤로
+    옮기고 점수를 이어받게 합니다. 상한을 넘는 상위 종목이 있는 프로필만 다시 계산합니다.
+    """
+    cap = _position_cap(budgets)
+    top = stream_candidates(snapshot, risk_tolerances, budgets, target_stocks)
+    blocked = top['valid'] & (snapshot['prices'][np.where(top['valid'], top['order'], 0)] > cap[:, None])
+    profiles = np.flatnonzero(blocked.any(axis=1))
+    if len(profiles) == 0:
+        return ranked
+
+    # 1. 프로필별 대체 종목 선정 (한 번 고른 종목은 같은 프로필에서 다시 고르지 않음)
+    orders = {}
+    swaps = []
+    for p in profiles:
+        leaders = top['order'][p][top['valid'][p]]
+        allowed = snapshot['prices'] <= cap[p]
+        allowed[leaders] = False
+        blocked_rank = np.flatnonzero(blocked[p])
+        found = _pick_substitutes(snapshot['similarity'], snapshot['tickers'][leaders[blocked_rank]], allowed, orders)
+        if (found >= 0).any():
+            swaps.append((p, leaders, blocked_rank[found >= 0], found[found >= 0]))
+    if not swaps:
+        return ranked
+
+    # 2. 대체 종목 점수는 (대체가 있는 프로필 × 대체 종목 합집합) 한 블록으로 계산
+    rows = np.array([p for p, *_ in swaps])
+    union = np.unique(np.concatenate([found for *_, found in swaps]))
+    weights = np.broadcast_to(score_weight_matrix(risk_tolerances), (len(budgets), len(WEIGHT_KEYS)))[rows]
+    block = _candidate_block(snapshot, weights, budgets[rows], top['any_rising'][rows], union)
+
+    # 3. 후보 풀 다시 정렬: 상위 종목은 그 순위, 나머지 풀은 target_stocks + 풀 순서, 대체 종목은 원래 종목 순위 + 0.5
+    keys = ('final_score', 'revenue_score', 'change_pct', 'prediction_score')
+    ranked = dict(ranked, **{key: ranked[key].copy() for key in keys + ('order', 'valid')})
+    width = ranked['order'].shape[1]
+    for row, (p, leaders, blocked_rank, found) in enumerate(swaps):
+        valid = ranked['valid'][p]
+        pool = ranked['order'][p][valid]
+        match = pool[:, None] == leaders[None, :]
+        pool_rank = np.where(match.any(axis=1), match.argmax(axis=1), target_stocks + np.arange(len(pool)))
+        keep = ~np.isin(pool, found)
+        cols = np.searchsorted(union, found)
+        scores = {key: block[key][row][cols] for key in keys}
+        scores['final_score'] = np.maximum(scores['final_score'], top['final_score'][p][blocked_rank])
+        sort = np.argsort(np.concatenate([pool_rank[keep], blocked_rank + 0.5]), kind='stable')[:width]
+        n = len(sort)
+        for key in keys:
+            values = np.concatenate([ranked[key][p][valid][keep], scores[key]])[sort]
+            ranked[key][p] = 0.0
+            ranked[key][p][:n] = values
+        order = np.concatenate([pool[keep], found])[sort]
+        ranked['order'][p] = -1
+        ranked['order'][p][:n] = order
+        ranked['valid'][p] = np.arange(width) < n
+    return ranked
+
+
+def recommend_batch(snapshot, balances, risk_tolerances, method='score', target_stocks=10):
+    """여러 프로필 (잔액, 투자성향)의 추천 포트폴리오를 한 번에 계산
+
+    스냅샷의 요소 점수 행렬·예측·공분산을 모든 프로필이 공유하고, 예산 분배·종합점수·후보 정렬·
+    정수 주식 수 배분을 (프로필 × 종목) 행렬 연산으로 처리합니다.
+    반환값 (dict): 프로필별 savings_amount, investment_amount, leftover와
+    (프로필, 최대 종목 수) 배열 positions(스냅샷 종목 위치, 미선택은 -1), shares, amounts,
+    diversity_bonus, final_score, change_pct
+    """
+    balances = np.atleast_1d(np.asarray(balances, dtype=np.float64))
+    risk_tolerances = np.broadcast_to(np.asarray(risk_tolerances, dtype=np.float64), balances.shape)
+
+    split = split_balance(np.maximum(balances, 0), risk_tolerances)
+    budgets = split['investment_amount'].astype(np.float64)
+    # 배분 엔진은 종목당 상한 이하 상위 target_stocks × 2개만 후보 풀로 쓰므로 그만큼만 선정
+    ranked = stream_candidates(snapshot, risk_tolerances, budgets, target_stocks * 2, max_prices=_position_cap(budgets))
+    if snapshot.get('similarity') is not None:
+        # 너무 비싼 상위 종목은 대시보드(select_diversified_portfolio)와 같이 비슷한 종목으로 대체
+        ranked = _substitute_ranked(snapshot, ranked, risk_tolerances, budgets, target_stocks)
+    order = np.where(ranked['valid'], ranked['order'], 0)
+
+    weight_fn = None
+    risk_model = snapshot['risk_model']
+    if method != 'score' and risk_model is not None:
+        tickers = snapshot['tickers']
+        def weight_fn(p, picks):
+            fn = _covariance_weight_fn(risk_model, tickers[order[p]], ranked['change_pct'][p] / 100,
+                                       method, risk_tolerances[p])
+            return fn(picks)
+
+    plan = allocate_portfolio_batch(
+        prices=snapshot['prices'][order],
+        scores=ranked['final_score'],
+        budgets=budgets,
+        groups=snapshot['group_codes'][order],
+        countries=snapshot['country_codes'][order],
+        revenue_scores=ranked['revenue_score'],
+        valid=ranked['valid'],
+        target_stocks=target_stocks,
+        weight_fn=weight_fn,
+        max_revenue=ranked['max_revenue']
+    )
+    bought = plan['positions'] >= 0
+    picks = np.where(bought, plan['positions'], 0)
+    return {
+        'savings_amount': split['savings_amount'],
+        'investment_amount': split['investment_amount'],
+        'leftover': plan['leftover'],
+        'positions': np.where(bought, np.take_along_axis(order, picks, axis=1), -1),
+        'shares': plan['shares'],
+        'amounts': plan['amounts'],
+        'diversity_bonus': plan['diversity_bonus'],
+        'final_score': plan['final_score'],
+        'change_pct': np.where(bought, np.take_along_axis(ranked['change_pct'], picks, axis=1), np.nan),
+    }
+
+
+def efficient_frontier(snapshot, balance, method='score', risk_levels=RISK_LEVELS, target_stocks=10):
+    """투자성향 0~100 전체의 추천 포트폴리오를 한 번의 recommend_batch로 계산한 효율적 투자선 표
+
+    같은 잔액으로 모든 투자성향을 배치로 처리하고, 공유 공분산/예측으로 포트폴리오별
+    30일 예상 수익률과 1개월 예상 변동성을 행렬 연산으로 계산합니다.
+    반환값 (DataFrame): 투자성향, 투자금액, 투자된금액, 종목수, 예상수익률(%), 예상변동성(%), 구성
+    """
+    risk_levels = np.asarray(risk_levels)
+    result = recommend_batch(snapshot, np.full(len(risk_levels), balance, dtype=np.float64), risk_levels,
+                             method=method, target_stocks=target_stocks)
+    bought = result['positions'] >= 0
+    rows, cols = np.nonzero(bought)
+    invested = result['amounts'].sum(axis=1)
+
+    # 포트폴리오 × 보유 종목 비중 행렬 (투자된 금액 기준) - 어느 포트폴리오에든 들어간 종목(최대 101 × 12개)만 사용
+    held, held_col = np.unique(result['positions'][rows, cols], return_inverse=True)
+    weights = np.zeros((len(risk_levels), len(held)))
+    weights[rows, held_col] = result['amounts'][rows, cols] / invested[rows]
+    expected_return = weights @ snapshot['change_pct'][held]
+    if snapshot['risk_model'] is not None:
+        cov = covariance_subset(snapshot['risk_model'], snapshot['tickers'][held])
+        volatility = np.sqrt(np.maximum(np.einsum('pi,ij,pj->p', weights, cov, weights), 0))
+    else:
+        volatility = np.full(len(risk_levels), np.nan)
+
+    # 종목 구성 (금액 큰 순) - 차트 hover와 표에서 바로 사용
+    names = snapshot['stocks']['회사명'].to_numpy()
+    holdings = []
+    for p in range(len(risk_levels)):
+        held = np.flatnonzero(bought[p])
+        held = held[np.argsort(-result['amounts'][p][held], kind='stable')]
+        holdings.append(', '.join(f"{names[result['positions'][p][j]]} {result['shares'][p][j]}주" for j in held))
+
+    return pd.DataFrame({
+        '투자성향': risk_levels,
+        '투자금액': result['investment_amount'],
+        '투자된금액': invested,
+        '종목수': bought.sum(axis=1),
+        '예상수익률(%)': np.where(invested > 0, expected_return, np.nan),
+        '예상변동성(%)': np.where(invested > 0, volatility * 100, np.nan),
+        '구성': holdings,
+    })
+
+
+def batch_records(snapshot, result):
+    """recommend_batch 결과를 프로필별 JSON 직렬화 가능한 dict 리스트로 변환 (이메일/API용)
+
+    종목은 최종점수, 예측변동률 순으로 정렬합니다.
+    """
+    stocks = snapshot['stocks']
+    names, sectors = stocks['회사명'].to_numpy(), stocks['섹터'].to_numpy()
+    records = []
+    for p in range(len(result['leftover'])):
+        bought = np.flatnonzero(result['positions'][p] >= 0)
+        bought = bought[np.lexsort((-result['change_pct'][p][bought], -result['final_score'][p][bought]))]
+        holdings = []
+        for j in bought:
+            i = result['positions'][p][j]
+            holdings.append({
+                'ticker': str(snapshot['tickers'][i]),
+                'name': str(names[i]),
+                'country': str(snapshot['countries'][i]),
+                'sector': str(sectors[i]),
+                'price': float(snapshot['prices'][i]),
+                'shares': int(result['shares'][p][j]),
+                'amount': float(result['amounts'][p][j]),
+                'final_score': float(result['final_score'][p][j]),
+                'diversity_bonus': float(result['diversity_bonus'][p][j]),
+                'change_pct': float(result['change_pct'][p][j]),
+            })
+        records.append({
+            'savings_amount': int(result['savings_amount'][p]),
+            'investment_amount': int(result['investment_amount'][p]),
+            'leftover': float(result['leftover'][p]),
+            'holdings': holdings,
+        })
+    return records
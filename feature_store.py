@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from forecast import fill_price_panel
+
+# 가격 패널에서 파생되는 예측/차트용 피처 저장소
+# 새로고침마다 (날짜, 종목, 피처) float32 텐서를 한 번만 계산해 디스크에 저장하고,
+# 예측(이동평균 트렌드 모델)과 차트(MA20)는 메모리 맵으로 같은 파일을 복사 없이 읽습니다.
+
+FEATURES = (
+    'ma5',              # 5일 이동평균
+    'ma20',             # 20일 이동평균
+    'return_mean_30d',  # 30일 구간 일간 수익률 평균
+)
+FEATURE_INDEX = {name: i for i, name in enumerate(FEATURES)}
+
+STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.feature_store')
+MAX_SNAPSHOTS = 8  # 디스크에 보관할 최근 스냅샷 수
+
+
+def _rolling_mean(values, window):
+    """누적합 기반 이동평균 (초기 구간은 가능한 관측만으로 평균)"""
+    n_dates = values.shape[0]
+    cumsum = np.concatenate([np.zeros((1,) + values.shape[1:]), np.cumsum(values, axis=0)])
+    end = np.arange(1, n_dates + 1)
+    start = np.maximum(end - window, 0)
+    counts = (end - start).reshape((-1,) + (1,) * (values.ndim - 1))
+    return (cumsum[end] - cumsum[start]) / counts
+
+
+def _lagged_return(prices, lag):
+    """lag일 수익률 (초기 구간은 첫 종가 기준)"""
+    base = prices[np.maximum(np.arange(prices.shape[0]) - lag, 0)]
+    return prices / base - 1
+
+
+def compute_features(prices):
+    """(날짜, 종목) 가격 배열에서 (날짜, 종목, 피처) float32 텐서 계산"""
+    filled, _ = fill_price_panel(prices)
+    columns = {
+        'ma5': _rolling_mean(filled, 5),
+        'ma20': _rolling_mean(filled, 20),
+        'return_mean_30d': _rolling_mean(_lagged_return(filled, 1), 29),
+    }
+    return np.stack([columns[name] for name in FEATURES], axis=-1).astype(np.float32)
+
+
+def snapshot_key(price_panel):
+    """가격 패널(날짜 × 티커 DataFrame)의 내용 기반 스냅샷 키 (피처 구성이 바뀌면 키도 바뀜)"""
+    digest = hashlib.sha1('|'.join(FEATURES).encode('utf-8'))
+    digest.update('|'.join(map(str, price_panel.columns)).encode('utf-8'))
+    digest.update(np.asarray(price_panel.index.asi8).tobytes())
+    digest.update(np.ascontiguousarray(price_panel.values, dtype=np.float64).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def _paths(key, root):
+    return os.path.join(root, f"{key}.npy"), os.path.join(root, f"{key}.json")
+
+
+def _touch(key, root):
+    """스냅샷을 방금 사용한 것으로 표시 (정리 순서는 메타 파일 수정 시각 기준)"""
+    try:
+        os.utime(_paths(key, root)[1])
+    except OSError:
+        pass
+
+
+def _prune_snapshots(root, keep, protect=()):
+    """오래된 스냅샷 파일 정리 (최근 사용한 keep개와 protect 키는 유지)
+
+    다른 세션이 연 스냅샷은 열 때마다 사용 시각이 갱신되어 남고, 그래도 지워진 경우 open_feature_store가 다시 만듭니다.
+    """
+    metas = []
+    for f in os.listdir(root):
+        if f.endswith('.json') and f[:-len('.json')] not in protect:
+            try:
+                metas.append((os.path.getmtime(os.path.join(root, f)), f))
+            except OSError:  # 다른 프로세스가 이미 정리함
+                pass
+    metas.sort(reverse=True)
+    for _, meta in metas[max(keep - len(protect), 0):]:
+        key = meta[:-len('.json')]
+        for path in _paths(key, root):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def materialize_features(price_panel, root=STORE_DIR):
+    """가격 패널의 피처 텐서를 디스크에 생성 (이미 있으면 재사용)하고 스냅샷 키 반환"""
+    key = snapshot_key(price_panel)
+    tensor_path, meta_path = _paths(key, root)
+    if os.path.exists(tensor_path) and os.path.exists(meta_path):
+        _touch(key, root)
+        return key
+
+    os.makedirs(root, exist_ok=True)
+    features = compute_features(price_panel.values)
+
+    # 임시 파일에 쓴 뒤 교체하여 다른 세션이 쓰는 중인 파일을 읽지 않도록 함
+    tmp_tensor = f"{tensor_path}.{os.getpid()}.tmp"
+    tensor = np.lib.format.open_memmap(tmp_tensor, mode='w+', dtype=np.float32, shape=features.shape)
+    tensor[:] = features
+    tensor.flush()
+    del tensor
+    os.replace(tmp_tensor, tensor_path)
+
+    meta = {
+        'dates': [d.strftime('%Y-%m-%d') for d in pd.to_datetime(price_panel.index)],
+        'tickers': [str(t) for t in price_panel.columns],
+        'features': list(FEATURES),
+    }
+    tmp_meta = f"{meta_path}.{os.getpid()}.tmp"
+    with open(tmp_meta, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp_meta, meta_path)
+
+    _prune_snapshots(root, MAX_SNAPSHOTS, protect={key})
+    return key
+
+
+def open_feature_store(key, root=STORE_DIR, price_panel=None):
+    """스냅샷 키의 피처 텐서를 읽기 전용 메모리 맵으로 열기
+
+    파일이 정리되어 없으면 price_panel(같은 키의 가격 패널)로 다시 만들고, 가격 패널이 없거나
+    키가 다르면 None을 반환합니다. 이미 연 메모리 맵은 파일이 지워져도 계속 읽을 수 있습니다.
+    """
+    tensor_path, meta_path = _paths(key, root)
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        tensor = np.load(tensor_path, mmap_mode='r')
+    except FileNotFoundError:
+        if price_panel is None or snapshot_key(price_panel) != key:
+            return None
+        materialize_features(price_panel, root)
+        return open_feature_store(key, root)
+    _touch(key, root)
+    return {
+        'key': key,
+        'tensor': tensor,
+        'dates': pd.DatetimeIndex(meta['dates']),
+        'tickers': meta['tickers'],
+        'ticker_index': {ticker: i for i, ticker in enumerate(meta['tickers'])},
+    }
+
+
+def feature_series(store, ticker, name):
+    """한 종목의 피처 시계열 (없는 종목이면 None)"""
+    col = store['ticker_index'].get(ticker)
+    if col is None:
+        return None
+    return pd.Series(store['tensor'][:, col, FEATURE_INDEX[name]], index=store['dates'], name=name)
@@ -0,0 +1,216 @@
+import numpy as np
+
+# 가격 패널(날짜 × 종목) 전체를 한 번에 처리하는 고전 시계열 앙상블 예측
+# 모든 모델은 종목 축으로 벡터화되어 있어 종목 수와 무관하게 한 번의 연산으로 적합됩니다.
+
+# Holt 지수평활 파라미터 후보 (alpha, beta) - 종목별로 1-step 오차가 가장 작은 조합 선택
+HOLT_GRID = [(alpha, beta) for alpha in (0.2, 0.4, 0.6, 0.8) for beta in (0.02, 0.1, 0.3)]
+
+
+def fill_price_panel(prices):
+    """결측값을 직전 종가로 채운 가격 패널과 종목별 유효 관측 수 반환"""
+    panel = np.asarray(prices, dtype=np.float64)
+    if panel.ndim == 1:
+        panel = panel[:, None]
+    n_dates, n_tickers = panel.shape
+    valid = np.isfinite(panel) & (panel > 0)
+    cols = np.arange(n_tickers)
+
+    # 앞으로 채우기 (마지막 유효 관측의 행 인덱스를 누적 최대값으로 계산)
+    last_valid_row = np.where(valid, np.arange(n_dates)[:, None], 0)
+    np.maximum.accumulate(last_valid_row, axis=0, out=last_valid_row)
+    filled = panel[last_valid_row, cols]
+
+    # 첫 관측 이전 구간은 첫 유효값으로 채움
+    first_row = valid.argmax(axis=0)
+    leading = np.arange(n_dates)[:, None] < first_row[None, :]
+    filled = np.where(leading, panel[first_row, cols][None, :], filled)
+    filled[:, ~valid.any(axis=0)] = np.nan
+
+    return filled, valid.sum(axis=0)
+
+
+def forecast_drift(log_prices, horizon):
+    """드리프트 모델: 전체 기간 평균 로그 수익률로 직선 외삽"""
+    n_dates = log_prices.shape[0]
+    slope = (log_prices[-1] - log_prices[0]) / max(n_dates - 1, 1)
+    steps = np.arange(1, horizon + 1)[:, None]
+    return log_prices[-1] + steps * slope
+
+
+def forecast_holt(log_prices, horizon, damping=0.9):
+    """감쇠 추세 Holt 지수평활 - 파라미터 그리드 전체를 (조합 × 종목)으로 동시에 적합"""
+    n_dates, n_tickers = log_prices.shape
+    alphas = np.array([g[0] for g in HOLT_GRID])[:, None]
+    betas = np.array([g[1] for g in HOLT_GRID])[:, None]
+
+    level = np.repeat(log_prices[:1], len(HOLT_GRID), axis=0)
+    if n_dates > 1:
+        trend = np.repeat(log_prices[1:2] - log_prices[:1], len(HOLT_GRID), axis=0)
+    else:
+        trend = np.zeros_like(level)
+    sse = np.zeros_like(level)
+
+    # 오차 수정(error-correction) 형태의 점화식 - 시간 축만 반복, 종목/그리드 축은 벡터화
+    for t in range(1, n_dates):
+        one_step = level + damping * trend
+        error = log_prices[t] - one_step
+        sse += error ** 2
+        level = one_step + alphas * error
+        trend = damping * trend + alphas * betas * error
+
+    best = sse.argmin(axis=0)
+    cols = np.arange(n_tickers)
+    damped_steps = np.cumsum(damping ** np.arange(1, horizon + 1))[:, None]
+    return level[best, cols] + damped_steps * trend[best, cols]
+
+
+def forecast_ar(log_prices, horizon, order=3, ridge=1e-3):
+    """로그 수익률 AR(p) 모델 - 전 종목의 최소제곱 문제를 배치 선형계 한 번으로 풀이"""
+    returns = np.diff(log_prices, axis=0)
+    n_obs = returns.shape[0] - order
+    if n_obs < order + 2:
+        return forecast_drift(log_prices, horizon)
+
+    # 설계행렬 (종목, 관측, 상수항 + 시차 p개)
+    lags = np.stack(
+        [returns[order - k - 1:order - k - 1 + n_obs] for k in range(order)],
+        axis=-1
+    )
+    design = np.concatenate([np.ones(lags.shape[:2] + (1,)), lags], axis=-1).transpose(1, 0, 2)
+    target = returns[order:].T
+
+    # 정규방정식 + 릿지 정규화 (짧은 구간에서도 해가 안정적이도록)
+    gram = design.transpose(0, 2, 1) @ design + ridge * n_obs * np.eye(order + 1)
+    moment = np.einsum('nti,nt->ni', design, target)
+    coef = np.linalg.solve(gram, moment[..., None])[..., 0]
+
+    # 예측 수익률을 재귀적으로 생성 (최근 수익률 p개가 상태)
+    state = returns[-order:][::-1].T.copy()
+    path = np.empty((horizon, log_prices.shape[1]))
+    level = log_prices[-1].copy()
+    for h in range(horizon):
+        next_return = coef[:, 0] + np.sum(coef[:, 1:] * state, axis=1)
+        level = level + next_return
+        path[h] = level
+        state = np.concatenate([next_return[:, None], state[:, :-1]], axis=1)
+    return path
+
+
+def forecast_ma_trend(log_prices, horizon, decay_factor=0.7, features=None, feature_index=None):
+    """MA5/MA20 크로스오버 모델 - predict_stock_price와 같은 보수적 규칙을 패널 전체에 적용
+
+    features: 같은 날짜/종목으로 정렬된 피처 텐서 (feature_store), feature_index: 피처 이름 → 열 위치.
+    둘 다 주어지면 이동평균과 평균 수익률을 다시 계산하지 않고 마지막 날짜의 값을 그대로 읽습니다.
+    """
+    last_price = np.exp(log_prices[-1])
+    if features is not None and feature_index is not None:
+        latest = features[-1]
+        ma5 = latest[:, feature_index['ma5']]
+        ma20 = latest[:, feature_index['ma20']]
+        avg_daily_return = latest[:, feature_index['return_mean_30d']]
+    else:
+        prices = np.exp(log_prices)
+        ma5 = prices[-5:].mean(axis=0)
+        ma20 = prices[-20:].mean(axis=0)
+        recent = prices[-30:]
+        daily_returns = recent[1:] / recent[:-1] - 1
+        avg_daily_return = daily_returns.mean(axis=0) if len(daily_returns) > 0 else np.zeros_like(last_price)
+
+    trend_signal = np.where(ma20 > 0, (ma5 - ma20) / ma20, 0.0)
+    daily_expected_return = np.clip(avg_daily_return + trend_signal * 0.3, -0.015, 0.015)
+    total_return = np.clip(daily_expected_return * horizon * decay_factor, -0.25, 0.25)
+
+    # 현재가에서 목표가까지 선형 경로
+    fraction = (np.arange(1, horizon + 1) / horizon)[:, None]
+    return np.log(last_price * (1 + total_return * fraction))
+
+
+MODELS = {
+    'drift': forecast_drift,
+    'holt': forecast_holt,
+    'ar': forecast_ar,
+    'ma_trend': forecast_ma_trend,
+}
+
+
+def _path_error(log_forecast, log_actual):
+    """예측 경로와 실제 경로의 평균 절대 백분율 오차 (종목별)"""
+    error = np.abs(np.exp(log_forecast - log_actual) - 1)
+    return np.nanmean(error, axis=0)
+
+
+def _fit_models(log_prices, horizon, features=None, feature_index=None):
+    """모든 모델의 예측 경로 (모델명 → (horizon, 종목) 로그 가격)"""
+    paths = {name: model(log_prices, horizon) for name, model in MODELS.items() if name != 'ma_trend'}
+    paths['ma_trend'] = forecast_ma_trend(log_prices, horizon, features=features, feature_index=feature_index)
+    return paths
+
+
+def ensemble_forecast(prices, horizon=30, min_history=30, holdout=None, max_total_return=0.25, features=None,
+                      feature_index=None):
+    """가격 패널 전체에 대한 가중 앙상블 예측
+
+    prices: (날짜, 종목) 종가 배열. 결측값은 직전 종가로 채웁니다.
+    features: prices와 같은 (날짜, 종목)으로 정렬된 피처 텐서 (선택, feature_store 참고)
+    feature_index: features의 피처 이름 → 열 위치 (feature_store.FEATURE_INDEX)
+    마지막 holdout 구간으로 각 모델을 검증해 종목별 역오차 가중치를 정하고,
+    전체 구간으로 다시 적합한 예측을 가중 평균합니다.
+
+    반환값 (dict):
+        paths: (horizon, 종목) 예측 가격 경로
+        change_pct: 종목별 horizon 후 예상 변동률(%)
+        weights / errors: 모델별 종목 가중치와 검증 구간 오차
+        ensemble_error: 앙상블의 검증 구간 오차
+    """
+    filled, n_valid = fill_price_panel(prices)
+    n_dates, n_tickers = filled.shape
+    usable = (n_valid >= min_history) & np.isfinite(filled[-1]) if n_dates > 0 else np.zeros(n_tickers, dtype=bool)
+
+    empty = np.full(n_tickers, np.nan)
+    result = {
+        'paths': np.full((horizon, n_tickers), np.nan),
+        'change_pct': empty.copy(),
+        'weights': {name: empty.copy() for name in MODELS},
+        'errors': {name: empty.copy() for name in MODELS},
+        'ensemble_error': empty.copy(),
+    }
+    if not usable.any():
+        return result
+
+    log_prices = np.log(filled[:, usable])
+    if features is not None:
+        features = features[:, usable]
+    if holdout is None:
+        holdout = int(np.clip(n_dates // 4, 5, horizon))
+
+    # 1. 검증 구간 백테스트로 모델별 오차 추적
+    train, actual = log_prices[:-holdout], log_prices[-holdout:]
+    backtests = _fit_models(train, holdout, None if features is None else features[:-holdout], feature_index)
+    errors = np.stack([_path_error(backtests[name], actual) for name in MODELS])
+    errors = np.where(np.isfinite(errors), errors, np.inf)
+
+    # 2. 역오차 가중치 (모든 모델이 실패한 종목은 균등 가중)
+    inverse = 1.0 / (errors + 1e-4)
+    weight_sum = inverse.sum(axis=0)
+    weights = np.where(weight_sum > 0, inverse / np.where(weight_sum > 0, weight_sum, 1), 1.0 / len(MODELS))
+
+    ensemble_backtest = np.einsum('mn,mhn->hn', weights, np.stack([np.nan_to_num(backtests[name]) for name in MODELS]))
+    ensemble_error = _path_error(ensemble_backtest, actual)
+
+    # 3. 전체 구간으로 재적합 후 가중 결합 (로그 가격 공간)
+    paths = _fit_models(log_prices, horizon, features, feature_index)
+    forecasts = np.stack([np.nan_to_num(paths[name], nan=0.0) for name in MODELS])
+    combined = np.einsum('mn,mhn->hn', weights, forecasts)
+
+    # 4. 보수적 안전장치: 누적 변동률을 ±max_total_return 이내로 제한
+    cumulative = np.clip(np.exp(combined - log_prices[-1]) - 1, -max_total_return, max_total_return)
+    last_price = filled[-1, usable]
+
+    result['paths'][:, usable] = last_price * (1 + cumulative)
+    result['change_pct'][usable] = cumulative[-1] * 100
+    result['ensemble_error'][usable] = ensemble_error
+    for i, name in enumerate(MODELS):
+        result['weights'][name][usable] = weights[i]
+        result['errors'][name][usable] = np.where(np.isfinite(errors[i]), errors[i], np.nan)
+    return result
@@ -0,0 +1,318 @@
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from forecast import fill_price_panel
+
+# 보유 종목 장부와 손익 평가
+# 사용자가 추천 포트폴리오를 실제로 매수하면 (사용자, 종목, 주식 수, 매입 원가)를 장부에 기록하고,
+# 가격 패널과 환율로 모든 사용자의 보유 종목을 한 번에 평가합니다.
+# 보유 내역은 종목 순으로 정렬한 희소 배열(포지션마다 한 줄)로 두고 종목별 시작 위치(ticker_ptr)를
+# 함께 저장하므로, 새 가격이 들어오면 가격이 바뀐 종목의 포지션만 골라 손익 증분을 계산하고
+# np.bincount로 사용자별 합계를 구합니다 (사용자 반복문 없음).
+
+LEDGER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.ledger')
+
+
+def _empty_positions():
+    return {
+        'pos_user': np.zeros(0, dtype=np.int64),
+        'pos_ticker': np.zeros(0, dtype=np.int64),
+        'pos_shares': np.zeros(0, dtype=np.int64),
+        'pos_cost': np.zeros(0, dtype=np.float64),  # 매입 원가 합계 (원화)
+    }
+
+
+def new_ledger():
+    """빈 장부"""
+    ledger = {
+        'users': [],
+        'user_index': {},
+        'tickers': [],
+        'ticker_index': {},
+        'usd': np.zeros(0, dtype=bool),          # 종목별 달러 표시 여부 (평가 시 환율 적용)
+        'realized': np.zeros(0, dtype=np.float64),  # 사용자별 실현 손익
+        'ticker_ptr': np.zeros(1, dtype=np.int64),
+        # 마지막 평가 상태: 종목별 원화 가격, 사용자별 평가금액/직전 평가 대비 손익
+        'mark_date': None,
+        'mark_prices': np.zeros(0, dtype=np.float64),
+        'value': np.zeros(0, dtype=np.float64),
+        'pnl_change': np.zeros(0, dtype=np.float64),
+    }
+    ledger.update(_empty_positions())
+    return ledger
+
+
+def _index_of(ledger, names, kind):
+    """사용자/종목 이름을 정수 위치로 변환 (처음 보는 이름은 장부에 추가)"""
+    index, items = ledger[f'{kind}_index'], ledger[f'{kind}s']
+    codes, uniques = pd.factorize(pd.Series(names, dtype=object).astype(str))
+    for name in uniques:
+        if name not in index:
+            index[name] = len(items)
+            items.append(name)
+    return np.array([index[name] for name in uniques], dtype=np.int64)[codes]
+
+
+def _grow(ledger, countries=None, new_tickers=()):
+    """사용자/종목이 늘어난 만큼 상태 배열 확장"""
+    n_users, n_tickers = len(ledger['users']), len(ledger['tickers'])
+    ledger['realized'] = np.concatenate([ledger['realized'], np.zeros(n_users - len(ledger['realized']))])
+    ledger['value'] = np.concatenate([ledger['value'], np.zeros(n_users - len(ledger['value']))])
+    ledger['pnl_change'] = np.concatenate([ledger['pnl_change'], np.zeros(n_users - len(ledger['pnl_change']))])
+
+    added = n_tickers - len(ledger['usd'])
+    if added > 0:
+        usd = np.zeros(added, dtype=bool)
+        if countries is not None:
+            country_by_ticker = dict(zip(map(str, new_tickers), countries))
+            usd = np.array([country_by_ticker.get(t) == '미국' for t in ledger['tickers'][-added:]])
+        ledger['usd'] = np.concatenate([ledger['usd'], usd])
+        ledger['mark_prices'] = np.concatenate([ledger['mark_prices'], np.full(added, np.nan)])
+
+
+def _reindex(ledger):
+    """포지션을 (종목, 사용자) 순으로 정렬하고 종목별 시작 위치 갱신"""
+    order = np.lexsort((ledger['pos_user'], ledger['pos_ticker']))
+    for key in ('pos_user', 'pos_ticker', 'pos_shares', 'pos_cost'):
+        ledger[key] = ledger[key][order]
+    counts = np.bincount(ledger['pos_ticker'], minlength=len(ledger['tickers']))
+    ledger['ticker_ptr'] = np.concatenate([[0], np.cumsum(counts)])
+
+
+def record_trades(ledger, users, tickers, shares, prices, countries=None):
+    """체결 내역 일괄 기록 (shares > 0 매수, < 0 매도, prices는 원화 체결가)
+
+    같은 (사용자, 종목)의 체결은 합산하고, 매도는 평균 단가 기준으로 실현 손익을 계산합니다.
+    보유 수량보다 많이 팔 수는 없습니다 (초과분은 무시). countries는 처음 기록하는 종목의
+    통화(미국이면 달러) 판별용입니다.
+    반환값: 체결 후 장부 (같은 객체)
+    """
+    shares = np.asarray(shares, dtype=np.int64)
+    prices = np.asarray(prices, dtype=np.float64)
+    user_pos = _index_of(ledger, users, 'user')
+    ticker_pos = _index_of(ledger, tickers, 'ticker')
+    _grow(ledger, countries, tickers)
+    n_users = len(ledger['users'])
+
+    # 기존 포지션과 체결을 (종목, 사용자) 키로 합침
+    old_keys = ledger['pos_ticker'] * n_users + ledger['pos_user']
+    trade_keys = ticker_pos * n_users + user_pos
+    keys, inverse = np.unique(np.concatenate([old_keys, trade_keys]), return_inverse=True)
+    old_slot, trade_slot = inverse[:len(old_keys)], inverse[len(old_keys):]
+
+    held = np.zeros(len(keys), dtype=np.int64)
+    cost = np.zeros(len(keys))
+    held[old_slot] = ledger['pos_shares']
+    cost[old_slot] = ledger['pos_cost']
+
+    buy = np.maximum(shares, 0)
+    bought = np.bincount(trade_slot, weights=buy, minlength=len(keys)).astype(np.int64)
+    buy_cost = np.bincount(trade_slot, weights=buy * prices, minlength=len(keys))
+    sell = np.maximum(-shares, 0)
+    sold = np.bincount(trade_slot, weights=sell, minlength=len(keys)).astype(np.int64)
+    sell_proceeds = np.bincount(trade_slot, weights=sell * prices, minlength=len(keys))
+
+    held += bought
+    cost += buy_cost
+    # 매도: 보유 수량까지만, 평균 단가로 원가를 줄이고 차액을 실현 손익으로
+    executed = np.minimum(sold, held)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg_cost = np.where(held > 0, cost / held, 0.0)
+        sell_price = np.where(sold > 0, sell_proceeds / sold, 0.0)
+    realized = executed * (sell_price - avg_cost)
+    held -= executed
+    cost -= executed * avg_cost
+
+    key_user = keys % n_users
+    ledger['realized'] += np.bincount(key_user, weights=realized, minlength=n_users)
+
+    keep = held > 0
+    ledger['pos_user'] = key_user[keep]
+    ledger['pos_ticker'] = keys[keep] // n_users
+    ledger['pos_shares'] = held[keep]
+    ledger['pos_cost'] = cost[keep]
+    _reindex(ledger)
+
+    # 아직 평가 가격이 없는 종목은 체결가를 마지막 가격으로 사용
+    unpriced = np.isnan(ledger['mark_prices'][ticker_pos])
+    ledger['mark_prices'][ticker_pos[unpriced]] = prices[unpriced]
+
+    # 이미 평가된 장부면 바뀐 사용자의 평가금액을 마지막 가격으로 다시 계산
+    if ledger['mark_date'] is not None:
+        affected = np.unique(user_pos)
+        marked = np.nan_to_num(ledger['mark_prices'])[ledger['pos_ticker']]
+        value = np.bincount(ledger['pos_user'], weights=ledger['pos_shares'] * marked, minlength=n_users)
+        ledger['value'][affected] = value[affected]
+    return ledger
+
+
+def krw_prices(ledger, native_prices, fx_rate):
+    """장부 종목 순서의 현지 통화 가격을 원화로 환산 (달러 종목만 환율 적용)"""
+    return np.asarray(native_prices, dtype=np.float64) * np.where(ledger['usd'], fx_rate, 1.0)
+
+
+def mark_to_market(ledger, prices, date=None):
+    """전체 평가: 모든 포지션을 원화 가격 prices(장부 종목 순서)로 평가하고 사용자별로 합산
+
+    가격이 없는 종목(NaN)은 마지막 평가 가격(처음이면 체결가)을 사용합니다.
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    prices = np.where(np.isfinite(prices), prices, ledger['mark_prices'])
+    n_users = len(ledger['users'])
+    marked = np.nan_to_num(prices)[ledger['pos_ticker']]
+    value = np.bincount(ledger['pos_user'], weights=ledger['pos_shares'] * marked, minlength=n_users)
+    ledger['pnl_change'] = value - ledger['value'] if ledger['mark_date'] is not None else np.zeros(n_users)
+    ledger['value'] = value
+    ledger['mark_prices'] = prices.copy()
+    ledger['mark_date'] = date
+    return ledger
+
+
+def mark_increment(ledger, prices, date=None):
+    """증분 평가: 직전 평가 대비 가격이 바뀐 종목의 포지션만 손익 증분을 계산해 반영
+
+    반환값: 평가금액이 바뀐 사용자 위치 배열 (ledger['pnl_change']에 사용자별 증분 저장)
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    if ledger['mark_date'] is None:
+        mark_to_market(ledger, prices, date)
+        return np.flatnonzero(ledger['value'])
+
+    previous = ledger['mark_prices']
+    # 새 가격이 없는 종목(NaN)은 직전 가격 유지
+    prices = np.where(np.isfinite(prices), prices, previous)
+    delta = np.nan_to_num(prices) - np.nan_to_num(previous)
+    changed = np.flatnonzero(delta)
+
+    ptr = ledger['ticker_ptr']
+    n_users = len(ledger['users'])
+    lengths = ptr[changed + 1] - ptr[changed]
+    if lengths.sum() * 2 > len(ledger['pos_user']):
+        # 포지션 대부분이 바뀌었으면(환율 변동 등) 모으지 않고 전체 포지션에 증분 적용
+        users, increment = ledger['pos_user'], ledger['pos_shares'] * delta[ledger['pos_ticker']]
+    else:
+        # 바뀐 종목의 포지션 구간(ticker_ptr)만 모음
+        offsets = np.repeat(ptr[changed] - np.cumsum(lengths) + lengths, lengths)
+        rows = np.arange(lengths.sum()) + offsets
+        users = ledger['pos_user'][rows]
+        increment = ledger['pos_shares'][rows] * delta[ledger['pos_ticker'][rows]]
+    pnl_change = np.bincount(users, weights=increment, minlength=n_users)
+    touched = np.bincount(users, minlength=n_users) > 0
+
+    ledger['value'] += pnl_change
+    ledger['pnl_change'] = pnl_change
+    ledger['mark_prices'] = prices
+    ledger['mark_date'] = date
+    return np.flatnonzero(touched)
+
+
+def price_bars(ledger, price_panel, fx_series=None, default_fx=None):
+    """가격 패널(현지 통화)과 환율 시계열을 장부 종목 순서의 원화 가격 (날짜 × 종목)으로 변환
+
+    패널에 없는 종목은 NaN, 환율이 없는 날짜는 직전 환율(없으면 default_fx)로 채웁니다.
+    반환값: (날짜 인덱스, 원화 가격 배열)
+    """
+    columns = {str(t): i for i, t in enumerate(price_panel.columns)}
+    index = np.array([columns.get(t, -1) for t in ledger['tickers']], dtype=np.int64)
+    filled, _ = fill_price_panel(price_panel.values)
+    native = np.where(index >= 0, filled[:, np.maximum(index, 0)], np.nan)
+
+    if fx_series is not None and len(fx_series) > 0:
+        fx = fx_series.reindex(price_panel.index).ffill().bfill().to_numpy(dtype=np.float64)
+    else:
+        fx = np.full(len(price_panel), np.nan)
+    if default_fx is not None:
+        fx = np.where(np.isfinite(fx), fx, default_fx)
+    return price_panel.index, native * np.where(ledger['usd'], fx[:, None], 1.0)
+
+
+def user_positions(ledger, user):
+    """한 사용자의 보유 종목 표 (마지막 평가 가격 기준)"""
+    u = ledger['user_index'].get(str(user))
+    if u is None:
+        return pd.DataFrame(columns=['티커', '보유주수', '평균단가', '현재가', '평가금액', '평가손익', '수익률(%)'])
+    rows = np.flatnonzero(ledger['pos_user'] == u)
+    tickers = ledger['pos_ticker'][rows]
+    shares = ledger['pos_shares'][rows]
+    cost = ledger['pos_cost'][rows]
+    price = ledger['mark_prices'][tickers] if ledger['mark_date'] is not None else np.full(len(rows), np.nan)
+    value = shares * price
+    return pd.DataFrame({
+        '티커': np.asarray(ledger['tickers'], dtype=object)[tickers],
+        '보유주수': shares,
+        '평균단가': cost / shares,
+        '현재가': price,
+        '평가금액': value,
+        '평가손익': value - cost,
+        '수익률(%)': (value / cost - 1) * 100,
+    })
+
+
+def user_summary(ledger, user):
+    """한 사용자의 평가금액, 매입 원가, 평가/실현 손익, 직전 평가 대비 손익 (dict)"""
+    u = ledger['user_index'].get(str(user))
+    if u is None:
+        return None
+    cost = ledger['pos_cost'][ledger['pos_user'] == u].sum()
+    value = ledger['value'][u]
+    return {
+        'value': value,
+        'cost': cost,
+        'unrealized': value - cost,
+        'realized': ledger['realized'][u],
+        'pnl_change': ledger['pnl_change'][u],
+        'mark_date': ledger['mark_date'],
+    }
+
+
+def _paths(root):
+    return os.path.join(root, 'positions.npz'), os.path.join(root, 'ledger.json')
+
+
+def save_ledger(ledger, root=LEDGER_DIR):
+    """장부를 디스크에 저장 (임시 파일에 쓴 뒤 교체)"""
+    os.makedirs(root, exist_ok=True)
+    arrays_path, meta_path = _paths(root)
+    arrays = {key: ledger[key] for key in
+              ('pos_user', 'pos_ticker', 'pos_shares', 'pos_cost', 'usd', 'realized',
+               'mark_prices', 'value', 'pnl_change')}
+
+    tmp_arrays = f"{arrays_path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_arrays, **arrays)
+    os.replace(tmp_arrays, arrays_path)
+
+    mark_date = ledger['mark_date']
+    meta = {
+        'users': ledger['users'],
+        'tickers': ledger['tickers'],
+        'mark_date': mark_date.isoformat() if isinstance(mark_date, datetime) else mark_date,
+    }
+    tmp_meta = f"{meta_path}.{os.getpid()}.tmp"
+    with open(tmp_meta, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp_meta, meta_path)
+
+
+def load_ledger(root=LEDGER_DIR):
+    """저장된 장부 읽기 (없으면 빈 장부)"""
+    arrays_path, meta_path = _paths(root)
+    if not (os.path.exists(arrays_path) and os.path.exists(meta_path)):
+        return new_ledger()
+    with open(meta_path, encoding='utf-8') as f:
+        meta = json.load(f)
+
+    ledger = new_ledger()
+    ledger['users'] = meta['users']
+    ledger['user_index'] = {user: i for i, user in enumerate(meta['users'])}
+    ledger['tickers'] = meta['tickers']
+    ledger['ticker_index'] = {ticker: i for i, ticker in enumerate(meta['tickers'])}
+    ledger['mark_date'] = meta['mark_date']
+    with np.load(arrays_path) as arrays:
+        for key in arrays.files:
+            ledger[key] = arrays[key]
+    _reindex(ledger)
+    return ledger
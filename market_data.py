@@ -0,0 +1,269 @@
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+# 시세/종목 데이터 수집 (Streamlit 비의존)
+# 대시보드(app.py)는 이 함수들을 st.cache_data로 감싸서 쓰고,
+# 배치 추천/서비스는 engine.py를 통해 그대로 호출합니다.
+
+# S&P 500 주요 종목 (섹터별로 리스트 구성)
+SP500_SECTORS = [
+    # Technology (20개)
+    (['AAPL', 'MSFT', 'GOOGL', 'GOOG', 'META', 'NVDA', 'AVGO', 'ORCL', 'CRM', 'ADBE', 'INTC', 'AMD', 'QCOM', 'TXN', 'AMAT', 'LRCX', 'KLAC', 'MU', 'NXPI', 'MRVL'],
+     ['애플', '마이크로소프트', '구글A', '구글C', '메타', '엔비디아', '브로드컴', '오라클', '세일즈포스', '어도비', '인텔', 'AMD', '퀄컴', '텍사스인스트루먼트', '어플라이드머티리얼즈', '라믹리서치', 'KLA', '마이크론', 'NXP', '마벨'],
+     '기술'),
+    # Healthcare (20개)
+    (['UNH', 'JNJ', 'LLY', 'ABBV', 'TMO', 'ABT', 'DHR', 'BMY', 'AMGN', 'GILD', 'REGN', 'VRTX', 'BIIB', 'CI', 'HUM', 'CVS', 'ELV', 'ISRG', 'SYK', 'BSX'],
+     ['유나이티드헬스', '존슨앤존슨', '엘리릴리', '애브비', '써모피셔', '애보트', '다나허', '브리스톨마이어스', '앰젠', '길리어드', '리제너론', '버텍스', '바이오젠', '시그나', '휴마나', 'CVS헬스', '엘리베이트', '인튜이티브서지컬', '스트라이커', '보스턴사이언티픽'],
+     '헬스케어'),
+    # Financials (20개)
+    (['JPM', 'BAC', 'WFC', 'GS', 'MS', 'C', 'BLK', 'SCHW', 'AXP', 'COF', 'USB', 'PNC', 'TFC', 'BK', 'STT', 'MTB', 'CFG', 'FITB', 'HBAN', 'ZION'],
+     ['JP모건', '뱅크오브아메리카', '웰스파고', '골드만삭스', '모건스탠리', '시티그룹', '블랙록', '찰스슈왑', '아메리칸익스프레스', '캐피탈원', 'US뱅크', 'PNC', '트루이스트', '뱅크오브뉴욕', '스테이트스트리트', 'M&T뱅크', '시티즌스', '피프스써드', '헌팅턴', 'Zions'],
+     '금융'),
+    # Consumer Discretionary (20개)
+    (['AMZN', 'TSLA', 'HD', 'MCD', 'NKE', 'SBUX', 'LOW', 'TJX', 'BKNG', 'GM', 'F', 'NCLH', 'CCL', 'RCL', 'MAR', 'HLT', 'ABNB', 'EXPE', 'TRIP', 'TCOM'],
+     ['아마존', '테슬라', '홈디포', '맥도날드', '나이키', '스타벅스', '로우스', 'TJX', '부킹홀딩스', '제너럴모터스', '포드', '노르웨이크루즈', '카니발', '로열캐리비안', '메리어트', '힐튼', '에어비앤비', '익스피디아', '트립어드바이저', '트립닷컴'],
+     '소비재'),
+    # Consumer Staples (20개)
+    (['WMT', 'PG', 'KO', 'PEP', 'COST', 'TGT', 'CL', 'KMB', 'CHD', 'GIS', 'CPB', 'SJM', 'HRL', 'CAG', 'K', 'MDLZ', 'HSY', 'TAP', 'BF.B', 'STZ'],
+     ['월마트', '프로cter앤갬블', '코카콜라', '펩시코', '코스트코', '타겟', '콜게이트', '킴벌리클라크', '처치앤드와이트', '제너럴밀스', '캠벨수프', 'JM스마커', '호멜', '코너그라', '켈로그', '몬델레즈', '허쉬', '몰슨쿠어스', '브라운포먼', '컨스텔레이션'],
+     '필수소비재'),
+    # Energy (20개)
+    (['XOM', 'CVX', 'SLB', 'EOG', 'COP', 'MPC', 'PSX', 'VLO', 'HES', 'FANG', 'OVV', 'CTRA', 'MRO', 'DVN', 'APA', 'HAL', 'BKR', 'FTI', 'NOV', 'WMB'],
+     ['엑슨모빌', '셰브론', '슐럼버거', 'EOG리소스', '코노코필립스', '마라톤피트롤리움', '필립스66', '발레로', '헤스', '다이아몬드백', '오비비', '코트라', '마라톤오일', '데본에너지', '아파치', '할리버튼', '베이커휴즈', '테크니팁', '내셔널오일웰', '윌리엄스'],
+     '에너지'),
+    # Industrials (20개)
+    (['BA', 'CAT', 'GE', 'HON', 'RTX', 'LMT', 'NOC', 'GD', 'TDG', 'TDY', 'PH', 'EMR', 'ETN', 'IR', 'DOV', 'FTV', 'AME', 'ZBH', 'ITW', 'CMI'],
+     ['보잉', '캐터필러', '제너럴일렉트릭', '하니웰', 'RTX', '록히드마틴', '노스롭그루먼', '제너럴다이내믹스', '트랜스디지털', '텔레다인', '파커핸니핀', '이머슨', '이튼', '잉거솔랜드', '도버', '포트리브', '아메텍', '지머바이오메트', '일리노이툴웍스', '커민스'],
+     '산업재'),
+    # Communication Services (20개)
+    (['VZ', 'T', 'CMCSA', 'DIS', 'NFLX', 'PARA', 'WBD', 'FOX', 'FOXA', 'LBRDK', 'LBRDA', 'LSXMK', 'LSXMA', 'LSXMB', 'CHTR', 'EA', 'TTWO', 'ATVI', 'ROKU', 'SPOT'],
+     ['버라이즌', 'AT&T', '컴캐스트', '월트디즈니', '넷플릭스', '파라마운트', '워너브라더스', '폭스', '폭스A', '리버티브로드캐스트', '리버티브로드캐스트A', '리버티미디어', '리버티미디어A', '리버티미디어B', '차터', '일렉트로닉아츠', '테이크투', '액티비전블리자드', '로쿠', '스포티파이'],
+     '통신서비스'),
+    # Materials (20개)
+    (['LIN', 'APD', 'ECL', 'SHW', 'DD', 'DOW', 'FCX', 'NEM', 'VALE', 'RIO', 'BHP', 'SCCO', 'TECK', 'NTR', 'MOS', 'CF', 'FMC', 'NUE', 'STLD', 'X'],
+     ['린데', '에어프로덕츠', '이클립', '셰윈윌리엄스', '듀퐁', '다우', '프리포트맥모란', '뉴몬트', '밸리', '리오틴토', 'BHP', '서던코퍼', '테크리소스', '뉴트리엔', '모자이크', 'CF인더스트리즈', 'FMC', '누코르', '스틸다이나믹스', 'US스틸'],
+     '소재'),
+    # Real Estate (20개)
+    (['AMT', 'PLD', 'EQIX', 'PSA', 'WELL', 'SPG', 'O', 'DLR', 'VICI', 'EXPI', 'CBRE', 'JLL', 'CWK', 'FR', 'AVB', 'EQR', 'UDR', 'MAA', 'CPT', 'ESS'],
+     ['아메리칸타워', '프롤로지스', '이퀴닉스', '퍼블릭스토리지', '웰토워', '사이먼프롭퍼티', '리얼티인컴', '디지털리얼티', '비치', 'eXp리얼티', 'CBRE', '존스랭라살', '캠프웨이드', '퍼스트인더스트리얼', '에이발론베이컨', '에퀴티레지던셜', 'UDR', '미드아메리카아파트', '캠던프롭퍼티', '에식스프롭퍼티'],
+     '부동산'),
+    # Utilities (20개)
+    (['NEE', 'DUK', 'SO', 'D', 'AEP', 'SRE', 'EXC', 'XEL', 'WEC', 'ES', 'ED', 'ETR', 'PEG', 'FE', 'AEE', 'LNT', 'CNP', 'ATO', 'CMS', 'NI'],
+     ['넥스트에라에너지', '듀크에너지', '서던컴퍼니', '도미니언에너지', '아메리칸일렉트릭파워', 'Sempra', '엑셀론', '엑셀에너지', '위스콘신에너지', '에버소스', '컨솔리데이티드에디슨', '엔터지', '퍼블릭서비스엔터프라이즈', '퍼스트에너지', '아메리칸일렉트릭', '알리안트에너지', '센터포인트에너지', '아토스에너지', 'CMS에너지', '니소스'],
+     '유틸리티'),
+]
+
+# KOSPI 200 주요 종목
+KOSPI_SECTORS = [
+    (['005930', '000660', '035420', '051910', '006400', '028260', '005380', '035720', '207940', '036570', '000270', '105560', '066570', '003550', '032830', '034730', '012330', '017670', '096770', '018260'],
+     ['삼성전자', 'SK하이닉스', 'NAVER', 'LG화학', '삼성SDI', '삼성물산', '현대차', '카카오', '삼성바이오로직스', '엔씨소프트', '기아', 'KB금융', 'LG전자', 'LG', '삼성생명', 'SK', '현대모비스', 'SK텔레콤', 'SK이노베이션', '삼성에스디에스'],
+     ['반도체', '반도체', '인터넷', '화학', '배터리', '유통', '자동차', '인터넷', '바이오', '게임', '자동차', '금융', '전자', '전자', '금융', '에너지', '자동차부품', '통신', '에너지', 'IT서비스']),
+    (['005490', '009540', '006360', '003670', '015760', '000810', '010130', '011200', '023530', '024110', '028300', '029780', '030200', '032640', '033780', '035250', '035900', '036460', '037270', '042660'],
+     ['POSCO홀딩스', '한국전력', 'GS건설', '포스코퓨처엠', '한국전력기술', '삼성화재', '고려아연', 'HMM', '롯데케미칼', '기업은행', 'HLB', '알테오젠', 'KT', 'LG유플러스', 'KT&G', '강원랜드', 'JYP엔터테인먼트', '한국가스공사', 'YG플러스', '한국전자금융'],
+     ['철강', '전력', '건설', '화학', '전력', '보험', '비철금속', '운송', '화학', '금융', '바이오', '바이오', '통신', '통신', '담배', '레저', '엔터테인먼트', '가스', '엔터테인먼트', 'IT서비스']),
+]
+
+# 시세 조회 실패 시 사용할 섹터별 평균 주가 범위
+KOREAN_SECTOR_PRICE_RANGES = {
+    '반도체': (50000, 200000), '인터넷': (100000, 300000), '화학': (200000, 600000),
+    '배터리': (400000, 800000), '유통': (50000, 200000), '자동차': (50000, 300000),
+    '바이오': (300000, 1000000), '게임': (200000, 500000), '금융': (30000, 100000),
+    '전자': (50000, 150000), '에너지': (20000, 80000), '통신': (30000, 60000),
+    'IT서비스': (50000, 200000), '철강': (200000, 500000), '전력': (10000, 30000),
+    '건설': (30000, 100000), '보험': (20000, 80000), '비철금속': (30000, 100000),
+    '운송': (20000, 80000), '담배': (50000, 150000), '레저': (30000, 100000),
+    '엔터테인먼트': (50000, 200000), '가스': (20000, 60000),
+}
+US_SECTOR_PRICE_RANGES_USD = {
+    '기술': (100, 500), '헬스케어': (50, 400), '금융': (30, 200), '소비재': (50, 300),
+    '필수소비재': (30, 200), '에너지': (20, 150), '산업재': (50, 300), '통신서비스': (20, 100),
+    '소재': (30, 200), '부동산': (50, 300), '유틸리티': (30, 150),
+}
+
+DEFAULT_EXCHANGE_RATE = 1300.0
+
+
+def fetch_exchange_rate():
+    """USD/KRW 환율을 가져오는 함수"""
+    try:
+        # USD/KRW 환율 가져오기
+        krw_ticker = yf.Ticker("KRW=X")
+        krw_data = krw_ticker.history(period="1d")
+        if len(krw_data) > 0:
+            return krw_data['Close'].iloc[-1]
+        # 기본값 (약 1,300원)
+        return DEFAULT_EXCHANGE_RATE
+    except:
+        # 에러 발생 시 기본값 반환
+        return DEFAULT_EXCHANGE_RATE
+
+
+def fetch_fx_series(period="3mo"):
+    """USD/KRW 환율 일별 종가 시계열 (실패 시 빈 Series)"""
+    try:
+        hist = yf.Ticker("KRW=X").history(period=period)
+        fx = hist['Close'].astype(float)
+        fx.index = pd.to_datetime(fx.index).tz_localize(None).normalize()
+        return fx
+    except:
+        return pd.Series(dtype=float)
+
+
+def fetch_stock_price(ticker, country, exchange_rate=None):
+    """실제 주가를 가져오는 함수 - yfinance 사용 (미국 주식은 원화로 환산)"""
+    try:
+        if country == '미국':
+            # 미국 주식은 yfinance 사용
+            stock = yf.Ticker(ticker)
+            hist = stock.history(period="1d")
+            if len(hist) > 0:
+                price_usd = hist['Close'].iloc[-1]
+                # USD를 원화로 환산
+                if exchange_rate is None:
+                    exchange_rate = fetch_exchange_rate()
+                return price_usd * exchange_rate
+            return None
+
+        # 한국 주식은 yfinance 사용 (.KS 추가), 안 되면 티커만으로 시도
+        for symbol in (f"{ticker}.KS", ticker):
+            try:
+                hist = yf.Ticker(symbol).history(period="1d")
+                if len(hist) > 0:
+                    return hist['Close'].iloc[-1]
+            except:
+                pass
+        return None
+    except Exception as e:
+        return None
+
+
+def fetch_korean_price(ticker):
+    """한국 주식 현재가 (.KS) - 실패 시 None"""
+    try:
+        hist = yf.Ticker(f"{ticker}.KS").history(period="1d")
+        if len(hist) > 0:
+            return float(hist['Close'].iloc[-1])
+    except:
+        pass
+    return None
+
+
+def load_universe(exchange_rate=None, price_fetcher=None, fetch_prices=True):
+    """주식 데이터를 반환하는 함수 - S&P 500과 KOSPI 200의 주요 종목 포함
+
+    price_fetcher: 미국 주식 현재가 조회 함수 (ticker, country) → 원화 가격 또는 None
+    fetch_prices: False면 시세 조회 없이 섹터별 추정 가격 사용 (오프라인 벤치마크용)
+    """
+    if exchange_rate is None:
+        exchange_rate = fetch_exchange_rate() if fetch_prices else DEFAULT_EXCHANGE_RATE
+    if price_fetcher is None:
+        price_fetcher = lambda ticker, country: fetch_stock_price(ticker, country, exchange_rate)
+
+    # 데이터 병합을 위한 리스트 생성
+    all_tickers = []
+    all_names = []
+    all_countries = []
+    all_sectors = []
+
+    # S&P 500 데이터 추가
+    for tickers, names, sector in SP500_SECTORS:
+        all_tickers.extend(tickers)
+        all_names.extend(names)
+        all_countries.extend(['미국'] * len(tickers))
+        all_sectors.extend([sector] * len(tickers))
+
+    # KOSPI 데이터 추가
+    for tickers, names, sectors in KOSPI_SECTORS:
+        all_tickers.extend(tickers)
+        all_names.extend(names)
+        all_countries.extend(['한국'] * len(tickers))
+        all_sectors.extend(sectors)
+
+    # 기본 데이터프레임 생성
+    data = {
+        '티커': all_tickers,
+        '회사명': all_names,
+        '국가': all_countries,
+        '섹터': all_sectors,
+    }
+
+    # 랜덤 데이터 생성 (실제로는 API에서 가져와야 함)
+    np.random.seed(42)  # 재현성을 위한 시드 설정
+    n_stocks = len(all_tickers)
+
+    data['최근수익률(%)'] = np.random.uniform(-5, 15, n_stocks).round(1)
+    data['변동성'] = np.random.choice(['낮음', '중간', '높음', '매우높음'], n_stocks, p=[0.3, 0.4, 0.25, 0.05])
+    data['뉴스감성(1~5)'] = np.random.uniform(2, 5, n_stocks).round(1)
+    data['PER'] = np.random.uniform(8, 60, n_stocks).round(1)
+    data['배당률(%)'] = np.random.uniform(0, 4, n_stocks).round(2)
+    data['시가총액규모'] = np.random.choice(['대형', '중형', '소형'], n_stocks, p=[0.6, 0.3, 0.1])
+    data['유동성'] = np.random.choice(['매우높음', '높음', '중간', '낮음'], n_stocks, p=[0.3, 0.4, 0.25, 0.05])
+    data['성장률(%)'] = np.random.uniform(0, 30, n_stocks).round(1)
+    data['RSI'] = np.random.uniform(30, 75, n_stocks).round(0).astype(int)
+
+    df = pd.DataFrame(data)
+
+    # 실제 주가 가져오기 (yfinance 사용)
+    prices = []
+
+    # 한국 주식 처리 - 실패 시 섹터별 평균 주가 범위에서 추정
+    for idx, row in df[df['국가'] == '한국'].iterrows():
+        price_krw = fetch_korean_price(row['티커']) if fetch_prices else None
+        if price_krw is None:
+            price_range = KOREAN_SECTOR_PRICE_RANGES.get(row['섹터'], (50000, 200000))
+            price_krw = np.random.uniform(price_range[0], price_range[1])
+        prices.append((idx, price_krw))
+
+    # 미국 주식 처리 - 실패 시 섹터별 평균 주가 범위 (USD -> 원화 환산)
+    for idx, row in df[df['국가'] == '미국'].iterrows():
+        real_price = price_fetcher(row['티커'], row['국가']) if fetch_prices else None
+        if real_price is not None:
+            prices.append((idx, real_price))
+        else:
+            price_range_usd = US_SECTOR_PRICE_RANGES_USD.get(row['섹터'], (50, 200))
+            estimated_price_usd = np.random.uniform(price_range_usd[0], price_range_usd[1])
+            prices.append((idx, estimated_price_usd * exchange_rate))
+
+    # 가격을 인덱스 순서대로 정렬하여 할당
+    prices_dict = {idx: price for idx, price in prices}
+    df['현재가'] = [prices_dict.get(idx, 100000) for idx in df.index]
+
+    return df
+
+
+def fetch_stock_history(ticker, country, period="3mo"):
+    """주가 과거 데이터를 가져오는 함수 - yfinance 사용"""
+    if period not in ("3mo", "6mo"):
+        period = "1y"
+    # 한국 주식은 .KS를 먼저 시도하고, 안 되면 티커만으로 시도
+    symbols = [ticker] if country == '미국' else [f"{ticker}.KS", ticker]
+    for symbol in symbols:
+        try:
+            # 배당/분할 조정 종가 - fetch_price_panel(예측, 피처 저장소 MA20)과 같은 기준
+            hist = yf.Ticker(symbol).history(period=period, auto_adjust=True)
+            if len(hist) > 0:
+                return hist
+        except:
+            pass
+    return None
+
+
+def fetch_price_panel(tickers, countries, period="3mo"):
+    """여러 종목의 종가를 (날짜 × 티커) 패널로 한 번에 가져오는 함수"""
+    # 한국 주식은 .KS를 붙여 조회
+    symbols = {
+        f"{ticker}.KS" if country == '한국' else ticker: ticker
+        for ticker, country in zip(tickers, countries)
+    }
+    try:
+        # 상세 차트(fetch_stock_history)와 같은 배당/분할 조정 종가 - 예측선과 MA20이 차트 주가선과 같은 기준이 되도록
+        data = yf.download(list(symbols), period=period, progress=False, auto_adjust=True, threads=True)
+        close = data['Close']
+        if isinstance(close, pd.Series):
+            close = close.to_frame(list(symbols)[0])
+        close = close.rename(columns=symbols).dropna(axis=1, how='all')
+        close.index = pd.to_datetime(close.index).tz_localize(None)
+        return close.sort_index()
+    except:
+        return pd.DataFrame()
@@ -0,0 +1,183 @@
+import numpy as np
+
+# 보유 종목 기준 리밸런싱 계획
+# 사용자의 현재 보유 주식 수와 목표 비중(select_diversified_portfolio 결과)을 받아
+# 목표에 가까워지기 위한 최소 거래를 계산합니다. 비중 차이가 허용 범위(NO_TRADE_BAND) 안이면
+# 매도하지 않고, 새 투자금과 매도 대금은 목표보다 부족한 종목에 우선 배분합니다.
+# 모든 계산은 (사용자, 종목) 행렬로 벡터화되어 있어 추적 중인 사용자 전체를 한 번에 처리하고,
+# 가격 갱신 시에는 바뀐 종목을 보유/목표로 하는 사용자만 다시 계산합니다.
+
+# 거래 비용 (매매 금액 대비)
+COMMISSION_RATE = {'한국': 0.00015, '미국': 0.0025}  # 증권사 매매 수수료
+SELL_TAX_RATE = {'한국': 0.0018, '미국': 0.0}         # 증권거래세 (매도 시)
+FX_SPREAD = 0.0025                                    # 환전 스프레드 (해외 주식 매수/매도 시)
+
+NO_TRADE_BAND = 0.02  # 목표 비중과의 차이가 2%p 이하면 매도하지 않음
+
+
+def trade_cost_rates(countries):
+    """종목별 (매수 비용률, 매도 비용률) - 수수료 + 거래세 + 해외 주식 환전 스프레드"""
+    countries = np.asarray(countries)
+    commission = np.array([COMMISSION_RATE.get(c, 0.0025) for c in countries])
+    tax = np.array([SELL_TAX_RATE.get(c, 0.0) for c in countries])
+    fx = np.where(countries == '한국', 0.0, FX_SPREAD)
+    return commission + fx, commission + tax + fx
+
+
+def target_weight_vector(tickers, target_tickers, target_amounts):
+    """목표 포트폴리오(종목, 금액)를 전체 종목 순서의 비중 벡터로 변환"""
+    index = {ticker: i for i, ticker in enumerate(tickers)}
+    weights = np.zeros(len(tickers))
+    amounts = np.asarray(target_amounts, dtype=np.float64)
+    total = amounts.sum()
+    for ticker, amount in zip(target_tickers, amounts):
+        if ticker in index and total > 0:
+            weights[index[ticker]] += amount / total
+    return weights
+
+
+def _compact_columns(relevant):
+    """행마다 관련 종목(보유 또는 목표) 위치만 모은 (사용자, K) 인덱스와 유효 마스크"""
+    rows, cols = np.nonzero(relevant)
+    counts = relevant.sum(axis=1)
+    width = max(int(counts.max()) if len(counts) else 0, 1)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    slot = np.arange(len(rows)) - starts[rows]
+    index = np.zeros((relevant.shape[0], width), dtype=np.int64)
+    valid = np.zeros((relevant.shape[0], width), dtype=bool)
+    index[rows, slot] = cols
+    valid[rows, slot] = True
+    return index, valid
+
+
+def _plan(holdings, target_weights, prices, cash, value, wealth, buy_rate, sell_rate, band):
+    """리밸런싱 거래 계산 (value/wealth는 호출자가 미리 계산한 평가금액/총자산)
+
+    사용자마다 보유하거나 목표로 하는 종목(보통 20개 이하)만 모아 (사용자, K) 행렬로 계산합니다.
+    """
+    n_users, n_stocks = holdings.shape
+    index, valid = _compact_columns((holdings > 0) | (target_weights > 0))
+    user = np.arange(n_users)[:, None]
+    held = np.where(valid, holdings[user, index], 0)
+    weight = np.where(valid, target_weights[user, index], 0.0)
+    current = np.where(valid, value[user, index], 0.0)
+    price, buy_rate, sell_rate = prices[index], buy_rate[index], sell_rate[index]
+
+    target_value = weight * wealth[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drift = np.where(wealth[:, None] > 0, (current - target_value) / wealth[:, None], 0.0)
+
+    # 1. 매도: 목표에서 빠진 종목은 전량, 비중 초과가 허용 범위를 넘는 종목은 목표까지 (내림)
+    exit_all = (weight <= 0) & (held > 0)
+    trim = (weight > 0) & (drift > band)
+    sell = np.where(exit_all, held, 0)
+    sell = np.where(trim, np.floor((current - target_value) / price).astype(np.int64), sell)
+    sell = np.clip(sell, 0, held)
+    sell_amount = sell * price
+    available = cash + (sell_amount * (1 - sell_rate)).sum(axis=1)
+
+    # 2. 매수: 목표보다 부족한 금액에 비례해 배분 (예산이 부족하면 비율 축소 후 내림)
+    remaining = held - sell
+    shortfall = np.maximum(target_value - remaining * price, 0.0)
+    buy_price = price * (1 + buy_rate)
+    need = (shortfall * (1 + buy_rate)).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scale = np.where(need > 0, np.minimum(1.0, available / need), 0.0)
+    buy = np.floor(shortfall * scale[:, None] / price).astype(np.int64)
+    leftover = available - (buy * buy_price).sum(axis=1)
+
+    # 3. 보정: 남은 현금으로 목표 대비 가장 부족한 종목을 한 주씩 추가 매수
+    cheapest = np.where(shortfall > 0, buy_price, np.inf).min(axis=1)
+    active = np.flatnonzero(leftover >= cheapest)
+    while len(active) > 0:
+        gap = shortfall[active] - buy[active] * price[active]
+        eligible = (gap > 0) & (buy_price[active] <= leftover[active, None])
+        has_eligible = eligible.any(axis=1)
+        active, eligible, gap = active[has_eligible], eligible[has_eligible], gap[has_eligible]
+        if len(active) == 0:
+            break
+        i = np.where(eligible, gap, -np.inf).argmax(axis=1)
+        buy[active, i] += 1
+        leftover[active] -= buy_price[active, i]
+
+    # 전체 종목 순서의 (사용자, 종목) 행렬로 되돌림
+    rows, slots = np.nonzero(valid)
+    sell_shares = np.zeros((n_users, n_stocks), dtype=np.int64)
+    buy_shares = np.zeros((n_users, n_stocks), dtype=np.int64)
+    sell_shares[rows, index[rows, slots]] = sell[rows, slots]
+    buy_shares[rows, index[rows, slots]] = buy[rows, slots]
+    buy_amount = buy * price
+    return {
+        'sell_shares': sell_shares,
+        'buy_shares': buy_shares,
+        'holdings_after': holdings - sell_shares + buy_shares,
+        'sell_amount': sell_amount.sum(axis=1),
+        'buy_amount': buy_amount.sum(axis=1),
+        'cost': (sell_amount * sell_rate).sum(axis=1) + (buy_amount * buy_rate).sum(axis=1),
+        'cash_after': leftover,
+        'n_trades': (sell > 0).sum(axis=1) + (buy > 0).sum(axis=1),
+    }
+
+
+def plan_rebalance(holdings, target_weights, prices, cash, countries, band=NO_TRADE_BAND):
+    """보유 주식 수에서 목표 비중으로 가기 위한 최소 매도/매수 계획 (여러 사용자 동시 계산)
+
+    holdings: (사용자, 종목) 또는 (종목,) 보유 주식 수
+    target_weights: holdings와 같은 모양의 목표 비중 (합 1, 목표에 없는 종목은 0)
+    prices: 종목별 원화 가격, cash: 사용자별 이번 달 투자 가능 금액
+    countries: 종목별 국가 (거래 비용률 계산용)
+
+    반환값 (dict): sell_shares, buy_shares, holdings_after (사용자, 종목)과
+    사용자별 sell_amount, buy_amount, cost(수수료·세금·환전 비용), cash_after, n_trades
+    """
+    holdings = np.atleast_2d(np.asarray(holdings, dtype=np.int64))
+    target_weights = np.broadcast_to(np.asarray(target_weights, dtype=np.float64), holdings.shape)
+    prices = np.asarray(prices, dtype=np.float64)
+    cash = np.broadcast_to(np.asarray(cash, dtype=np.float64), holdings.shape[:1]).copy()
+    buy_rate, sell_rate = trade_cost_rates(countries)
+
+    value = holdings * prices
+    wealth = value.sum(axis=1) + cash
+    return _plan(holdings, target_weights, prices, cash, value, wealth, buy_rate, sell_rate, band)
+
+
+def build_rebalance_book(holdings, target_weights, prices, cash, countries, band=NO_TRADE_BAND):
+    """추적 중인 사용자 전체의 리밸런싱 상태 (가격 갱신 시 update_book_prices로 증분 갱신)"""
+    holdings = np.atleast_2d(np.asarray(holdings, dtype=np.int64))
+    book = {
+        'holdings': holdings,
+        'target_weights': np.broadcast_to(np.asarray(target_weights, dtype=np.float64), holdings.shape).copy(),
+        'prices': np.asarray(prices, dtype=np.float64).copy(),
+        'cash': np.broadcast_to(np.asarray(cash, dtype=np.float64), holdings.shape[:1]).copy(),
+        'band': band,
+    }
+    book['buy_rate'], book['sell_rate'] = trade_cost_rates(countries)
+    book['value'] = holdings * book['prices']
+    book['wealth'] = book['value'].sum(axis=1) + book['cash']
+    book['plan'] = _plan(holdings, book['target_weights'], book['prices'], book['cash'], book['value'],
+                         book['wealth'], book['buy_rate'], book['sell_rate'], band)
+    return book
+
+
+def update_book_prices(book, prices):
+    """가격 갱신 반영: 바뀐 종목의 평가금액만 갱신하고, 그 종목을 보유/목표로 하는 사용자만 재계산
+
+    반환값: 계획이 다시 계산된 사용자 위치 배열
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    changed = np.flatnonzero(prices != book['prices'])
+    if len(changed) == 0:
+        return changed
+
+    holdings_changed = book['holdings'][:, changed]
+    book['wealth'] += holdings_changed @ (prices[changed] - book['prices'][changed])
+    book['value'][:, changed] = holdings_changed * prices[changed]
+    book['prices'][changed] = prices[changed]
+
+    rows = np.flatnonzero(((holdings_changed > 0) | (book['target_weights'][:, changed] > 0)).any(axis=1))
+    if len(rows) > 0:
+        plan = _plan(book['holdings'][rows], book['target_weights'][rows], book['prices'], book['cash'][rows],
+                     book['value'][rows], book['wealth'][rows], book['buy_rate'], book['sell_rate'], book['band'])
+        for key, values in plan.items():
+            book['plan'][key][rows] = values
+    return rows
@@ -0,0 +1,226 @@
+import hashlib
+import html
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from plotly.offline import get_plotlyjs
+
+# 추천 결과 리포트 내보내기 (Streamlit 비의존)
+# 한 번의 추천 실행(입력, 가중치, 추천 종목 표, 차트, OpenAI 분석, 뉴스 링크)을 JSON 묶음 하나로 만들고,
+# 그 묶음만으로 그리는 독립 HTML(plotly.js 포함)을 함께 저장합니다.
+# 파일 이름은 묶음 내용의 해시이므로 같은 스냅샷/입력으로 같은 결과를 내보내면 같은 파일이 되어 다시 쓰지 않고,
+# 리포트를 여는 쪽은 시세 조회나 API 호출 없이 파일만 읽습니다.
+
+REPORTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.reports')
+REPORT_VERSION = 1
+
+# 리포트 표에 넣는 추천 종목 열 (열, 표시 이름, 형식)
+REPORT_COLUMNS = [
+    ('회사명', '회사명', None),
+    ('티커', '티커', None),
+    ('국가', '국가', None),
+    ('섹터', '섹터', None),
+    ('최종점수', '종합점수', '{:.2f}'),
+    ('현재가', '현재가', '{:,.0f}원'),
+    ('3개월 추이', '3개월 추이', 'sparkline'),
+    ('매수가능주수', '매수 주수', '{:,.0f}'),
+    ('매수가능금액', '매수 금액', '{:,.0f}원'),
+    ('예측변동률', '30일 예측', '{:+.1f}%'),
+    ('예측가격변화', '30일 예측 변화', '{:+,.0f}원'),
+    ('PER', 'PER', '{:.1f}'),
+    ('배당률(%)', '배당률(%)', '{:.2f}'),
+    ('대체대상', '대체 대상', None),
+]
+
+
+def _json_default(value):
+    """NumPy/pandas 값을 JSON 기본 타입으로"""
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return None if np.isnan(value) else float(value)
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        return str(pd.Timestamp(value))
+    raise TypeError(f"JSON으로 저장할 수 없는 값: {type(value).__name__}")
+
+
+def _canonical(obj):
+    """키 순서를 고정한 JSON 문자열 (해시 입력)"""
+    return json.dumps(obj, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=_json_default)
+
+
+def _records(df):
+    """추천 종목 표 → 리포트 열만 담은 레코드 목록 (NaN은 None)"""
+    columns = [column for column, _, _ in REPORT_COLUMNS if column in df.columns]
+    frame = df[columns].astype(object).where(df[columns].notna(), None)
+    return json.loads(_canonical(frame.to_dict(orient='records')))
+
+
+def build_report(snapshot_key, inputs, weights, recommended, figures=None, analyses=None, news=None):
+    """추천 실행 하나를 JSON으로 저장할 수 있는 리포트 묶음으로
+
+    inputs: 월급/소비액/투자성향 등 사용자 입력과 배분 금액 (dict), weights: 요소별 가중치 (dict),
+    recommended: 추천 종목 표, figures: {제목: plotly Figure}, analyses: {티커: OpenAI 분석 dict},
+    news: {티커: 기사 링크 목록}
+    반환값 (dict): key(내용 해시 16자리), version, snapshot_key, inputs, weights, recommended, figures, analyses, news
+    """
+    bundle = {
+        'version': REPORT_VERSION,
+        'snapshot_key': snapshot_key,
+        'inputs': inputs,
+        'weights': weights,
+        'recommended': _records(recommended),
+        'figures': {title: json.loads(fig.to_json()) for title, fig in (figures or {}).items()},
+        'analyses': {
+            ticker: {'recommendation_reason': a['recommendation_reason'], 'caution_points': a['caution_points']}
+            for ticker, a in (analyses or {}).items()
+        },
+        'news': news or {},
+    }
+    bundle = json.loads(_canonical(bundle))
+    bundle['key'] = hashlib.sha256(_canonical(bundle).encode('utf-8')).hexdigest()[:16]
+    return bundle
+
+
+def _sparkline_svg(points, width=120, height=28):
+    """추세선 점 목록 → 인라인 SVG (스크립트 없이 표 안에 그림)"""
+    if not points:
+        return ''
+    values = np.asarray(points, dtype=np.float64)
+    span = values.max() - values.min()
+    x = np.linspace(1, width - 1, len(values))
+    y = height - 1 - (values - values.min()) / (span if span > 0 else 1.0) * (height - 2)
+    color = '#2ecc71' if values[-1] >= values[0] else '#e74c3c'
+    path = ' '.join(f"{a:.1f},{b:.1f}" for a, b in zip(x, y))
+    return (f'<svg width="{width}" height="{height}" viewBox="0 0 {width} {height}">'
+            f'<polyline fill="none" stroke="{color}" stroke-width="1.5" points="{path}"/></svg>')
+
+
+def _cell(value, fmt):
+    if value is None:
+        return ''
+    if fmt == 'sparkline':
+        return _sparkline_svg(value)
+    if fmt is None:
+        return html.escape(str(value))
+    return html.escape(fmt.format(value))
+
+
+def render_report_html(bundle):
+    """리포트 묶음 → 독립 HTML 문자열 (plotly.js와 데이터를 모두 포함, 외부 요청 없음)"""
+    inputs, esc = bundle['inputs'], html.escape
+    columns = [(column, label, fmt) for column, label, fmt in REPORT_COLUMNS
+               if any(column in row for row in bundle['recommended'])]
+
+    head = ''.join(f"<th>{esc(label)}</th>" for _, label, _ in columns)
+    body = ''.join(
+        '<tr>' + ''.join(f"<td>{_cell(row.get(column), fmt)}</td>" for column, _, fmt in columns) + '</tr>'
+        for row in bundle['recommended']
+    )
+    summary = ''.join(f"<li>{esc(str(name))}: {esc(f'{value:,}' if isinstance(value, (int, float)) else str(value))}</li>"
+                      for name, value in inputs.items())
+    weights = ''.join(f"<li>{esc(name)}: {value:.2%}</li>" for name, value in bundle['weights'].items())
+
+    charts, scripts = [], []
+    for i, (title, figure) in enumerate(bundle['figures'].items()):
+        charts.append(f'<h3>{esc(title)}</h3><div id="chart-{i}" class="chart"></div>')
+        scripts.append(f"Plotly.newPlot('chart-{i}', {json.dumps(figure['data'])}, "
+                       f"{json.dumps(figure.get('layout', {}))}, {{responsive: true}});")
+
+    stocks = []
+    for row in bundle['recommended']:
+        ticker = row.get('티커')
+        analysis = bundle['analyses'].get(ticker)
+        links = bundle['news'].get(ticker, [])
+        if analysis is None and not links:
+            continue
+        parts = [f"<h3>{esc(str(row.get('회사명', ticker)))} ({esc(str(ticker))})</h3>"]
+        if analysis is not None:
+            parts.append(f"<h4>💡 추천 이유</h4><p>{esc(analysis['recommendation_reason'])}</p>")
+            parts.append(f"<h4>⚠️ 주의해야 할 점</h4><p>{esc(analysis['caution_points'])}</p>")
+        if links:
+            parts.append('<h4>📰 관련 뉴스 기사</h4><ul>' + ''.join(
+                f'<li><a href="{esc(a["url"])}">{esc(a["title"])}</a> - {esc(a["source"])}</li>' for a in links
+            ) + '</ul>')
+        stocks.append('<section class="stock">' + ''.join(parts) + '</section>')
+
+    # JSON 안의 "</script>"가 스크립트 블록을 끝내지 않도록 이스케이프
+    plot_script = '\n'.join(scripts).replace('</', '<\\/')
+    return f"""<!DOCTYPE html>
+<html lang="ko">
+<head>
+<meta charset="utf-8">
+<title>포트폴리오 추천 리포트 {esc(bundle['key'])}</title>
+<style>
+body {{ font-family: -apple-system, 'Apple SD Gothic Neo', 'Malgun Gothic', sans-serif; margin: 32px; color: #222; }}
+table {{ border-collapse: collapse; font-size: 13px; }}
+th, td {{ border-bottom: 1px solid #ddd; padding: 6px 10px; text-align: right; white-space: nowrap; }}
+th {{ background: #f5f5f7; }}
+td:nth-child(-n+4), th:nth-child(-n+4) {{ text-align: left; }}
+.chart {{ width: 100%; max-width: 960px; height: 420px; }}
+.stock {{ border-top: 1px solid #eee; margin-top: 16px; }}
+.meta {{ color: #888; font-size: 12px; }}
+</style>
+<script>{get_plotlyjs()}</script>
+</head>
+<body>
+<h1>📊 포트폴리오 추천 리포트</h1>
+<p class="meta">리포트 {esc(bundle['key'])} · 스냅샷 {esc(str(bundle['snapshot_key']))} · 저장된 결과만 표시합니다 (시세/분석을 다시 조회하지 않음)</p>
+<h2>💰 입력과 자산 배분</h2><ul>{summary}</ul>
+<h2>⚖️ 요소별 가중치</h2><ul>{weights}</ul>
+<h2>📋 추천 종목</h2>
+<table><thead><tr>{head}</tr></thead><tbody>{body}</tbody></table>
+<h2>📈 차트</h2>
+{''.join(charts)}
+<h2>📝 종목별 분석과 뉴스</h2>
+{''.join(stocks)}
+<script>{plot_script}</script>
+</body>
+</html>
+"""
+
+
+def _paths(key, root):
+    return os.path.join(root, f"{key}.json"), os.path.join(root, f"{key}.html")
+
+
+def _write(path, text):
+    """임시 파일에 쓴 뒤 교체"""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def export_report(bundle, root=REPORTS_DIR):
+    """리포트 묶음을 JSON + HTML로 저장 (같은 키가 이미 있으면 다시 쓰지 않음)
+
+    반환값 (dict): key, json_path, html_path, created(이번에 새로 썼는지)
+    """
+    os.makedirs(root, exist_ok=True)
+    json_path, html_path = _paths(bundle['key'], root)
+    created = not (os.path.exists(json_path) and os.path.exists(html_path))
+    if created:
+        _write(html_path, render_report_html(bundle))
+        _write(json_path, json.dumps(bundle, ensure_ascii=False, sort_keys=True))
+    return {'key': bundle['key'], 'json_path': json_path, 'html_path': html_path, 'created': created}
+
+
+def load_report(key, root=REPORTS_DIR):
+    """저장된 리포트 묶음 읽기 (없으면 None)"""
+    json_path, _ = _paths(key, root)
+    if not os.path.exists(json_path):
+        return None
+    with open(json_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def report_bytes(key, kind='html', root=REPORTS_DIR):
+    """저장된 리포트 파일 내용 (kind: 'html' 또는 'json')"""
+    json_path, html_path = _paths(key, root)
+    with open(html_path if kind == 'html' else json_path, 'rb') as f:
+        return f.read()
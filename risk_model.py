@@ -0,0 +1,191 @@
+import numpy as np
+from sklearn.cluster import AgglomerativeClustering
+from sklearn.covariance import ledoit_wolf
+
+from forecast import fill_price_panel
+
+# 공분산 기반 포트폴리오 구성 (최소분산 / 리스크 패리티 / 평균-분산)
+# 가격 패널의 일간 로그 수익률로 Ledoit-Wolf 수축 공분산을 추정하고,
+# 후보 종목의 목표 비중을 계산합니다. 비중은 allocation.allocate_portfolio의 weight_fn으로
+# 넘겨 정수 주식 수로 반올림합니다. 같은 스냅샷에서 수익률 상관 군집도 함께 계산해
+# 섹터 라벨 대신 다양성 보너스의 기준으로 사용합니다.
+
+HORIZON_DAYS = 21  # 공분산 기간 (30일 예측과 맞춘 약 1개월 거래일)
+CLUSTER_DISTANCE = 0.5  # 상관 군집 기준 (평균 상관계수 0.5 이상이면 같은 군집)
+
+PORTFOLIO_METHODS = ('min_variance', 'risk_parity', 'mean_variance')
+
+
+def _log_returns(prices):
+    """일간 로그 수익률과 수익률 계산이 가능한 종목 마스크"""
+    filled, n_valid = fill_price_panel(prices)
+    valid = (n_valid >= 3) & np.isfinite(filled).all(axis=0)
+    returns = np.diff(np.log(np.where(valid, filled, 1.0)), axis=0)
+    return returns, valid
+
+
+def shrunk_covariance(prices, tickers, horizon_days=HORIZON_DAYS):
+    """가격 패널의 Ledoit-Wolf 수축 공분산 (horizon_days 기간 수익률 기준)
+
+    반환값 (dict): cov (종목 × 종목, 데이터 부족 종목은 NaN), tickers, shrinkage
+    """
+    returns, valid = _log_returns(prices)
+    n_tickers = len(valid)
+    cov = np.full((n_tickers, n_tickers), np.nan)
+
+    shrinkage = np.nan
+    if valid.sum() >= 2:
+        lw_cov, shrinkage = ledoit_wolf(returns[:, valid])
+        cov[np.ix_(valid, valid)] = lw_cov * horizon_days
+
+    return {
+        'cov': cov,
+        'tickers': list(tickers),
+        'ticker_index': {ticker: i for i, ticker in enumerate(tickers)},
+        'shrinkage': float(shrinkage),
+    }
+
+
+def correlation_clusters(prices, distance_threshold=CLUSTER_DISTANCE):
+    """수익률 상관 거리(1 - ρ) 기반 계층적 군집 (평균 연결)
+
+    반환값: 종목별 군집 번호 배열. 수익률이 없는 종목은 각자 별도 군집입니다.
+    """
+    returns, valid = _log_returns(prices)
+    valid &= returns.std(axis=0) > 0
+    labels = np.arange(len(valid))  # 기본값: 종목마다 별도 군집
+    if valid.sum() < 2:
+        return labels
+
+    distance = np.clip(1 - np.corrcoef(returns[:, valid], rowvar=False), 0, 2)
+    np.fill_diagonal(distance, 0)
+
+    clustering = AgglomerativeClustering(
+        n_clusters=None, metric='precomputed', linkage='average', distance_threshold=distance_threshold
+    ).fit(distance)
+    labels[valid] = clustering.labels_
+    labels[~valid] = clustering.labels_.max() + 1 + np.arange((~valid).sum())
+    return labels
+
+
+def build_risk_model(prices, tickers, horizon_days=HORIZON_DAYS):
+    """스냅샷 위험 모델: 수축 공분산 + 상관 군집 (티커 → 군집 번호 배열)"""
+    risk_model = shrunk_covariance(prices, tickers, horizon_days)
+    risk_model['clusters'] = correlation_clusters(prices)
+    return risk_model
+
+
+def cluster_labels(risk_model, tickers, fallback):
+    """종목별 분산 그룹 라벨 - 위험 모델에 있으면 상관 군집, 없으면 fallback(예: 섹터)"""
+    index, clusters = risk_model['ticker_index'], risk_model['clusters']
+    return np.array([
+        f"군집{clusters[index[t]]}" if t in index else f"섹터:{f}"
+        for t, f in zip(tickers, fallback)
+    ], dtype=object)
+
+
+def covariance_subset(risk_model, tickers):
+    """일부 종목의 공분산 행렬 (공분산이 없는 종목은 중앙값 분산, 상관 0으로 보완)"""
+    cov = risk_model['cov']
+    index = np.array([risk_model['ticker_index'].get(t, -1) for t in tickers], dtype=np.int64)
+    known = index >= 0
+    known[known] &= np.isfinite(np.diag(cov)[index[known]])
+
+    diag = np.diag(cov)
+    fallback_var = np.nanmedian(diag) if np.isfinite(diag).any() else 0.01
+    sub = np.diag(np.full(len(tickers), fallback_var))
+    if known.any():
+        sub[np.ix_(known, known)] = cov[np.ix_(index[known], index[known])]
+    return sub
+
+
+def _project_capped_simplex(values, cap):
+    """합이 1이고 0 ≤ w ≤ cap 인 집합으로의 유클리드 투영
+
+    g(τ) = Σ clip(v - τ, 0, cap)는 구간별 선형이므로 모든 꺾임점에서 g를 정렬/누적합으로
+    한 번에 계산하고 g(τ) = 1 인 τ를 선형 보간으로 찾습니다 (O(n log n)).
+    """
+    n = len(values)
+    cap = max(cap, 1.0 / n)
+    sorted_values = np.sort(values)
+    prefix = np.concatenate([[0.0], np.cumsum(sorted_values)])
+
+    taus = np.sort(np.concatenate([sorted_values, sorted_values - cap]))
+    lower = np.searchsorted(sorted_values, taus, side='right')
+    upper = np.searchsorted(sorted_values, taus + cap, side='left')
+    totals = (prefix[upper] - prefix[lower]) - (upper - lower) * taus + (n - upper) * cap
+
+    k = int(np.searchsorted(-totals, -1.0, side='left'))
+    if k == 0:
+        tau = taus[0]
+    else:
+        t0, t1, g0, g1 = taus[k - 1], taus[k], totals[k - 1], totals[k]
+        tau = t0 + (g0 - 1.0) * (t1 - t0) / (g0 - g1) if g0 != g1 else t1
+    weights = np.clip(values - tau, 0, cap)
+    return weights / weights.sum()
+
+
+def mean_variance_weights(cov, mu=None, risk_aversion=1.0, max_weight=1.0, n_iter=500, tol=1e-8):
+    """평균-분산 최적 비중: max mu'w - (risk_aversion/2) w'Σw (롱온리, 종목당 상한)
+
+    mu가 없으면 최소분산 비중. 가속 사영 경사법(FISTA)으로 풉니다.
+    """
+    n = cov.shape[0]
+    mu = np.zeros(n) if mu is None else np.nan_to_num(np.asarray(mu, dtype=np.float64))
+    lipschitz = risk_aversion * max(np.linalg.eigvalsh(cov)[-1], 1e-12)
+    step = 1.0 / lipschitz
+
+    weights = np.full(n, 1.0 / n)
+    momentum = weights.copy()
+    t = 1.0
+    for _ in range(n_iter):
+        gradient = mu - risk_aversion * (cov @ momentum)
+        updated = _project_capped_simplex(momentum + step * gradient, max_weight)
+        t_next = (1 + np.sqrt(1 + 4 * t * t)) / 2
+        momentum = updated + ((t - 1) / t_next) * (updated - weights)
+        converged = np.abs(updated - weights).max() < tol
+        weights, t = updated, t_next
+        if converged:
+            break
+    return weights
+
+
+def risk_parity_weights(cov, max_weight=1.0, n_iter=500, tol=1e-10):
+    """리스크 패리티 비중: 모든 종목의 위험 기여도(w_i · (Σw)_i)가 같도록 고정점 반복"""
+    n = cov.shape[0]
+    weights = 1.0 / np.sqrt(np.maximum(np.diag(cov), 1e-12))
+    weights /= weights.sum()
+    for _ in range(n_iter):
+        contribution = weights * (cov @ weights)
+        target = contribution.sum() / n
+        updated = weights * np.sqrt(target / np.maximum(contribution, 1e-18))
+        updated /= updated.sum()
+        if np.abs(updated - weights).max() < tol:
+            weights = updated
+            break
+        weights = updated
+    if max_weight < 1.0:
+        weights = _project_capped_simplex(weights, max_weight)
+    return weights
+
+
+def risk_aversion_from_tolerance(risk_tolerance):
+    """투자성향(0~100)을 위험회피계수로 변환 (0: 약 31.6, 100: 1.0)"""
+    return 10 ** (1.5 * (1 - np.clip(risk_tolerance, 0, 100) / 100))
+
+
+def optimize_weights(cov, method, mu=None, risk_tolerance=50, max_weight=0.2):
+    """구성 방식별 목표 비중 (min_variance / risk_parity / mean_variance)"""
+    if method == 'min_variance':
+        return mean_variance_weights(cov, None, 1.0, max_weight)
+    if method == 'risk_parity':
+        return risk_parity_weights(cov, max_weight)
+    if method == 'mean_variance':
+        return mean_variance_weights(cov, mu, risk_aversion_from_tolerance(risk_tolerance), max_weight)
+    raise ValueError(f"알 수 없는 포트폴리오 구성 방식: {method}")
+
+
+def portfolio_volatility(weights, cov):
+    """포트폴리오 변동성 (공분산 기간 기준)"""
+    weights = np.asarray(weights, dtype=np.float64)
+    return float(np.sqrt(max(weights @ cov @ weights, 0.0)))
@@ -0,0 +1,253 @@
+import ast
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# 조건식 종목 검색기
+# `PER < 15 and 배당률 > 2 and 국가 == '한국'` 같은 조건식을 ast로 파싱해 (eval 없이) 실행 계획으로
+# 바꾸고, 종목 표의 열별 인덱스로 NumPy 불리언 마스크를 만듭니다.
+# - 숫자 열: 값으로 정렬한 순서를 미리 만들어 두고 범위 조건은 searchsorted 두 번으로 해당 구간만 표시
+#   (같은 열에 대한 and 조건은 하나의 구간으로 합침)
+# - 문자열 열: 값별 행 위치 목록으로 ==, !=, in 조건을 전체 비교 없이 처리
+# 조건식 파싱 결과는 표와 무관하므로 문자열 기준으로 캐시합니다.
+
+MAX_QUERY_LENGTH = 500
+
+_COMPARE_OPS = {ast.Lt: '<', ast.LtE: '<=', ast.Gt: '>', ast.GtE: '>=', ast.Eq: '==', ast.NotEq: '!=',
+                ast.In: 'in', ast.NotIn: 'not in'}
+_FLIPPED = {'<': '>', '<=': '>=', '>': '<', '>=': '<=', '==': '==', '!=': '!='}
+
+
+def _short_name(column):
+    """'배당률(%)' → '배당률' 처럼 괄호 단위를 뗀 별칭"""
+    return re.sub(r'\(.*\)$', '', column).strip()
+
+
+def build_screen_index(df):
+    """종목 표의 검색 인덱스 생성 (숫자 열은 정렬 순서, 문자열 열은 값별 행 위치)
+
+    반환값 (dict): n_rows, numeric (열 → 정렬된 값/행 순서/원래 값), categorical (열 → 값별 행 위치),
+    aliases (괄호 단위를 뗀 별칭 → 열 이름)
+    """
+    numeric, categorical, aliases = {}, {}, {}
+    for column in df.columns:
+        values = df[column]
+        if pd.api.types.is_bool_dtype(values):
+            continue
+        if pd.api.types.is_numeric_dtype(values):
+            array = values.to_numpy(dtype=np.float64)
+            rows = np.flatnonzero(~np.isnan(array))  # NaN은 어떤 범위에도 속하지 않음
+            order = rows[np.argsort(array[rows], kind='stable')]
+            numeric[column] = {'values': array, 'sorted': array[order], 'order': order}
+        else:
+            codes, uniques = pd.factorize(values.astype(str))
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+            categorical[column] = {
+                str(value): order[bounds[i]:bounds[i + 1]] for i, value in enumerate(uniques)
+            }
+        aliases.setdefault(_short_name(str(column)), column)
+    return {'n_rows': len(df), 'numeric': numeric, 'categorical': categorical, 'aliases': aliases}
+
+
+def _literal(node):
+    """상수 (숫자/문자열, 음수 포함)만 허용 - 숫자는 float으로 변환"""
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        try:
+            return float(node.value)
+        except OverflowError:  # float 범위를 넘는 정수 리터럴
+            raise ValueError(f"숫자가 너무 큽니다: {ast.unparse(node)[:20]}...") from None
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        value = _literal(node.operand)
+        if isinstance(value, str):
+            raise ValueError("문자열 앞에는 부호를 붙일 수 없습니다")
+        return -value if isinstance(node.op, ast.USub) else value
+    raise ValueError(f"값 자리에는 숫자나 문자열만 쓸 수 있습니다: {ast.unparse(node)}")
+
+
+def _compare(left, op, right, names):
+    """비교식 하나를 실행 계획 노드로 변환 (열 이름은 names에서 복원)"""
+    if isinstance(right, ast.Name) and not isinstance(left, ast.Name):
+        if op in ('in', 'not in'):
+            raise ValueError("in 조건은 `열 in [값, ...]` 형태로 써야 합니다")
+        left, right, op = right, left, _FLIPPED[op]
+    if not isinstance(left, ast.Name):
+        raise ValueError(f"비교식에는 열 이름이 있어야 합니다: {ast.unparse(left)}")
+    column = names.get(left.id, left.id)
+
+    if isinstance(right, ast.Name):
+        if op in ('in', 'not in'):
+            raise ValueError("in 조건은 `열 in [값, ...]` 형태로 써야 합니다")
+        return ('columns', column, op, names.get(right.id, right.id))
+    if op in ('in', 'not in'):
+        if not isinstance(right, (ast.List, ast.Tuple, ast.Set)):
+            raise ValueError("in 뒤에는 [값, ...] 목록이 와야 합니다")
+        node = ('in', column, tuple(_literal(item) for item in right.elts))
+        return ('not', node) if op == 'not in' else node
+
+    value = _literal(right)
+    if op == '==':
+        return ('eq', column, value)
+    if op == '!=':
+        return ('not', ('eq', column, value))
+    if isinstance(value, str):
+        raise ValueError(f"문자열과는 ==, !=, in만 비교할 수 있습니다: {column} {op} '{value}'")
+    if op in ('<', '<='):
+        return ('range', column, -np.inf, True, float(value), op == '<=')
+    return ('range', column, float(value), op == '>=', np.inf, True)
+
+
+def _plan(node, names):
+    if isinstance(node, ast.BoolOp):
+        children = [_plan(value, names) for value in node.values]
+        return ('and' if isinstance(node.op, ast.And) else 'or', tuple(children))
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        return ('not', _plan(node.operand, names))
+    if isinstance(node, ast.Compare):
+        # a < PER < b 같은 연속 비교는 and로 풀어서 처리
+        parts, left = [], node.left
+        for op, right in zip(node.ops, node.comparators):
+            if type(op) not in _COMPARE_OPS:
+                raise ValueError("지원하지 않는 비교 연산자입니다 (<, <=, >, >=, ==, !=, in, not in)")
+            parts.append(_compare(left, _COMPARE_OPS[type(op)], right, names))
+            left = right
+        return parts[0] if len(parts) == 1 else ('and', tuple(parts))
+    raise ValueError(f"조건식으로 해석할 수 없습니다: {ast.unparse(node)}")
+
+
+def _merge_ranges(children):
+    """and 안에서 같은 열의 범위 조건을 하나의 구간으로 합침"""
+    ranges, others = {}, []
+    for child in children:
+        if child[0] != 'range':
+            others.append(child)
+            continue
+        _, column, low, low_inc, high, high_inc = child
+        if column in ranges:
+            _, _, l0, li0, h0, hi0 = ranges[column]
+            if low > l0 or (low == l0 and not low_inc):
+                l0, li0 = low, low_inc
+            if high < h0 or (high == h0 and not high_inc):
+                h0, hi0 = high, high_inc
+            ranges[column] = ('range', column, l0, li0, h0, hi0)
+        else:
+            ranges[column] = child
+    return tuple(ranges.values()) + tuple(others)
+
+
+def _optimize(plan):
+    kind = plan[0]
+    if kind in ('and', 'or'):
+        children = tuple(_optimize(child) for child in plan[1])
+        # 중첩된 같은 종류(and 안의 and)는 펼침
+        flat = []
+        for child in children:
+            flat.extend(child[1] if child[0] == kind else (child,))
+        if kind == 'and':
+            flat = _merge_ranges(flat)
+        return flat[0] if len(flat) == 1 else (kind, tuple(flat))
+    if kind == 'not':
+        return ('not', _optimize(plan[1]))
+    return plan
+
+
+@lru_cache(maxsize=256)
+def compile_query(query):
+    """조건식 문자열 → 실행 계획 (표와 무관, 문자열 기준 캐시)
+
+    열 이름에 괄호 등이 있으면 `최근수익률(%)`처럼 백틱으로 감싸거나 괄호를 뗀 별칭(최근수익률)을 씁니다.
+    잘못된 조건식이면 ValueError를 발생시킵니다.
+    """
+    if len(query) > MAX_QUERY_LENGTH:
+        raise ValueError(f"조건식은 {MAX_QUERY_LENGTH}자 이하로 입력하세요")
+    # 백틱으로 감싼 열 이름은 임시 식별자로 바꿔서 파싱
+    names = {}
+
+    def quote(match):
+        placeholder = f"_col{len(names)}"
+        names[placeholder] = match.group(1)
+        return placeholder
+
+    source = re.sub(r'`([^`]+)`', quote, query.strip())
+    try:
+        tree = ast.parse(source, mode='eval')
+    except SyntaxError:
+        raise ValueError("조건식 문법이 올바르지 않습니다")
+    return _optimize(_plan(tree.body, names))
+
+
+def _column(index, name, kind=None):
+    """열 이름(또는 별칭) 확인 - 숫자/문자열 종류가 맞지 않으면 ValueError"""
+    column = name if (name in index['numeric'] or name in index['categorical']) else index['aliases'].get(name)
+    if column is None:
+        raise ValueError(f"알 수 없는 열입니다: {name}")
+    if kind == 'numeric' and column not in index['numeric']:
+        raise ValueError(f"숫자 열이 아니라 범위 조건을 쓸 수 없습니다: {name}")
+    return column
+
+
+def _rows_mask(index, rows):
+    mask = np.zeros(index['n_rows'], dtype=bool)
+    mask[rows] = True
+    return mask
+
+
+def _evaluate(index, plan):
+    kind = plan[0]
+    if kind == 'and':
+        mask = _evaluate(index, plan[1][0])
+        for child in plan[1][1:]:
+            mask &= _evaluate(index, child)
+        return mask
+    if kind == 'or':
+        mask = _evaluate(index, plan[1][0])
+        for child in plan[1][1:]:
+            mask |= _evaluate(index, child)
+        return mask
+    if kind == 'not':
+        return ~_evaluate(index, plan[1])
+
+    if kind == 'range':
+        _, name, low, low_inc, high, high_inc = plan
+        column = index['numeric'][_column(index, name, 'numeric')]
+        start = np.searchsorted(column['sorted'], low, side='left' if low_inc else 'right')
+        stop = np.searchsorted(column['sorted'], high, side='right' if high_inc else 'left')
+        return _rows_mask(index, column['order'][start:max(start, stop)])
+    if kind in ('eq', 'in'):
+        name = plan[1]
+        values = (plan[2],) if kind == 'eq' else plan[2]
+        column = _column(index, name)
+        if column in index['numeric']:
+            mask = np.zeros(index['n_rows'], dtype=bool)
+            for value in values:
+                if isinstance(value, str):
+                    raise ValueError(f"숫자 열을 문자열과 비교할 수 없습니다: {name} == '{value}'")
+                mask |= _evaluate(index, ('range', column, float(value), True, float(value), True))
+            return mask
+        groups = index['categorical'][column]
+        rows = [groups[str(value)] for value in values if str(value) in groups]
+        return _rows_mask(index, np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64))
+    if kind == 'columns':
+        # 열끼리 비교는 인덱스로 답할 수 없어 전체 비교
+        _, left, op, right = plan
+        a = index['numeric'][_column(index, left, 'numeric')]['values']
+        b = index['numeric'][_column(index, right, 'numeric')]['values']
+        return {'<': np.less, '<=': np.less_equal, '>': np.greater, '>=': np.greater_equal,
+                '==': np.equal, '!=': np.not_equal}[op](a, b)
+    raise ValueError(f"알 수 없는 실행 계획입니다: {kind}")
+
+
+def screen(index, query):
+    """조건식에 맞는 행의 불리언 마스크 (빈 조건식이면 전체)"""
+    if not query or not query.strip():
+        return np.ones(index['n_rows'], dtype=bool)
+    return _evaluate(index, compile_query(query))
+
+
+def screenable_columns(index):
+    """조건식에 쓸 수 있는 열 이름 (숫자 열, 문자열 열)"""
+    return list(index['numeric']), list(index['categorical'])
@@ -0,0 +1,369 @@
+import argparse
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import numpy as np
+
+from engine import (SNAPSHOT_TTL, FACTOR_COLUMNS, load_snapshot, score_weights, composite_scores, top_positions,
+                    recommend_batch, batch_records)
+from risk_model import PORTFOLIO_METHODS
+
+# 로컬 JSON/HTTP 추천 서비스 (표준 라이브러리 asyncio 기반 HTTP/1.1, keep-alive 지원)
+# 대시보드와 같은 engine 스냅샷을 프로세스 안에 유지하고(만료 시 기존 스냅샷으로 응답하면서 백그라운드 갱신),
+# 같은 요청이 동시에 들어오면 계산을 한 번만 수행해 결과를 공유합니다. 서로 다른 프로필의
+# 포트폴리오 요청은 BATCH_WINDOW 동안 모아 recommend_batch 한 번으로 계산합니다.
+#
+#   GET  /universe                              종목 목록과 요소 점수
+#   GET  /score?risk_tolerance=50               투자성향별 종합점수 순위
+#   GET  /portfolio?balance=1000000&risk_tolerance=50&method=score
+#   POST /portfolio  {"profiles": [{"balance": ..., "risk_tolerance": ...}, ...], "method": "score"}
+#   GET  /forecast/{ticker}                     30일 앙상블 예측 경로
+#
+# 실행: python service.py --port 8000
+
+RESPONSE_CACHE_SIZE = 4096
+BATCH_WINDOW = 0.002  # 포트폴리오 요청을 모아 한 번의 recommend_batch로 계산하는 대기 시간 (초)
+MAX_BATCH_PROFILES = 10000
+MAX_BODY_BYTES = 2 * 1024 * 1024
+MAX_BALANCE = 1e13  # 잔액 상한 (원) - 예산 분배/정수 주식 수 계산이 int64 범위를 넘지 않도록
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class HTTPError(Exception):
+    """상태 코드와 메시지를 가진 요청 오류 (JSON {"error": ...}로 응답)"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _to_json(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'),
+                      default=lambda v: v.item() if isinstance(v, np.generic) else str(v)).encode('utf-8')
+
+
+def _number(params, name, default=None, low=None, high=None):
+    """쿼리 파라미터 숫자 변환 (범위 밖이거나 숫자가 아니면 400)"""
+    raw = params.get(name, [None])[0]
+    if raw is None:
+        if default is None:
+            raise HTTPError(400, f"'{name}' 파라미터가 필요합니다.")
+        return default
+    try:
+        value = float(raw)
+    except ValueError:
+        raise HTTPError(400, f"'{name}'은(는) 숫자여야 합니다.")
+    if not np.isfinite(value) or (low is not None and value < low) or (high is not None and value > high):
+        raise HTTPError(400, f"'{name}' 값이 허용 범위를 벗어났습니다.")
+    return value
+
+
+def _content_length(headers):
+    """Content-Length 헤더 → 본문 바이트 수 (숫자가 아니거나 음수면 400, MAX_BODY_BYTES 초과면 413)"""
+    value = headers.get('content-length', '').strip() or '0'
+    if not value.isdigit():
+        raise HTTPError(400, "Content-Length 헤더가 올바르지 않습니다.")
+    length = int(value)
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, "요청 본문이 너무 큽니다.")
+    return length
+
+
+def _method(value):
+    if value not in ('score',) + PORTFOLIO_METHODS:
+        raise HTTPError(400, f"알 수 없는 포트폴리오 구성 방식: {value}")
+    return value
+
+
+class RecommendationService:
+    """스냅샷 + 응답 캐시 + 동일 요청 병합을 관리하는 서비스 상태"""
+
+    def __init__(self, snapshot_loader=None, ttl=SNAPSHOT_TTL):
+        self.snapshot_loader = snapshot_loader or (lambda: load_snapshot(ttl=0))
+        self.ttl = ttl
+        self.snapshot = None
+        self.version = 0
+        self.loaded_at = 0.0
+        self._refresh = None
+        self._inflight = {}
+        self._pending = {}
+        self._cache = OrderedDict()
+        self.stats = {'requests': 0, 'cache_hits': 0, 'coalesced': 0, 'computed': 0, 'batches': 0}
+
+    async def get_snapshot(self):
+        """현재 스냅샷 (최초 1회는 대기, 만료 후에는 기존 스냅샷으로 응답하며 백그라운드 갱신)"""
+        if self._refresh is None and (self.snapshot is None or time.time() - self.loaded_at >= self.ttl):
+            self._refresh = asyncio.ensure_future(self._load_snapshot())
+        if self.snapshot is None:
+            await asyncio.shield(self._refresh)
+        return self.snapshot
+
+    async def _load_snapshot(self):
+        try:
+            snapshot = await asyncio.get_running_loop().run_in_executor(None, self.snapshot_loader)
+            self.snapshot, self.loaded_at = snapshot, time.time()
+            self.version += 1
+            self._cache.clear()
+        finally:
+            self._refresh = None
+
+    async def cached(self, key, compute):
+        """(스냅샷 버전, key) 단위 응답 캐시 + 진행 중인 같은 계산에 합류
+
+        compute: JSON으로 직렬화할 값을 돌려주는 함수 (스레드 풀에서 실행) 또는 응답 바이트를 돌려주는 코루틴 함수
+        """
+        key = (self.version, key)
+        body = self._cache.get(key)
+        if body is not None:
+            self._cache.move_to_end(key)
+            self.stats['cache_hits'] += 1
+            return body
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(future)
+
+        if asyncio.iscoroutinefunction(compute):
+            future = asyncio.ensure_future(compute())
+        else:
+            future = asyncio.get_running_loop().run_in_executor(None, lambda: _to_json(compute()))
+        self._inflight[key] = future
+        try:
+            body = await future
+        finally:
+            self._inflight.pop(key, None)
+        self.stats['computed'] += 1
+        self._cache[key] = body
+        if len(self._cache) > RESPONSE_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return body
+
+    async def _batched_portfolio(self, snapshot, balance, risk_tolerance, method):
+        """포트폴리오 요청을 구성 방식별로 모았다가 한 번의 recommend_batch로 계산"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault((id(snapshot), method), [])
+        if not pending:
+            loop.call_later(BATCH_WINDOW, lambda: asyncio.ensure_future(self._flush_portfolios(snapshot, method)))
+        pending.append((balance, risk_tolerance, future))
+        return await future
+
+    async def _flush_portfolios(self, snapshot, method):
+        requests = self._pending.pop((id(snapshot), method), [])
+        if not requests:
+            return
+        balances = np.array([r[0] for r in requests])
+        risk_tolerances = np.array([r[1] for r in requests])
+
+        def compute():
+            records = batch_records(snapshot, recommend_batch(snapshot, balances, risk_tolerances, method=method))
+            for record, balance, risk_tolerance in zip(records, balances, risk_tolerances):
+                record.update(balance=float(balance), risk_tolerance=float(risk_tolerance), method=method)
+            return [_to_json(record) for record in records]
+
+        self.stats['batches'] += 1
+        try:
+            bodies = await asyncio.get_running_loop().run_in_executor(None, compute)
+        except Exception as e:
+            for _, _, future in requests:
+                future.set_exception(e)
+            return
+        for body, (_, _, future) in zip(bodies, requests):
+            future.set_result(body)
+
+    # ---------- 엔드포인트 ----------
+    async def universe(self, params):
+        snapshot = await self.get_snapshot()
+
+        def compute():
+            stocks = snapshot['stocks']
+            return {
+                'count': len(stocks),
+                'feature_key': snapshot['feature_key'],
+                'stocks': [
+                    {
+                        'ticker': row['티커'], 'name': row['회사명'], 'country': row['국가'], 'sector': row['섹터'],
+                        'price': float(row['현재가']), 'group': str(snapshot['groups'][i]),
+                        'change_pct': float(snapshot['change_pct'][i]),
+                        'factors': {col: float(row[col]) for col in FACTOR_COLUMNS},
+                    }
+                    for i, row in enumerate(stocks.to_dict('records'))
+                ],
+            }
+        return await self.cached(('universe',), compute)
+
+    async def score(self, params):
+        risk_tolerance = _number(params, 'risk_tolerance', 50, 0, 100)
+        limit = int(_number(params, 'limit', 50, 1, 10000))
+        snapshot = await self.get_snapshot()
+
+        def compute():
+            scores = composite_scores(snapshot, risk_tolerance)
+            top = top_positions(scores, limit)
+            return {
+                'risk_tolerance': risk_tolerance,
+                'weights': score_weights(risk_tolerance),
+                'scores': [
+                    {'ticker': snapshot['tickers'][i], 'name': snapshot['stocks']['회사명'].iat[i],
+                     'score': float(scores[i])}
+                    for i in top
+                ],
+            }
+        return await self.cached(('score', risk_tolerance, limit), compute)
+
+    async def portfolio(self, params, body=None):
+        if body is not None:
+            try:
+                payload = json.loads(body or b'{}')
+                profiles = payload['profiles']
+                balances = np.array([float(p['balance']) for p in profiles])
+                risk_tolerances = np.array([float(p.get('risk_tolerance', 50)) for p in profiles])
+            except (ValueError, KeyError, TypeError):
+                raise HTTPError(400, "본문은 {\"profiles\": [{\"balance\": 숫자, \"risk_tolerance\": 0~100}, ...]} 형식이어야 합니다.")
+            if not 0 < len(profiles) <= MAX_BATCH_PROFILES:
+                raise HTTPError(400, f"프로필 수는 1~{MAX_BATCH_PROFILES}개여야 합니다.")
+            # GET /portfolio와 같은 범위 (NaN은 비교가 모두 False라 함께 걸러짐)
+            if not (((balances >= 0) & (balances <= MAX_BALANCE)).all()
+                    and ((risk_tolerances >= 0) & (risk_tolerances <= 100)).all()):
+                raise HTTPError(400, f"balance는 0~{MAX_BALANCE:,.0f}, risk_tolerance는 0~100이어야 합니다.")
+            method = _method(payload.get('method', 'score'))
+            snapshot = await self.get_snapshot()
+            # 배치 요청은 내용이 매번 달라 캐시하지 않음
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, lambda: _to_json({
+                'method': method,
+                'portfolios': batch_records(snapshot, recommend_batch(snapshot, balances, risk_tolerances, method=method)),
+            }))
+
+        balance = _number(params, 'balance', None, 0, MAX_BALANCE)
+        risk_tolerance = _number(params, 'risk_tolerance', 50, 0, 100)
+        method = _method(params.get('method', ['score'])[0])
+        snapshot = await self.get_snapshot()
+
+        async def compute():
+            return await self._batched_portfolio(snapshot, balance, risk_tolerance, method)
+        return await self.cached(('portfolio', balance, risk_tolerance, method), compute)
+
+    async def forecast(self, params, ticker):
+        snapshot = await self.get_snapshot()
+        forecast = snapshot['forecast']
+        col = forecast['tickers'].index(ticker) if forecast is not None and ticker in forecast['tickers'] else None
+        if col is None or not np.isfinite(forecast['change_pct'][col]):
+            raise HTTPError(404, f"'{ticker}' 종목의 예측이 없습니다.")
+
+        def compute():
+            return {
+                'ticker': ticker,
+                'dates': [d.strftime('%Y-%m-%d') for d in forecast['future_dates']],
+                'path': [float(v) for v in forecast['paths'][:, col]],
+                'change_pct': float(forecast['change_pct'][col]),
+                'model_weights': {name: float(w[col]) for name, w in forecast['weights'].items()},
+            }
+        return await self.cached(('forecast', ticker), compute)
+
+    async def dispatch(self, method, target, body):
+        """요청 경로 → (상태 코드, JSON 바이트)"""
+        self.stats['requests'] += 1
+        url = urlsplit(target)
+        params = parse_qs(url.query)
+        path = url.path.rstrip('/') or '/'
+        try:
+            if path == '/portfolio' and method == 'POST':
+                return 200, await self.portfolio(params, body)
+            if method != 'GET':
+                raise HTTPError(405, f"{method} 메서드는 지원하지 않습니다.")
+            if path == '/universe':
+                return 200, await self.universe(params)
+            if path == '/score':
+                return 200, await self.score(params)
+            if path == '/portfolio':
+                return 200, await self.portfolio(params)
+            if path.startswith('/forecast/') and path.count('/') == 2:
+                return 200, await self.forecast(params, unquote(path.split('/')[2]))
+            if path == '/health':
+                return 200, _to_json({'snapshot_version': self.version, 'stats': self.stats})
+            raise HTTPError(404, f"알 수 없는 경로: {path}")
+        except HTTPError as e:
+            return e.status, _to_json({'error': e.message})
+        except Exception as e:
+            return 500, _to_json({'error': f"{type(e).__name__}: {e}"})
+
+
+async def _handle_connection(service, reader, writer):
+    """HTTP/1.1 연결 처리 (keep-alive로 여러 요청 순차 처리)"""
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            try:
+                method, target, version = request_line.decode('latin-1').split()
+            except ValueError:
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            try:
+                length = _content_length(headers)
+            except HTTPError as e:
+                # 본문 길이를 알 수 없으므로 응답 후 연결을 닫음
+                status, body = e.status, _to_json({'error': e.message})
+                keep_alive = False
+            else:
+                payload = await reader.readexactly(length) if length else b''
+                status, body = await service.dispatch(method.upper(), target, payload if method.upper() == 'POST' else None)
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection != 'close' and (version == 'HTTP/1.1' or connection == 'keep-alive')
+
+            writer.write(
+                f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + body
+            )
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(service, host='127.0.0.1', port=8000):
+    """서비스 시작 (스냅샷을 미리 불러와 첫 요청부터 따뜻한 상태로 응답)"""
+    await service.get_snapshot()
+    return await asyncio.start_server(
+        lambda reader, writer: _handle_connection(service, reader, writer), host, port, backlog=1024
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="주린이 포트폴리오 추천 JSON/HTTP 서비스")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+
+    async def run():
+        server = await start_server(RecommendationService(), args.host, args.port)
+        print(f"추천 서비스 실행 중: http://{args.host}:{args.port}")
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import numpy as np
+from sklearn.neighbors import BallTree
+
+# 비슷한 종목 찾기 (최근접 이웃 인덱스)
+# - 요소 공간: 요소 점수(안정성, 수익률, 성장률, 밸류에이션, 배당률 ...)를 표준화한 저차원 벡터의
+#   유클리드 거리 - 스냅샷마다 BallTree를 한 번 만들어 두고 조회합니다.
+#   대체 종목은 조건(가격 상한 등)에 맞는 이웃이 멀리 있을 수 있어 거리 순 전체 순서(factor_order)에서 고릅니다.
+# - 상관 공간: 위험 모델 공분산의 해당 종목 행 하나를 표준편차로 나눠 상관계수 ρ를 구하고
+#   argpartition으로 상위 k개를 고릅니다 (조회당 O(종목 수), 인덱스 생성 비용 없음).
+#   상관 행렬 전체를 고유값 분해해 종목 수 차원의 트리를 만드는 것보다 생성/조회 모두 훨씬 빠릅니다.
+
+DEFAULT_NEIGHBORS = 5
+
+
+def build_similarity_index(tickers, factors, risk_model=None):
+    """스냅샷 종목의 최근접 이웃 인덱스 (요소 공간 BallTree + 상관 공간 조회용 공분산 참조)
+
+    tickers: 스냅샷 종목 순서의 티커, factors: (종목 × 요소) 점수 행렬
+    반환값 (dict): ticker_index, factor_tree, factor_points, corr_cov(위험 모델 공분산 참조, 없으면 None),
+    corr_std(공분산 행별 표준편차, 쓸 수 없는 행은 0), corr_row(종목 위치 → 공분산 행, 없으면 -1),
+    corr_positions(공분산 행 → 종목 위치, 스냅샷에 없으면 -1)
+    """
+    tickers = np.asarray(tickers)
+    factors = np.nan_to_num(np.asarray(factors, dtype=np.float64))
+    std = factors.std(axis=0)
+    points = (factors - factors.mean(axis=0)) / np.where(std > 0, std, 1.0)
+
+    index = {
+        'ticker_index': {ticker: i for i, ticker in enumerate(tickers)},
+        'factor_points': points,
+        'factor_tree': BallTree(points),
+        'corr_cov': None,
+        'corr_std': None,
+        'corr_row': np.full(len(tickers), -1, dtype=np.int64),
+        'corr_positions': None,
+    }
+
+    if risk_model is not None:
+        cov = risk_model['cov']
+        variance = np.diag(cov)
+        corr_std = np.sqrt(np.where(np.isfinite(variance) & (variance > 0), variance, 0.0))
+        corr_row = np.array([risk_model['ticker_index'].get(t, -1) for t in tickers], dtype=np.int64)
+        known = corr_row >= 0
+        known[known] &= corr_std[corr_row[known]] > 0
+        corr_row[~known] = -1
+        corr_positions = np.full(len(variance), -1, dtype=np.int64)
+        corr_positions[corr_row[known]] = np.flatnonzero(known)
+        index.update(corr_cov=cov, corr_std=corr_std, corr_row=corr_row, corr_positions=corr_positions)
+    return index
+
+
+def _correlation_neighbors(index, position, k):
+    """공분산 행 하나로 상관계수가 가장 높은 스냅샷 종목 k개 (위치, ρ) - 자기 자신과 공분산이 없는 종목 제외"""
+    row = index['corr_row'][position]
+    std, positions = index['corr_std'], index['corr_positions']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = index['corr_cov'][row] / (std[row] * std)
+    corr = np.where((positions >= 0) & (std > 0) & np.isfinite(corr), corr, -np.inf)
+    corr[row] = -np.inf
+    k = min(k, int(np.isfinite(corr).sum()))
+    if k == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    rows = np.argpartition(-corr, k - 1)[:k]
+    rows = rows[np.lexsort((rows, -corr[rows]))]
+    return positions[rows], np.clip(corr[rows], -1.0, 1.0)
+
+
+def nearest_stocks(index, ticker, k=DEFAULT_NEIGHBORS, space='factor'):
+    """한 종목의 최근접 이웃 (자기 자신 제외)
+
+    space: 'factor'(요소 점수 거리) 또는 'correlation'(수익률 상관)
+    반환값 (dict): positions(스냅샷 종목 위치, 가까운 순), distances(상관 공간은 √(2(1-ρ))),
+    correlation(상관 공간일 때 ρ, 아니면 None). 종목이 인덱스에 없으면 None
+    """
+    position = index['ticker_index'].get(ticker)
+    if position is None:
+        return None
+
+    if space == 'correlation':
+        if index['corr_cov'] is None or index['corr_row'][position] < 0:
+            return None
+        found, correlation = _correlation_neighbors(index, position, k)
+        return {'positions': found, 'distances': np.sqrt(2 * (1 - correlation)), 'correlation': correlation}
+
+    tree = index['factor_tree']
+    distances, rows = tree.query(index['factor_points'][position][None, :], k=min(k + 1, tree.data.shape[0]))
+    others = rows[0] != position
+    return {'positions': rows[0][others][:k], 'distances': distances[0][others][:k], 'correlation': None}
+
+
+def factor_order(index, ticker):
+    """요소 공간에서 ticker와 가까운 순서의 전체 스냅샷 종목 위치 (자기 자신 제외, 거리가 같으면 앞 위치 먼저)
+
+    대체 종목처럼 조건에 맞는 이웃이 얼마나 멀리 있을지 모를 때 사용합니다. 종목 수 × 요소 수 한 번의 계산이며,
+    같은 종목을 여러 번 조회하면 결과를 재사용하세요.
+    """
+    position = index['ticker_index'].get(ticker)
+    if position is None:
+        return np.zeros(0, dtype=np.int64)
+    points = index['factor_points']
+    distances = np.sum((points - points[position]) ** 2, axis=1)
+    order = np.lexsort((np.arange(len(points)), distances))
+    return order[order != position]
+
+
+def substitute_candidates(index, ticker, allowed, k=DEFAULT_NEIGHBORS, order=None):
+    """요소 공간에서 ticker와 가장 비슷한 allowed(스냅샷 종목 위치 마스크) 종목 위치 (가까운 순)
+
+    order: 미리 계산한 factor_order(index, ticker) - 여러 마스크로 반복 조회할 때 전달
+    """
+    if order is None:
+        order = factor_order(index, ticker)
+    return order[allowed[order]][:k]
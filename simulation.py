@@ -0,0 +1,128 @@
+import numpy as np
+
+from forecast import fill_price_panel
+
+# 적립식 투자 시뮬레이션
+# 매달 (월급 - 지출)을 예적금/투자로 나눈 계획을 N년 동안 반복했을 때의 자산 분포를 계산합니다.
+# 투자 금액은 추천 포트폴리오 비중대로 매달 매수(리밸런싱 없음)하고, 예적금은 연 이율로 월복리 적립합니다.
+# 월 수익률은 가격 패널의 실제 일간 수익률에서 한 달(21거래일) 구간을 통째로 뽑는 블록 부트스트랩으로
+# 만들기 때문에 종목 간 상관과 변동성이 그대로 유지됩니다. 다만 몇 달치 이력의 평균 수익률을
+# 수십 년 동안 복리로 반복하면 비현실적인 값이 나오므로, 평균은 장기 기대수익률로 바꿔 사용합니다.
+# 모든 계산은 (시나리오, 월, 종목) 텐서로 벡터화되어 있어 월 단위 반복문이 없습니다.
+
+DAYS_PER_MONTH = 21          # 한 달 거래일 수
+DEFAULT_DEPOSIT_RATE = 0.035  # 예적금 연 이율 (세전)
+LONG_RUN_RETURN = 0.07        # 주식 장기 기대수익률 (연, 시뮬레이션 평균으로 사용)
+DEFAULT_YEARS = 10
+DEFAULT_SCENARIOS = 2000
+FAN_PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def daily_log_returns(price_panel, tickers):
+    """포트폴리오 종목 순서의 일간 로그 수익률 (날짜 × 종목)
+
+    가격 이력이 없는 종목은 같은 날 다른 종목들의 평균 수익률(시장 평균)로 대체합니다.
+    """
+    columns = list(price_panel.columns)
+    index = np.array([columns.index(t) if t in columns else -1 for t in tickers], dtype=np.int64)
+    if len(columns) == 0:
+        return np.zeros((0, len(tickers)))
+
+    filled, n_valid = fill_price_panel(price_panel.values)
+    usable = (n_valid >= 2) & np.isfinite(filled).all(axis=0)
+    returns = np.diff(np.log(np.where(usable, filled, 1.0)), axis=0)
+    if usable.any():
+        market = returns[:, usable].mean(axis=1)
+    else:
+        market = np.zeros(returns.shape[0])
+
+    has_history = (index >= 0) & usable[np.maximum(index, 0)]
+    return np.where(has_history, returns[:, np.maximum(index, 0)], market[:, None])
+
+
+def monthly_windows(daily_returns, expected_return=LONG_RUN_RETURN):
+    """일간 로그 수익률의 모든 연속 21거래일 구간 합 (구간 × 종목) - 부트스트랩 표본
+
+    이력이 한 달보다 짧으면 일간 수익률을 √21배 해 월간 변동성으로 근사합니다.
+    expected_return이 주어지면 종목별 평균을 연 expected_return에 해당하는 월간 로그 수익률로
+    바꿉니다 (None이면 과거 평균을 그대로 사용).
+    """
+    n_days, n_assets = daily_returns.shape
+    if n_days == 0:
+        return np.zeros((1, n_assets))
+    if n_days > DAYS_PER_MONTH:
+        # 누적합 차이로 구간 합을 계산 (구간마다 21일을 더하지 않음)
+        cumulative = np.vstack([np.zeros((1, n_assets)), np.cumsum(daily_returns, axis=0)])
+        windows = cumulative[DAYS_PER_MONTH:] - cumulative[:-DAYS_PER_MONTH]
+    else:
+        windows = daily_returns * np.sqrt(DAYS_PER_MONTH)
+
+    if expected_return is not None:
+        # 로그 수익률 평균 = log(1 + 기대수익률) - σ²/2 (변동성 손실 반영)
+        drift = np.log1p(expected_return) / 12 - windows.var(axis=0) / 2
+        windows = windows - windows.mean(axis=0) + drift
+    return windows
+
+
+def bootstrap_monthly_returns(windows, n_scenarios, n_months, seed=None):
+    """월간 구간 표본에서 (시나리오, 월, 종목) 월간 로그 수익률을 복원 추출
+
+    구간을 통째로 뽑으므로 같은 달 안에서 종목 간 상관이 유지됩니다.
+    """
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(windows), size=(n_scenarios, n_months))
+    return windows[picks]
+
+
+def deposit_balance(monthly_amount, n_months, annual_rate=DEFAULT_DEPOSIT_RATE):
+    """매달 초 적립하는 예적금의 월말 잔액 (월복리)"""
+    rate = (1 + annual_rate) ** (1 / 12) - 1
+    months = np.arange(1, n_months + 1)
+    if rate == 0:
+        return monthly_amount * months.astype(np.float64)
+    return monthly_amount * (1 + rate) * ((1 + rate) ** months - 1) / rate
+
+
+def simulate_dca(monthly_returns, contributions, savings_amount=0, annual_rate=DEFAULT_DEPOSIT_RATE):
+    """적립식 투자 시뮬레이션
+
+    monthly_returns: (시나리오, 월, 종목) 월간 로그 수익률
+    contributions: 종목별 월 매수 금액 (추천 포트폴리오의 매수 금액)
+    savings_amount: 매달 예적금에 넣는 금액 (미투자 잔액 포함)
+
+    매달 초 매수한 금액이 그달 수익률만큼 변한다고 보고, 월말 평가액을
+    V_m = c · exp(L_m) · Σ_{k≤m} exp(-L_{k-1}) (L: 월 로그 수익률 누적합)로 한 번에 계산합니다.
+
+    반환값 (dict): invested (시나리오 × 월, 투자 평가액), savings (월별 예적금 잔액),
+    total (시나리오 × 월), contributed (월별 누적 납입액), percentiles (백분위 → 월별 총자산)
+    """
+    monthly_returns = np.asarray(monthly_returns, dtype=np.float64)
+    contributions = np.asarray(contributions, dtype=np.float64)
+    n_scenarios, n_months, _ = monthly_returns.shape
+
+    growth = np.cumsum(monthly_returns, axis=1)
+    previous = np.concatenate([np.zeros_like(growth[:, :1]), growth[:, :-1]], axis=1)
+    # Σ_k exp(L_m - L_{k-1}): k월에 산 금액이 m월 말까지 불어난 배수의 합
+    accumulated = np.cumsum(np.exp(-previous), axis=1) * np.exp(growth)
+    invested = accumulated @ contributions
+
+    savings = deposit_balance(savings_amount, n_months, annual_rate)
+    total = invested + savings
+    contributed = (contributions.sum() + savings_amount) * np.arange(1, n_months + 1)
+
+    return {
+        'invested': invested,
+        'savings': savings,
+        'total': total,
+        'contributed': contributed,
+        'percentiles': dict(zip(FAN_PERCENTILES, np.percentile(total, FAN_PERCENTILES, axis=0))),
+    }
+
+
+def simulate_plan(price_panel, tickers, amounts, savings_amount, years=DEFAULT_YEARS,
+                  n_scenarios=DEFAULT_SCENARIOS, annual_rate=DEFAULT_DEPOSIT_RATE,
+                  expected_return=LONG_RUN_RETURN, seed=42):
+    """가격 이력 기반 적립식 계획 시뮬레이션 (추천 포트폴리오 종목/금액 + 월 예적금 금액)"""
+    windows = monthly_windows(daily_log_returns(price_panel, tickers), expected_return)
+    monthly = bootstrap_monthly_returns(windows, n_scenarios, int(years * 12), seed=seed)
+    return simulate_dca(monthly, amounts, savings_amount, annual_rate)